@@ -0,0 +1,354 @@
+# attachments.py
+# report 的投影片 / PDF 附件。上傳時一邊收一邊寫進暫存檔、同時算 SHA-256（不會整份放進記憶體），
+# 寫完 rename 到 ATTACHMENT_DIR/ab/cd/<sha256>：同樣的內容只存一份，Attachment 列只記 sha256 + 檔名。
+# 下載走 FileResponse（Range / If-Range，ETag 就是 sha256）；server 支援 zerocopysend 時用 sendfile，
+# 或設 ATTACHMENT_ACCEL_REDIRECT 交給 nginx。縮圖第一次被要求時才產生，存在 thumbs/ 之後直接送檔。
+
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import aiofiles
+import anyio
+from fastapi import UploadFile
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from sqlmodel import Session, select
+
+from .config import settings
+from .models import Attachment, Report
+
+CHUNK_BYTES = 1024 * 1024
+# 副檔名 -> (media type, 檔頭 magic)；內容對不上副檔名的一律拒絕，避免把 HTML 當 PDF 送出去
+FILE_TYPES = {
+    ".pdf": ("application/pdf", (b"%PDF-",)),
+    ".pptx": ("application/vnd.openxmlformats-officedocument.presentationml.presentation", (b"PK\x03\x04",)),
+    ".ppt": ("application/vnd.ms-powerpoint", (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",)),
+    ".key": ("application/vnd.apple.keynote", (b"PK\x03\x04",)),
+    ".odp": ("application/vnd.oasis.opendocument.presentation", (b"PK\x03\x04",)),
+}
+# zip 格式的簡報自己帶的預覽圖（不用另外 render）
+EMBEDDED_THUMBNAILS = ("docProps/thumbnail.jpeg", "Thumbnails/thumbnail.png", "QuickLook/Thumbnail.jpg", "preview.jpg")
+IMMUTABLE = "public, max-age=31536000, immutable"
+_SINGLE_RANGE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", re.IGNORECASE)
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+# ---------------- storage ----------------
+def storage_root() -> Path:
+    return Path(settings.ATTACHMENT_DIR)
+
+
+def blob_path(sha256: str) -> Path:
+    return storage_root() / sha256[:2] / sha256[2:4] / sha256
+
+
+def file_type(filename: str) -> Tuple[str, tuple]:
+    """回傳 (media type, magic)；不支援的副檔名丟 ValueError"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in FILE_TYPES:
+        raise ValueError(f"Unsupported file type {ext or '(none)'}; allowed: {', '.join(FILE_TYPES)}")
+    return FILE_TYPES[ext]
+
+
+def clean_filename(filename: str) -> str:
+    """只留檔名本身（瀏覽器 / curl 可能帶路徑）"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if not name:
+        raise ValueError("Missing filename")
+    return name[:255]
+
+
+async def iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    """multipart 的 UploadFile（starlette 已 spool 到暫存檔）逐塊讀"""
+    while True:
+        chunk = await file.read(CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def store_stream(chunks: AsyncIterator[bytes], filename: str) -> Tuple[str, int]:
+    """
+    把 chunks 寫進 content store，回傳 (sha256, size)。
+    超過 ATTACHMENT_MAX_BYTES 丟 AttachmentTooLarge，檔頭跟副檔名不符丟 ValueError；失敗時不留下任何檔案。
+    """
+    _, magic = file_type(filename)
+    tmp_dir = storage_root() / "tmp"
+    await anyio.to_thread.run_sync(lambda: tmp_dir.mkdir(parents=True, exist_ok=True))
+    tmp = tmp_dir / uuid.uuid4().hex
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        async with aiofiles.open(tmp, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge(f"File larger than {settings.ATTACHMENT_MAX_BYTES} bytes")
+                if len(head) < 8:
+                    head += chunk[:8 - len(head)]
+                digest.update(chunk)
+                await f.write(chunk)
+            if not any(head.startswith(m) for m in magic):
+                raise ValueError(f"File content does not look like {os.path.splitext(filename)[1].lower()}")
+            await f.flush()
+            await anyio.to_thread.run_sync(os.fsync, f.fileno())
+        sha256 = digest.hexdigest()
+        await anyio.to_thread.run_sync(_publish, tmp, blob_path(sha256))
+        return sha256, size
+    finally:
+        await anyio.to_thread.run_sync(lambda: tmp.unlink(missing_ok=True))
+
+
+def _publish(tmp: Path, dest: Path):
+    """已經有同樣內容就不動（暫存檔由呼叫端刪掉）；rename 是 atomic，讀的人不會看到寫一半的檔"""
+    if dest.exists():
+        return
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, dest)
+
+
+# ---------------- db ----------------
+def attachment_item(a: Attachment) -> dict:
+    return {
+        "id": a.id,
+        "report_id": a.report_id,
+        "filename": a.filename,
+        "content_type": a.content_type,
+        "size": a.size,
+        "sha256": a.sha256,
+        "created_at": a.created_at,
+        "url": f"/attachments/{a.id}",
+        "thumbnail_url": f"/attachments/{a.id}/thumbnail",
+    }
+
+
+def check_report(session: Session, report_id: int):
+    """上傳前先確認 report 存在，免得收完整個檔案才發現；不存在時丟 LookupError"""
+    if session.get(Report, report_id) is None:
+        raise LookupError("Report not found")
+
+
+def save_attachment(session: Session, report_id: int, user_id: int, filename: str, sha256: str, size: int) -> dict:
+    """
+    同一個 report 以同樣檔名重複上傳同樣內容（例如重試）時回傳既有的那筆；
+    檔名不同時另外建一筆，指向同一份檔案，新的檔名不會被丟掉。
+    """
+    check_report(session, report_id)
+    existing = session.exec(
+        select(Attachment).where(
+            Attachment.report_id == report_id, Attachment.sha256 == sha256, Attachment.filename == filename
+        )
+    ).first()
+    if existing:
+        return attachment_item(existing)
+    a = Attachment(
+        report_id=report_id,
+        user_id=user_id,
+        sha256=sha256,
+        filename=filename,
+        content_type=file_type(filename)[0],
+        size=size,
+        created_at=datetime.utcnow(),
+    )
+    session.add(a)
+    session.commit()
+    session.refresh(a)
+    return attachment_item(a)
+
+
+def list_attachments(session: Session, report_id: int) -> List[dict]:
+    rows = session.exec(select(Attachment).where(Attachment.report_id == report_id).order_by(Attachment.id)).all()
+    return [attachment_item(a) for a in rows]
+
+
+def load_attachment(session: Session, attachment_id: int) -> dict:
+    a = session.get(Attachment, attachment_id)
+    if a is None:
+        raise LookupError("Attachment not found")
+    return attachment_item(a)
+
+
+# ---------------- download ----------------
+def single_range(http_range: str, size: int) -> Optional[Tuple[int, int]]:
+    """Range: bytes=a-b / a- / -n 換算成 [start, end)；多段、格式錯誤或超出檔案大小時回傳 None"""
+    m = _SINGLE_RANGE.match(http_range)
+    if not m or m.groups() == ("", ""):
+        return None
+    first, last = m.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= end:
+        return None
+    return start, end
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """
+    starlette 的 FileResponse（Range / If-Range / multipart byteranges），
+    server 有 http.response.zerocopysend extension 時整檔或單一 range 交給 sendfile，不經過 Python 的 buffer。
+    只覆寫公開的 __call__；HEAD、multipart range、錯誤的 Range（400 / 416）都交回 FileResponse 處理。
+    """
+
+    chunk_size = CHUNK_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"].upper() == "HEAD" or "http.response.zerocopysend" not in scope.get("extensions", {}):
+            return await super().__call__(scope, receive, send)
+        if self.stat_result is None:
+            self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            self.set_stat_headers(self.stat_result)
+        size = self.stat_result.st_size
+
+        headers = Headers(scope=scope)
+        http_range, if_range = headers.get("range"), headers.get("if-range")
+        if http_range is None or (if_range is not None and if_range not in (self.headers["etag"], self.headers["last-modified"])):
+            status, offset, count = self.status_code, 0, None
+        else:
+            span = single_range(http_range, size)
+            if span is None:
+                return await super().__call__(scope, receive, send)
+            start, end = span
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            self.headers["content-length"] = str(end - start)
+            status, offset, count = 206, start, end - start
+
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        await self._sendfile(send, offset, count)
+        if self.background is not None:
+            await self.background()
+
+    async def _sendfile(self, send, offset: int, count: Optional[int]):
+        f = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            message = {"type": "http.response.zerocopysend", "file": f, "offset": offset, "more_body": False}
+            if count is not None:
+                message["count"] = count
+            await send(message)
+        finally:
+            f.close()
+
+
+def _file_headers(etag: str, cache_control: str) -> Dict[str, str]:
+    return {"ETag": f'"{etag}"', "Cache-Control": cache_control, "X-Content-Type-Options": "nosniff"}
+
+
+def content_disposition(disposition: str, filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def attachment_response(item: dict, download: bool = False) -> Response:
+    """PDF 預設在瀏覽器裡開（inline），其他格式與 ?download=1 一律下載"""
+    disposition = "attachment" if download or item["content_type"] != "application/pdf" else "inline"
+    headers = _file_headers(item["sha256"], IMMUTABLE)
+    if settings.ATTACHMENT_ACCEL_REDIRECT:
+        # nginx 的 internal location 直接送檔（sendfile、Range 都由 nginx 處理）
+        rel = blob_path(item["sha256"]).relative_to(storage_root()).as_posix()
+        headers["Content-Disposition"] = content_disposition(disposition, item["filename"])
+        headers["X-Accel-Redirect"] = f"{settings.ATTACHMENT_ACCEL_REDIRECT.rstrip('/')}/{rel}"
+        return Response(media_type=item["content_type"], headers=headers)
+    return ZeroCopyFileResponse(blob_path(item["sha256"]), media_type=item["content_type"], filename=item["filename"],
+                                content_disposition_type=disposition, headers=headers)
+
+
+# ---------------- thumbnails ----------------
+def _thumb_base(sha256: str) -> Path:
+    return storage_root() / "thumbs" / sha256[:2] / sha256
+
+
+def cached_thumbnail(sha256: str) -> Optional[Tuple[Path, str]]:
+    """(path, media type)；產生過但沒有縮圖時回傳 (None, "")"""
+    base = _thumb_base(sha256)
+    for ext, media_type in ((".png", "image/png"), (".jpg", "image/jpeg")):
+        path = base.with_suffix(ext)
+        if path.exists():
+            return path, media_type
+    if base.with_suffix(".none").exists():
+        return None, ""
+    return None
+
+
+def _atomic_write(dest: Path, data: bytes):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f"{dest.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dest)
+
+
+def render_thumbnail(sha256: str, content_type: str) -> Tuple[Optional[Path], str]:
+    """
+    在 worker thread 裡跑：PDF 用 pdftoppm 轉第一頁，zip 格式的簡報取出自帶的預覽圖。
+    做不出來（沒有 pdftoppm、檔案沒有預覽圖、轉檔失敗）時寫一個 .none，下次不再重試。
+    """
+    src, base = blob_path(sha256), _thumb_base(sha256)
+    base.parent.mkdir(parents=True, exist_ok=True)
+    if content_type == "application/pdf" and shutil.which("pdftoppm"):
+        out = base.with_name(f"{sha256}.{uuid.uuid4().hex}")
+        try:
+            subprocess.run(
+                ["pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile",
+                 "-scale-to", str(settings.ATTACHMENT_THUMBNAIL_WIDTH), str(src), str(out)],
+                check=True, capture_output=True, timeout=settings.ATTACHMENT_THUMBNAIL_TIMEOUT,
+            )
+            os.replace(out.with_suffix(".png"), base.with_suffix(".png"))
+            return base.with_suffix(".png"), "image/png"
+        except (OSError, subprocess.SubprocessError):
+            out.with_suffix(".png").unlink(missing_ok=True)
+    elif zipfile.is_zipfile(src):
+        try:
+            with zipfile.ZipFile(src) as z:
+                names = set(z.namelist())
+                for name in EMBEDDED_THUMBNAILS:
+                    if name in names:
+                        ext = ".png" if name.endswith(".png") else ".jpg"
+                        _atomic_write(base.with_suffix(ext), z.read(name))
+                        return base.with_suffix(ext), "image/png" if ext == ".png" else "image/jpeg"
+        except (OSError, zipfile.BadZipFile):
+            pass
+    _atomic_write(base.with_suffix(".none"), b"")
+    return None, ""
+
+
+# 同一個檔案同時有好幾個 request 要縮圖時只產生一次（event loop 上的 single-flight）
+_rendering: Dict[str, asyncio.Future] = {}
+
+
+async def thumbnail_file(item: dict) -> Tuple[Optional[Path], str]:
+    found = await run_in_threadpool(cached_thumbnail, item["sha256"])
+    if found is not None:
+        return found
+    sha256 = item["sha256"]
+    pending = _rendering.get(sha256)
+    if pending is None:
+        pending = _rendering[sha256] = asyncio.ensure_future(
+            run_in_threadpool(render_thumbnail, sha256, item["content_type"])
+        )
+        pending.add_done_callback(lambda _: _rendering.pop(sha256, None))
+    return await asyncio.shield(pending)
+
+
+async def thumbnail_response(item: dict) -> Optional[Response]:
+    path, media_type = await thumbnail_file(item)
+    if path is None:
+        return None
+    return FileResponse(path, media_type=media_type, headers=_file_headers(f"{item['sha256']}-thumb", IMMUTABLE))
@@ -0,0 +1,497 @@
+# bulk_import.py
+# 大量匯入歷史資料：BibTeX / CSV / JSONL 逐列串流解析，分 batch 用 multi-row INSERT 寫入
+
+import csv
+import json
+import re
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from .graph import graph_after_commit
+from .page_cache import bump_generation
+from .ingest import (
+    bump_counters,
+    clean_names,
+    insert_links,
+    report_counters,
+    resolve_names,
+    split_names,
+    update_tag_stats,
+)
+from .models import (
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    LabMeeting,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+    User,
+)
+
+DEFAULT_BATCH_SIZE = 1000
+
+FORMATS = ("bibtex", "csv", "jsonl")
+
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(filename: str) -> str:
+    ext = filename.rsplit(".", 1)[-1].lower()
+    if ext in ("bib", "bibtex"):
+        return "bibtex"
+    if ext == "csv":
+        return "csv"
+    if ext in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    raise ValueError(f"cannot detect import format from {filename!r}")
+
+
+# ---------------- streaming parsers ----------------
+# 每個 parser 都逐列讀檔，yield (位置, dict 或 RowError)，不會把整個檔案讀進記憶體
+
+def iter_jsonl(fp) -> Iterator[Tuple[str, object]]:
+    for lineno, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield f"line {lineno}", RowError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield f"line {lineno}", RowError("each line must be a JSON object")
+            continue
+        yield f"line {lineno}", record
+
+
+def iter_csv(fp) -> Iterator[Tuple[str, object]]:
+    reader = csv.DictReader(fp)
+    for record in reader:
+        yield f"line {reader.line_num}", record
+
+
+def iter_bibtex(fp) -> Iterator[Tuple[str, object]]:
+    """
+    以大括號深度切出每個 @entry{...}；@string / @comment / @preamble 略過。
+    BibTeX 沒有標準的作者單位欄位，只讀 title、year、month、journal/booktitle、author、keywords。
+    """
+    buf: List[str] = []
+    depth = 0
+    start = 0
+    for lineno, line in enumerate(fp, start=1):
+        if not buf:
+            at = line.find("@")
+            if at < 0:
+                continue
+            line = line[at:]
+            start = lineno
+        buf.append(line)
+        depth += line.count("{") - line.count("}")
+        if depth > 0 or "{" not in "".join(buf):
+            continue
+        entry = "".join(buf)
+        buf, depth = [], 0
+        try:
+            record = parse_bibtex_entry(entry)
+        except RowError as e:
+            yield f"line {start}", e
+            continue
+        if record is not None:
+            yield f"line {start}", record
+    if buf:
+        yield f"line {start}", RowError("unterminated BibTeX entry")
+
+
+_ENTRY_RE = re.compile(r"@\s*(\w+)\s*\{\s*([^,\s]*)\s*,", re.S)
+_FIELD_RE = re.compile(r"\s*([\w-]+)\s*=\s*", re.S)
+
+
+def parse_bibtex_entry(entry: str) -> Optional[dict]:
+    m = _ENTRY_RE.match(entry)
+    if not m:
+        if re.match(r"@\s*(string|comment|preamble)\b", entry, re.I):
+            return None
+        raise RowError("malformed BibTeX entry header")
+    if m.group(1).lower() in ("string", "comment", "preamble"):
+        return None
+
+    fields: Dict[str, str] = {}
+    pos = m.end()
+    while True:
+        fm = _FIELD_RE.match(entry, pos)
+        if not fm:
+            break
+        name, pos = fm.group(1).lower(), fm.end()
+        value, pos = _read_bibtex_value(entry, pos)
+        fields[name] = re.sub(r"\s+", " ", value.replace("{", "").replace("}", "")).strip()
+        pos = entry.find(",", pos)
+        if pos < 0:
+            break
+        pos += 1
+
+    authors = []
+    for name in re.split(r"\s+and\s+", fields.get("author", "")):
+        if "," in name:
+            last, first = [x.strip() for x in name.split(",", 1)]
+            name = f"{first} {last}"
+        if name.strip():
+            authors.append(name.strip())
+    return {
+        "paper_title": fields.get("title"),
+        "published_year": fields.get("year"),
+        "published_month": fields.get("month"),
+        "journal_or_conference": fields.get("journal") or fields.get("booktitle") or "",
+        "authors": authors,
+        "tags": fields.get("keywords", ""),
+    }
+
+
+def _read_bibtex_value(entry: str, pos: int) -> Tuple[str, int]:
+    if pos >= len(entry):
+        raise RowError("missing field value")
+    opener = entry[pos]
+    if opener in "{\"":
+        closer = "}" if opener == "{" else "\""
+        depth, i = 0, pos + 1
+        while i < len(entry):
+            ch = entry[i]
+            if ch == "{":
+                depth += 1
+            elif ch == "}" and depth > 0:
+                depth -= 1
+            elif ch == closer and depth == 0:
+                return entry[pos + 1:i], i + 1
+            i += 1
+        raise RowError("unbalanced field value")
+    m = re.match(r"[^,}]*", entry[pos:])
+    return m.group(0).strip(), pos + m.end()
+
+
+PARSERS = {"bibtex": iter_bibtex, "csv": iter_csv, "jsonl": iter_jsonl}
+
+
+# ---------------- normalize ----------------
+def _first(raw: dict, *keys):
+    for key in keys:
+        if raw.get(key) not in (None, ""):
+            return raw[key]
+    return None
+
+
+def _to_int(value, field: str, default: int = 0) -> int:
+    if value in (None, ""):
+        return default
+    if isinstance(value, str) and value.strip().lower()[:3] in _MONTHS:
+        return _MONTHS[value.strip().lower()[:3]]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be an integer, got {value!r}")
+
+
+def _to_datetime(value, field: str) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise RowError(f"{field} must be an ISO date, got {value!r}")
+
+
+def parse_authors(value) -> List[dict]:
+    """
+    JSONL: ["Alice", {"name": "Bob", "affiliations": ["CMU"]}]
+    CSV:   "Alice [MIT, Stanford]; Bob"
+    名字只有空白的 author 略過，空白的 affiliation 也一樣。
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        authors = []
+        for part in value.split(";"):
+            m = re.match(r"\s*([^\[]+?)\s*(?:\[(.*)\])?\s*$", part)
+            if m and m.group(1).strip():
+                authors.append({"name": m.group(1).strip(), "affiliations": split_names(m.group(2))})
+        return authors
+    if not isinstance(value, list):
+        raise RowError(f"authors must be a list or a string, got {value!r}")
+    authors = []
+    for a in value:
+        if isinstance(a, str):
+            if a.strip():
+                authors.append({"name": a.strip(), "affiliations": []})
+        elif isinstance(a, dict) and a.get("name") is not None:
+            affs = a.get("affiliations") or []
+            if not isinstance(affs, (str, list)):
+                raise RowError(f"invalid affiliations for author {a['name']!r}: {affs!r}")
+            name = str(a["name"]).strip()
+            if name:
+                authors.append({
+                    "name": name,
+                    "affiliations": split_names(affs) if isinstance(affs, str) else clean_names(affs),
+                })
+        else:
+            raise RowError(f"invalid author entry: {a!r}")
+    return authors
+
+
+def normalize_record(raw: dict) -> dict:
+    """把各格式的欄位名稱統一成 paper / authors / tags / report"""
+    title = _first(raw, "paper_title", "title")
+    if not title:
+        raise RowError("paper_title is required")
+    tags = _first(raw, "tags", "keywords") or []
+    if not isinstance(tags, (str, list)):
+        raise RowError(f"tags must be a list or a string, got {tags!r}")
+    record = {
+        "paper": {
+            "paper_title": str(title).strip(),
+            "published_year": _to_int(_first(raw, "published_year", "year"), "published_year"),
+            "published_month": _to_int(_first(raw, "published_month", "month"), "published_month"),
+            "journal_or_conference": str(_first(raw, "journal_or_conference", "venue", "journal", "booktitle") or ""),
+        },
+        "authors": parse_authors(raw.get("authors")),
+        "tags": split_names(tags) if isinstance(tags, str) else clean_names(tags),
+        "report": None,
+    }
+
+    report_title = raw.get("report_title")
+    if report_title:
+        presenter = raw.get("presenter")
+        meeting_title = raw.get("meeting_title")
+        if not presenter or not meeting_title:
+            raise RowError("reports need presenter and meeting_title")
+        created_at = _to_datetime(raw.get("created_at"), "created_at")
+        meeting_date = _to_datetime(raw.get("meeting_date"), "meeting_date")
+        meeting_date = meeting_date.date() if meeting_date else (created_at.date() if created_at else None)
+        if not meeting_date:
+            raise RowError("reports need meeting_date or created_at")
+        record["report"] = {
+            "report_title": str(report_title),
+            "report_summary": str(raw.get("report_summary") or ""),
+            "slides_link": str(raw.get("slides_link") or ""),
+            "presenter": str(presenter).strip(),
+            "created_at": created_at,
+            "meeting": (str(meeting_title).strip(), meeting_date, str(raw.get("meeting_location") or "")),
+        }
+    return record
+
+
+# ---------------- batched writer ----------------
+class BulkImporter:
+    """
+    正規化後的 record 分批寫入：每批每種 entity 一次 lookup + 一個 multi-row insert，
+    link 也是 multi-row insert，最後 commit 一次。整批失敗時逐列重試，只有壞掉的那幾列被 reject。
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        on_reject: Optional[Callable[[str, str, object], None]] = None,
+        progress: Optional[Callable[[dict], None]] = None,
+    ):
+        self.session = session
+        self.batch_size = max(batch_size, 1)
+        self.on_reject = on_reject
+        self.progress = progress
+        self.stats = {"read": 0, "papers": 0, "reports": 0, "rejected": 0, "elapsed": 0.0}
+        self._started = time.monotonic()
+
+    def run(self, rows: Iterable[Tuple[str, object]]) -> dict:
+        batch: List[Tuple[str, object, dict]] = []
+        for ref, raw in self._read(rows):
+            self.stats["read"] += 1
+            if isinstance(raw, RowError):
+                self._reject(ref, str(raw), None)
+                continue
+            try:
+                batch.append((ref, raw, normalize_record(raw)))
+            except RowError as e:
+                self._reject(ref, str(e), raw)
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        self.stats["elapsed"] = round(time.monotonic() - self._started, 3)
+        return self.stats
+
+    def _read(self, rows: Iterable[Tuple[str, object]]) -> Iterator[Tuple[str, object]]:
+        """
+        文字模式的 fp 中途出現非 UTF-8 的 bytes 時 parser 沒辦法繼續：記一筆 reject 後停止讀取，
+        已經讀到的 row 照常寫入（binary fp 經過 decode_lines，只會 reject 那一列）。
+        """
+        ref = "start of file"
+        rows = iter(rows)
+        while True:
+            try:
+                ref, raw = next(rows)
+            except StopIteration:
+                return
+            except UnicodeDecodeError as e:
+                self._reject(f"after {ref}", f"file is not valid UTF-8 ({e.reason}); the rest of the file was not read", None)
+                return
+            yield ref, raw
+
+    def _reject(self, ref: str, error: str, raw):
+        self.stats["rejected"] += 1
+        if self.on_reject:
+            self.on_reject(ref, error, raw)
+
+    def _flush(self, batch):
+        try:
+            papers, reports = self._write(batch)
+            self.session.commit()
+        except (SQLAlchemyError, LookupError, ValueError, TypeError) as e:
+            # DB 錯誤以外（資料本身的問題）也一樣逐列重試，只 reject 壞掉的那一列，不讓整個匯入中斷
+            self.session.rollback()
+            if len(batch) == 1:
+                ref, raw, _ = batch[0]
+                if isinstance(e, SQLAlchemyError):
+                    error = str(e.orig if getattr(e, "orig", None) else e)
+                else:
+                    error = f"{type(e).__name__}: {e}"
+                self._reject(ref, error, raw)
+                return
+            for item in batch:
+                self._flush([item])
+            return
+        self.stats["papers"] += papers
+        self.stats["reports"] += reports
+        self.stats["elapsed"] = round(time.monotonic() - self._started, 3)
+        if self.progress:
+            self.progress(dict(self.stats))
+
+    def _write(self, batch) -> Tuple[int, int]:
+        s = self.session
+        records = [rec for _, _, rec in batch]
+
+        author_ids = resolve_names(s, Author, (a["name"] for r in records for a in r["authors"]))
+        aff_ids = resolve_names(s, Affiliation, (x for r in records for a in r["authors"] for x in a["affiliations"]))
+        tag_ids = resolve_names(s, Tag, (t for r in records for t in r["tags"]))
+
+        # paper 以 (title, year) 去重，重複匯入同一份檔案不會產生重複 paper
+        def key(p):
+            return p["paper_title"], p["published_year"]
+
+        paper_ids: Dict[Tuple[str, int], int] = {}
+        titles = list({r["paper"]["paper_title"] for r in records})
+        for pid, title, year in s.exec(
+            select(Paper.id, Paper.paper_title, Paper.published_year).where(Paper.paper_title.in_(titles))
+        ).all():
+            paper_ids.setdefault((title, year), pid)
+        new_papers = list({key(r["paper"]): r["paper"] for r in records if key(r["paper"]) not in paper_ids}.values())
+        if new_papers:
+            new_ids = s.scalars(insert(Paper).returning(Paper.id, sort_by_parameter_order=True), new_papers).all()
+            paper_ids.update({key(p): pid for p, pid in zip(new_papers, new_ids)})
+
+        author_aff, paper_author, paper_tag = [], [], []
+        for r in records:
+            pid = paper_ids[key(r["paper"])]
+            for a in r["authors"]:
+                paper_author.append({"paper_id": pid, "author_id": author_ids[a["name"]]})
+                author_aff.extend({"author_id": author_ids[a["name"]], "affiliation_id": aff_ids[x]} for x in a["affiliations"])
+            paper_tag.extend({"paper_id": pid, "tag_id": tag_ids[t]} for t in r["tags"])
+        insert_links(s, AuthorAffiliationLink, author_aff)
+        insert_links(s, PaperAuthorLink, paper_author)
+        graph_after_commit(s, paper_author, author_aff)
+        new_tag_links = insert_links(s, PaperTag, paper_tag, returning=True)
+
+        report_records = [r for r in records if r["report"]]
+        if report_records:
+            self._write_reports(report_records, paper_ids, key)
+        update_tag_stats(
+            s,
+            ((link["paper_id"], link["tag_id"]) for link in new_tag_links),
+            (paper_ids[key(r["paper"])] for r in report_records),
+        )
+        # 既有 paper 可能多了 tag / author：所有 report 頁面跟著這個 batch 一起換版本
+        bump_generation(s)
+        return len(new_papers), len(report_records)
+
+    def _write_reports(self, records, paper_ids, key):
+        s = self.session
+        user_ids = resolve_names(
+            s, User, (r["report"]["presenter"] for r in records),
+            column=User.username,
+            make_row=lambda n: {"username": n, "display_name": n, "created_at": datetime.utcnow()},
+        )
+
+        wanted = {r["report"]["meeting"] for r in records}
+        meeting_ids: Dict[Tuple[str, date, str], int] = {}
+        for mid, title, mdate in s.exec(
+            select(LabMeeting.id, LabMeeting.meeting_title, LabMeeting.meeting_date)
+            .where(LabMeeting.meeting_title.in_({title for title, _, _ in wanted}))
+        ).all():
+            for w in wanted:
+                if w[0] == title and w[1] == mdate:
+                    meeting_ids.setdefault(w, mid)
+        new_meetings = [w for w in wanted if w not in meeting_ids]
+        if new_meetings:
+            new_ids = s.scalars(
+                insert(LabMeeting).returning(LabMeeting.id, sort_by_parameter_order=True),
+                [{"meeting_title": t, "meeting_date": d, "meeting_location": loc} for t, d, loc in new_meetings],
+            ).all()
+            meeting_ids.update(zip(new_meetings, new_ids))
+
+        rows = []
+        for r in records:
+            rep = r["report"]
+            rows.append({
+                "report_title": rep["report_title"],
+                "report_summary": rep["report_summary"],
+                "slides_link": rep["slides_link"],
+                "user_id": user_ids[rep["presenter"]],
+                "meeting_id": meeting_ids[rep["meeting"]],
+                "paper_id": paper_ids[key(r["paper"])],
+                "created_at": rep["created_at"] or datetime.utcnow(),
+            })
+        s.execute(insert(Report), rows)
+
+        deltas: Counter = Counter()
+        for r, row in zip(records, rows):
+            deltas.update(report_counters(
+                row["user_id"], row["meeting_id"], row["paper_id"], row["created_at"],
+                r["paper"]["published_year"], r["paper"]["journal_or_conference"],
+            ))
+        bump_counters(s, deltas)
+
+
+def decode_lines(fp, on_error: Callable[[str, str], None]) -> Iterator[str]:
+    """
+    binary file object -> 逐列 decode 的 str。不是 UTF-8 的那一列交給 on_error 記成 reject，
+    換成空行（行號不變），後面的 row 照常讀。
+    """
+    for lineno, line in enumerate(fp, start=1):
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError as e:
+            on_error(f"line {lineno}", f"not valid UTF-8 ({e.reason})")
+            yield "\n"
+
+
+def import_stream(session: Session, fp, fmt: str, **kwargs) -> dict:
+    """fp 為 binary（建議，壞掉的 bytes 只影響那一列）或文字模式的 file object；kwargs 交給 BulkImporter"""
+    if fmt not in PARSERS:
+        raise ValueError(f"unknown import format: {fmt}")
+    importer = BulkImporter(session, **kwargs)
+    if isinstance(fp.read(0), bytes):
+        fp = decode_lines(fp, lambda ref, error: importer._reject(ref, error, None))
+    return importer.run(PARSERS[fmt](fp))
@@ -0,0 +1,172 @@
+# cache.py
+# process 內的 reference data cache：username -> user snapshot、name -> id（Tag / Author / Affiliation）
+# 這些資料幾乎只增不改，page view 與 upload 的熱路徑不必每次都打 DB。
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from .config import settings
+from .models import Affiliation, Author, Tag, User
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    有上限的 LRU，每個 entry 各自有 TTL。thread-safe：sync routes 與 bulk import 都在 threadpool 裡共用同一個 instance。
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, weigher: Optional[Callable[[Any], int]] = None, maxweight: Optional[int] = None):
+        """weigher(value) -> 估計大小（例如 bytes）；有 maxweight 時總重量超過就從最舊的開始淘汰"""
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigher = weigher
+        self.maxweight = maxweight
+        self.weight = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[1] < now:
+                if entry is not _MISSING:
+                    self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        weight = self.weigher(value) if self.weigher else 0
+        if self.maxweight is not None and weight > self.maxweight:
+            return  # 單筆就超過上限，不 cache
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, time.monotonic() + self.ttl, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                _, (_, _, w) = self._data.popitem(last=False)
+                self.weight -= w
+                self.evictions += 1
+
+    def _pop(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._pop(key)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        """刪掉所有 predicate(key) 為真的 entry（例如同一份 report 各個 user 的版本）"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "weight": self.weight,
+                "maxweight": self.maxweight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+# ---------------- caches ----------------
+user_cache = LRUCache("user", settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+name_caches = {
+    Tag: LRUCache("tag", settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS),
+    Author: LRUCache("author", settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS),
+    Affiliation: LRUCache("affiliation", settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS),
+}
+
+
+def name_cache_for(model) -> Optional[LRUCache]:
+    return name_caches.get(model)
+
+
+def user_snapshot(user: User) -> dict:
+    """
+    Cache 的是 plain dict 而不是 ORM instance：不綁 session，不會 lazy load，
+    templates 的 current_user.username / .display_name 照樣可用。
+    """
+    return {"id": user.id, "username": user.username, "display_name": user.display_name}
+
+
+def get_cached_user(session: Session, username: Optional[str]) -> Optional[dict]:
+    if not username:
+        return None
+    user = user_cache.get(username)
+    if user is None:
+        row = session.exec(select(User).where(User.username == username)).first()
+        if row is None:
+            return None  # 不存在的 username 不 cache，註冊 / 自動建立後馬上就查得到
+        user = user_snapshot(row)
+        user_cache.set(username, user)
+    return user
+
+
+# ---------------- write-side: populate after commit ----------------
+# 同一個 transaction 剛 INSERT 的 id 要等 commit 成功才放進 cache，rollback 就丟掉，
+# 否則 cache 會指向不存在的 row。
+_PENDING_KEY = "cache_pending"
+
+
+def cache_after_commit(session: Session, cache: LRUCache, key: Hashable, value: Any):
+    session.info.setdefault(_PENDING_KEY, []).append((cache, key, value))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    for cache, key, value in session.info.pop(_PENDING_KEY, ()):
+        cache.set(key, value)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def invalidate_user(username: str):
+    user_cache.invalidate(username)
+
+
+def invalidate_name(model, name: Optional[str] = None):
+    """name=None 清掉該 model 的整個 cache（例如手動合併重複 row 之後）"""
+    cache = name_cache_for(model)
+    if cache is None:
+        return
+    if name is None:
+        cache.clear()
+    else:
+        cache.invalidate(name)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {c.name: c.stats() for c in (user_cache, *name_caches.values())}
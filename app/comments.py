@@ -0,0 +1,234 @@
+# comments.py
+# report 的 comment thread：依 (created_at, id) 舊到新做 keyset 分頁，
+# 再加上 per-report 的 SSE stream。create_comment commit 後 publish 到 process 內的 broadcaster，
+# 每個 client 一個有上限的 queue；跟不上的 client 直接斷線，重連時用 Last-Event-ID 從 DB 補。
+# 其他 worker 收到的 comment 在閒置 ping 時查 DB 補上。
+# created_at 的順序不等於 commit 的順序，所以 replay 會往前多看一段，stream 裡以 comment id 去重。
+
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Hashable, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, or_
+from sqlmodel import Session, select
+
+from .config import settings
+from .db import run_in_session
+from .feed import decode_cursor, make_cursor
+from .models import Comment, Report, User
+
+MAX_COMMENT_PAGE_SIZE = 200
+RETRY_MS = 2000  # EventSource 斷線後多久重連
+
+
+# ---------------- pages ----------------
+def clamp_comment_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return settings.COMMENT_PAGE_SIZE
+    return min(limit, MAX_COMMENT_PAGE_SIZE)
+
+
+def comment_item(c: Comment, user: Optional[dict]) -> dict:
+    """API / SSE / template 共用的格式；user 是 {"id", "display_name", ...}，cursor 指向這一則（之後的從這裡接）"""
+    return {
+        "id": c.id,
+        "report_id": c.report_id,
+        "content": c.content,
+        "created_at": c.created_at,
+        "user": {"id": user["id"], "display_name": user["display_name"]} if user else None,
+        "cursor": make_cursor(c.created_at, c.id),
+    }
+
+
+def start_cursor(report: Report) -> str:
+    """比任何 comment 都早的 cursor：還沒有 comment 的 report，stream 從這裡開始"""
+    return make_cursor(report.created_at, 0)
+
+
+def load_comment_page(session: Session, report_id: int, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """回傳 (items, next_cursor)，舊到新；cursor 格式錯誤時丟 ValueError"""
+    limit = clamp_comment_limit(limit)
+    stmt = select(Comment, User).outerjoin(User, User.id == Comment.user_id).where(Comment.report_id == report_id)
+    if cursor:
+        created_at, comment_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            Comment.created_at > created_at,
+            and_(Comment.created_at == created_at, Comment.id > comment_id),
+        ))
+    rows = session.exec(stmt.order_by(Comment.created_at, Comment.id).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [comment_item(c, {"id": u.id, "display_name": u.display_name} if u else None) for c, u in rows]
+    return items, items[-1]["cursor"] if has_more else None
+
+
+def load_stream_start(session: Session, report_id: int) -> Optional[str]:
+    """沒帶 cursor 的 stream 從 report 的第一則開始；report 不存在時回傳 None"""
+    r = session.get(Report, report_id)
+    return start_cursor(r) if r else None
+
+
+def load_report_comments(session: Session, report_id: int, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """JSON API：report 不存在時丟 LookupError"""
+    if session.get(Report, report_id) is None:
+        raise LookupError("Report not found")
+    return load_comment_page(session, report_id, cursor, limit)
+
+
+# ---------------- broadcaster ----------------
+class Subscription:
+    def __init__(self, topic: Hashable, queue_size: int):
+        self.topic = topic
+        # (sort key, encoded event)；None 代表被斷線
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+
+class Broadcaster:
+    """
+    topic -> subscribers，全部在 event loop 上操作（不是 thread-safe）。
+    publish 不等待：某個 client 的 queue 滿了就把它斷掉，慢的 client 不會拖住別人，記憶體也有上限。
+    """
+
+    def __init__(self, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.topics: Dict[Hashable, Set[Subscription]] = defaultdict(set)
+        self.n_subscribers = 0
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: Hashable) -> Optional[Subscription]:
+        """超過 max_subscribers 時回傳 None"""
+        if self.n_subscribers >= self.max_subscribers:
+            return None
+        sub = Subscription(topic, self.queue_size)
+        self.topics[topic].add(sub)
+        self.n_subscribers += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self.topics.get(sub.topic)
+        if subs is None or sub not in subs:
+            return
+        subs.discard(sub)
+        self.n_subscribers -= 1
+        if not subs:
+            del self.topics[sub.topic]
+
+    def publish(self, topic: Hashable, message) -> int:
+        """message 已經編碼好，所有 subscriber 共用同一份；回傳送達的數量"""
+        self.published += 1
+        delivered = 0
+        for sub in list(self.topics.get(topic, ())):
+            try:
+                sub.queue.put_nowait(message)
+                delivered += 1
+            except asyncio.QueueFull:
+                self._drop(sub)
+        return delivered
+
+    def _drop(self, sub: Subscription):
+        self.unsubscribe(sub)
+        self.dropped += 1
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self.topics),
+            "subscribers": self.n_subscribers,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+comment_broadcaster = Broadcaster(settings.COMMENT_STREAM_QUEUE, settings.COMMENT_STREAM_MAX_CLIENTS)
+
+
+# ---------------- SSE ----------------
+def sse_event(event: str, event_id: str, data: dict) -> bytes:
+    payload = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+def publish_comment(item: dict) -> int:
+    """create_comment commit 之後在 event loop 上呼叫"""
+    key = (item["created_at"], item["id"])
+    return comment_broadcaster.publish(item["report_id"], (key, sse_event("comment", item["cursor"], item)))
+
+
+class SentWindow:
+    """
+    一條 stream 已送出的 comment id。replay 從看過最新的 created_at 往前 COMMENT_STREAM_LOOKBACK_SECONDS 開始查，
+    重疊的部分靠 id 去重；比這個範圍更早的 id 不會再被 replay 查到，直接丟掉，記憶體有上限。
+    """
+
+    def __init__(self, newest: datetime):
+        self.newest = newest
+        self.ids: Dict[int, datetime] = {}
+
+    def since(self) -> datetime:
+        return self.newest - timedelta(seconds=settings.COMMENT_STREAM_LOOKBACK_SECONDS)
+
+    def add(self, comment_id: int, created_at: datetime) -> bool:
+        """還沒送過時記下來並回傳 True"""
+        if comment_id in self.ids:
+            return False
+        self.ids[comment_id] = created_at
+        if created_at > self.newest:
+            self.newest = created_at
+            cutoff = self.since()
+            self.ids = {i: t for i, t in self.ids.items() if t >= cutoff}
+        return True
+
+
+async def _replay(report_id: int, since: datetime) -> AsyncIterator[dict]:
+    """DB 裡 created_at >= since 的 comment（重連、或其他 worker 寫入的）"""
+    cursor = make_cursor(since, 0)
+    while cursor:
+        items, next_cursor = await run_in_session(load_comment_page, report_id, cursor, MAX_COMMENT_PAGE_SIZE)
+        for item in items:
+            yield item
+        cursor = next_cursor
+
+
+async def comment_stream(sub: Subscription, cursor: str) -> AsyncIterator[bytes]:
+    """
+    StreamingResponse 的 body。先訂閱（route 裡）再查 DB 補 cursor 之後的，
+    之後 queue 與 replay 來的都以 id 去重，兩邊重疊的部分不會重複。
+    重連時 cursor 前 LOOKBACK 秒內的 comment 會再送一次，client 也要以 id 去重。
+    """
+    report_id = sub.topic
+    created_at, comment_id = decode_cursor(cursor)
+    sent = SentWindow(created_at)
+    sent.add(comment_id, created_at)  # cursor 指到的那一則 client 已經有了
+
+    async def replay() -> AsyncIterator[bytes]:
+        async for item in _replay(report_id, sent.since()):
+            if sent.add(item["id"], item["created_at"]):
+                yield sse_event("comment", item["cursor"], item)
+
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        async for data in replay():
+            yield data
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), settings.COMMENT_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                async for data in replay():
+                    yield data
+                yield b": ping\n\n"
+                continue
+            if message is None:
+                # queue 滿了被斷線：結束 response，client 帶 Last-Event-ID 重連
+                return
+            (created_at, comment_id), data = message
+            if sent.add(comment_id, created_at):
+                yield data
+    finally:
+        comment_broadcaster.unsubscribe(sub)
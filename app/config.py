@@ -1,4 +1,5 @@
 # /app/app/config.py
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +13,90 @@ class Settings(BaseSettings):
     postgres_db: str
     postgres_port: str # Keeping this as str because the trace shows input_type=str
 
+    # 啟動時自動跑 migrations（本機開發用；正式環境用 `python -m app.migrations upgrade`）
+    AUTO_MIGRATE: bool = False
+
+    # 啟動：FAST_STARTUP=true 時 startup 不等 DB，背景以 exponential backoff probe，ready 之前 request 回 503（/readyz 看進度）
+    FAST_STARTUP: bool = False
+    DB_RETRY_BASE_SECONDS: float = 0.5
+    DB_RETRY_MAX_SECONDS: float = 10
+    STARTUP_BUDGET_SECONDS: float = 3  # 超過時 log warning，/readyz 的 over_budget 為 true；0 = 不檢查
+    # Jinja bytecode cache（image build 時 scripts/compile_templates.py 預先寫入）；空字串 = 不用
+    TEMPLATE_BYTECODE_DIR: str = ".jinja_cache"
+
+    # request path 使用 async engine + AsyncSession（false 時維持 sync Session + threadpool，方便比較）
+    DB_ASYNC: bool = False
+    # 預設由 DATABASE_URL 推導（psycopg2 -> asyncpg, sqlite -> aiosqlite）
+    ASYNC_DATABASE_URL: Optional[str] = None
+
+    # connection pool（每個 engine 各自一個 pool；web process 最多 DB_POOL_SIZE + DB_MAX_OVERFLOW 條連線）
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # pool 滿了等多久才放棄（/api/db/stats 的 timeouts）
+    DB_POOL_RECYCLE: int = 1800  # 超過幾秒的 connection 下次取出時重連；-1 = 不 recycle
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # Postgres statement_timeout；0 = 不設
+
+    # read replica：GET / HEAD 走 READ_DATABASE_URL，其他 method 走 DATABASE_URL；沒設時全部走 primary。
+    # 測試時可以指向第二個本機資料庫（例如另一個 SQLite 檔）
+    READ_DATABASE_URL: Optional[str] = None
+    ASYNC_READ_DATABASE_URL: Optional[str] = None  # 預設由 READ_DATABASE_URL 推導，同 ASYNC_DATABASE_URL
+    READ_MAX_LAG_SECONDS: float = 5  # replica 落後超過這個秒數（或連不上）時讀取改走 primary
+    READ_LAG_CHECK_SECONDS: float = 2
+    READ_AFTER_WRITE_SECONDS: float = 5  # 寫入後這段時間內同一個 client 的讀取走 primary（read-your-writes）
+
+    # user / tag / author / affiliation 的 name -> id cache（每種各自的上限與 TTL）
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_TTL_SECONDS: float = 300
+
+    # rendered HTML cache（report / feed 頁面），以 body bytes 計算上限
+    PAGE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    PAGE_CACHE_TTL_SECONDS: float = 600
+
+    # /api/lookup 的 in-memory prefix trie（啟動時 warm）；false 時全部查 DB index
+    LOOKUP_TRIE: bool = False
+    LOOKUP_TRIE_REFRESH_SECONDS: float = 30
+
+    # /api/graph：co-author / affiliation graph（第一次查詢時載入記憶體）
+    GRAPH_REFRESH_SECONDS: float = 30
+    GRAPH_DELTA_MAX: int = 50000  # delta buffer 超過這麼多條邊就併回 CSR
+    GRAPH_MAX_PATH_DEPTH: int = 6
+
+    # report 頁面的 related reports（TF-IDF）；matrix snapshot 存在 RELATED_DIR，worker 以 mmap 開啟
+    RELATED_DIR: str = "data/related"
+    RELATED_TOP_K: int = 5
+    RELATED_REFRESH_SECONDS: float = 30
+    RELATED_SAVE_EVERY: int = 1000  # tail 累積這麼多列就存一份新的 snapshot
+
+    # report 頁面的 comments：分頁 + SSE（app/comments.py，每個 worker 各自的 broadcaster）
+    COMMENT_PAGE_SIZE: int = 50
+    COMMENT_STREAM_QUEUE: int = 100  # 每個 client 的 queue 上限，滿了就斷線讓它重連補資料
+    COMMENT_STREAM_MAX_CLIENTS: int = 1000
+    COMMENT_STREAM_KEEPALIVE_SECONDS: float = 15  # 閒置時送 ping，順便查 DB 補其他 worker 收到的 comment
+    COMMENT_STREAM_LOOKBACK_SECONDS: float = 5  # replay 往前多查幾秒：晚 commit 但 created_at 較早的 comment 也補得到
+
+    # report 附件（app/attachments.py）：以 sha256 存在 ATTACHMENT_DIR，縮圖第一次被要求時產生在 thumbs/
+    ATTACHMENT_DIR: str = "data/attachments"
+    ATTACHMENT_MAX_BYTES: int = 200 * 1024 * 1024
+    ATTACHMENT_THUMBNAIL_WIDTH: int = 320
+    ATTACHMENT_THUMBNAIL_TIMEOUT: float = 30  # pdftoppm 的上限秒數
+    # 設了就回 X-Accel-Redirect: <prefix>/ab/cd/<sha256>，由 nginx 的 internal location 送檔
+    ATTACHMENT_ACCEL_REDIRECT: Optional[str] = None
+
+    # app/jobs.py：DB-backed background jobs（counter 累加、related snapshot 等寫入之後的工作）
+    JOB_RUNNER: bool = True  # web process 內跑 runner；false 時另外跑 scripts/run_jobs.py
+    JOB_POOL: str = "thread"  # thread | process
+    JOB_WORKERS: int = 2
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_SECONDS: float = 5  # 第 n 次失敗後等 JOB_RETRY_SECONDS * 2^(n-1)
+    JOB_TIMEOUT_SECONDS: float = 300  # running 超過這麼久（worker 當掉）就重新領取
+    JOB_KEEP_DONE_SECONDS: float = 86400
+
+    # app/metrics.py：GET /metrics（Prometheus）、慢 SQL log；debug header 會在 response 帶 Server-Timing / X-SQL-Statements
+    METRICS_ENABLED: bool = True
+    METRICS_DEBUG_HEADER: bool = False
+    SLOW_QUERY_MS: float = 200
+
     class Config:
         env_file = ".env"
 
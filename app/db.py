@@ -1,31 +1,220 @@
+import asyncio
+import random
+import threading
 import time
-from sqlmodel import create_engine, SQLModel, Session
-from sqlalchemy.exc import OperationalError
+from typing import Optional
+from fastapi import Request
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from .config import settings
+from .metrics import DB_ROUTES, POOL_HOLD_SECONDS, POOL_TIMEOUTS, POOL_WAIT_SECONDS, REPLICA_LAG_SECONDS
 
 # REMOVE: engine = create_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True)
 # Define it here for use in get_session later, but creation is moved to the function
 engine = None 
+# DB_ASYNC=true 時另外建立 async engine（asyncpg / aiosqlite），request path 改走 AsyncSession
+async_engine = None
+# READ_DATABASE_URL 有設時的 replica engine；沒設時是 None，讀取也走 primary
+read_engine = None
+async_read_engine = None
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: Optional[str] = None, override: Optional[str] = None) -> str:
+    """ASYNC_DATABASE_URL 優先，否則把 DATABASE_URL 的 driver 換成 async 版本（replica 傳自己的 url / override）"""
+    if url is None:
+        url, override = settings.DATABASE_URL, settings.ASYNC_DATABASE_URL
+    if override:
+        return override
+    scheme, rest = url.split("://", 1)
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {scheme}; set ASYNC_DATABASE_URL / ASYNC_READ_DATABASE_URL")
+    return f"{ASYNC_DRIVERS[scheme]}://{rest}"
+
+
+# ---------------- pools ----------------
+class _InstrumentedPool:
+    """
+    checkout 等了多久（pool 滿了就會等到 DB_POOL_TIMEOUT）、connection 被借出多久；
+    label 是 pool_logging_name（engine.dispose() 重建 pool 時會沿用）。
+    """
+
+    def _do_get(self):
+        name = self.logging_name or "default"
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc((name,))
+            raise
+        finally:
+            POOL_WAIT_SECONDS.observe((name,), time.perf_counter() - started)
+        record.info["checkout_at"] = time.perf_counter()
+        return record
+
+    def _do_return_conn(self, record):
+        checkout_at = record.info.pop("checkout_at", None)
+        if checkout_at is not None:
+            POOL_HOLD_SECONDS.observe((self.logging_name or "default",), time.perf_counter() - checkout_at)
+        super()._do_return_conn(record)
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, name: str, is_async: bool = False) -> dict:
+    """create_engine 的參數：pool 大小 / overflow / recycle，Postgres 另外設 statement_timeout"""
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite" and u.database in (None, "", ":memory:"):
+        return dict(echo=False, pool_logging_name=name)  # in-memory SQLite 只能是同一條 connection，不套用 pool 設定
+    options = dict(
+        echo=False,
+        pool_pre_ping=True,
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_logging_name=name,
+    )
+    if settings.DB_STATEMENT_TIMEOUT_MS and u.get_backend_name() == "postgresql":
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if u.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def pool_state(e) -> dict:
+    pool = e.pool
+    if not isinstance(pool, QueuePool):
+        return {"size": 0, "checked_out": 0, "idle": 0, "overflow": 0, "max_overflow": 0, "pool": type(pool).__name__}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+
+
+def all_engines() -> dict:
+    found = {"primary": engine, "replica": read_engine, "primary-async": async_engine, "replica-async": async_read_engine}
+    return {name: e for name, e in found.items() if e is not None}
+
+
+def pool_stats() -> dict:
+    """GET /api/db/stats：每個 engine 目前的 pool 狀態，加上這個 process 啟動以來的 checkout 等待 / 借出時間"""
+    waits, holds, timeouts = POOL_WAIT_SECONDS.totals(), POOL_HOLD_SECONDS.totals(), POOL_TIMEOUTS.values()
+    stats = {}
+    for name, e in all_engines().items():
+        n_waits, wait_sum = waits.get((name,), (0, 0.0))
+        n_holds, hold_sum = holds.get((name,), (0, 0.0))
+        stats[name] = {
+            **pool_state(e),
+            "checkouts": n_waits,
+            "wait_seconds_total": round(wait_sum, 6),
+            "wait_seconds_avg": round(wait_sum / n_waits, 6) if n_waits else 0.0,
+            "timeouts": int(timeouts.get((name,), 0)),
+            "checkout_seconds_avg": round(hold_sum / n_holds, 6) if n_holds else 0.0,
+        }
+    return stats
+
+
+_INSERT_BY_DIALECT = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def insert_for(session: Session, model):
+    """
+    回傳支援 on_conflict_do_nothing() 的 dialect insert。
+    直接對 Core table，executemany 不經過 ORM bulk insert 的額外處理。
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in _INSERT_BY_DIALECT:
+        raise RuntimeError(f"INSERT ... ON CONFLICT is not supported on {dialect}")
+    return _INSERT_BY_DIALECT[dialect](model.__table__)
+
+
+# 資料庫還在啟動 / 網路還沒通時的錯誤訊息（小寫比對）；其他 OperationalError 直接丟出去
+RETRYABLE_DB_ERRORS = (
+    "password authentication failed",
+    "connection refused",
+    "could not translate host name",
+    "the database system is starting up",
+    "timeout expired",
+)
+
+
+def is_retryable(error: OperationalError) -> bool:
+    message = str(error).lower()
+    return any(m in message for m in RETRYABLE_DB_ERRORS)
+
+
+def create_engines():
+    """只建立 engine（不連線）；pool_pre_ping 會在之後每次取出 connection 時檢查"""
+    global engine, async_engine, read_engine, async_read_engine
+    engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL, "primary"))
+    if settings.READ_DATABASE_URL:
+        read_engine = create_engine(settings.READ_DATABASE_URL, **engine_options(settings.READ_DATABASE_URL, "replica"))
+    if settings.DB_ASYNC:
+        url = async_database_url()
+        async_engine = create_async_engine(url, **engine_options(url, "primary-async", is_async=True))
+        if settings.READ_DATABASE_URL:
+            url = async_database_url(settings.READ_DATABASE_URL, settings.ASYNC_READ_DATABASE_URL)
+            async_read_engine = create_async_engine(url, **engine_options(url, "replica-async", is_async=True))
+
+
+def probe_db():
+    """只確認連得上（不 reflect schema）"""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def auto_migrate():
+    if settings.AUTO_MIGRATE:
+        from .migrations import upgrade
+        upgrade(engine)
+
+
+def init_db(max_tries: int = 15, delay: int = 1):
+    """
+    建立 engine 並確認資料庫可連線（blocking，scripts 與 FAST_STARTUP=false 時的 startup 用）。Schema 不在這裡建立：
+    web process 啟動前先跑 `python -m app.migrations upgrade`（compose 的 `migrate` service），
+    本機開發可設 AUTO_MIGRATE=true。
+    """
+    print("Attempting to connect to database...")
+    create_engines()
 
-def create_db_and_tables(max_tries: int = 15, delay: int = 1):
-    global engine
-    print("Attempting to connect to database and create tables...")
-    
     for attempt in range(max_tries):
         try:
-            # 1. CREATE ENGINE INSIDE THE LOOP
-            # Force the creation of a new engine on each attempt
-            engine = create_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True)
-            
-            # 2. Try to create tables
-            SQLModel.metadata.create_all(engine)
-            print("Database connection successful and tables created!")
+            probe_db()
+            auto_migrate()
+            print("Database connection successful!")
             return  # Success, exit the function
 
         except OperationalError as e:
-            error_message = str(e)
-            # The retry logic remains the same
-            if "password authentication failed" in error_message or "connection refused" in error_message or "could not translate host name" in error_message:
+            if is_retryable(e):
                 print(f"Database not ready (Attempt {attempt + 1}/{max_tries}). Retrying in {delay} seconds...")
                 time.sleep(delay)
             else:
@@ -39,8 +228,189 @@ def create_db_and_tables(max_tries: int = 15, delay: int = 1):
     print(f"FATAL: Failed to connect to database after {max_tries} attempts.")
     raise ConnectionError("Could not connect to the database. Check credentials and container health.")
 
-def get_session():
-    """依賴注入函式，用於獲取資料庫會話 (Session)。"""
-    # Use the global engine, which is guaranteed to be set if create_db_and_tables succeeds
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+
+async def wait_for_db(on_retry=None) -> int:
+    """
+    init_db 的非阻塞版本（FAST_STARTUP）：probe 丟到 threadpool，失敗時 exponential backoff（含 jitter，
+    上限 DB_RETRY_MAX_SECONDS）一直重試到連上為止，由 /readyz 回報進度。回傳嘗試次數。
+    on_retry(attempt, error, delay) 在每次失敗後呼叫。
+    """
+    create_engines()
+    delay = settings.DB_RETRY_BASE_SECONDS
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            await run_in_threadpool(probe_db)
+            return attempt
+        except OperationalError as e:
+            if not is_retryable(e):
+                raise
+            if on_retry:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, settings.DB_RETRY_MAX_SECONDS)
+
+# ---------------- read / write routing ----------------
+READ_METHODS = ("GET", "HEAD")
+WROTE_AT_KEY = "wrote_at"
+
+# pg_last_xact_replay_timestamp() 在 primary 閒置時也會變舊：已經 replay 到收到的最後一筆 WAL 就算沒有落後
+REPLICA_LAG_SQL = {
+    "postgresql": """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """,
+}
+
+
+def replica_lag(e) -> float:
+    """沒有 replication 可查的資料庫（例如測試時當 replica 的第二個 SQLite）只確認連得上，lag 當作 0"""
+    sql = REPLICA_LAG_SQL.get(e.dialect.name, "SELECT 0")
+    with e.connect() as conn:
+        return float(conn.execute(text(sql)).scalar() or 0)
+
+
+class ReplicaRouter:
+    """
+    GET / HEAD 的 request 用 replica，其他走 primary。以下情況讀取也改走 primary：
+    replica 落後超過 READ_MAX_LAG_SECONDS 或連不上（還沒量過也算）、
+    這個 client（session cookie）READ_AFTER_WRITE_SECONDS 內寫過，要看得到自己剛寫的東西。
+    lag 每 READ_LAG_CHECK_SECONDS 在背景 thread 量一次，request 只看上一次的結果，不會等。
+    """
+
+    def __init__(self):
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._checking = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return self.lag is not None and self.lag <= settings.READ_MAX_LAG_SECONDS
+
+    def refresh(self):
+        """到期時起一條 thread 去量；已經有人在量就不動"""
+        if self.checked_at is not None and time.monotonic() - self.checked_at < settings.READ_LAG_CHECK_SECONDS:
+            return
+        if self._checking.acquire(blocking=False):
+            threading.Thread(target=self._check, name="replica-lag", daemon=True).start()
+
+    def _check(self):
+        try:
+            self.lag, self.error = replica_lag(read_engine), None
+            REPLICA_LAG_SECONDS.replace({(): self.lag})
+        except Exception as e:
+            self.lag, self.error = None, f"{type(e).__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ''}"
+        finally:
+            self.checked_at = time.monotonic()
+            self._checking.release()
+
+    def route(self, request: Request, read_only: bool = False) -> bool:
+        """True = 用 replica；read_only=True 的 route（POST /query 這類查詢）不看 method"""
+        if read_engine is None:
+            return False
+        if not read_only and request.method not in READ_METHODS:
+            mark_write(request)
+            reason = "write"
+        elif time.time() - request.session.get(WROTE_AT_KEY, 0) < settings.READ_AFTER_WRITE_SECONDS:
+            reason = "after_write"
+        else:
+            self.refresh()
+            reason = "read" if self.healthy else ("lagging" if self.lag is not None else "unavailable")
+        use_replica = reason == "read"
+        DB_ROUTES.inc(("replica" if use_replica else "primary", reason))
+        return use_replica
+
+    def read_engine(self):
+        """不經過 request 的長時間讀取（export）：replica 正常時用 replica"""
+        if read_engine is None:
+            return engine
+        self.refresh()
+        return read_engine if self.healthy else engine
+
+    def stats(self) -> dict:
+        return {
+            "configured": read_engine is not None,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "max_lag_seconds": settings.READ_MAX_LAG_SECONDS,
+            "error": self.error,
+            "checked_seconds_ago": round(time.monotonic() - self.checked_at, 3) if self.checked_at is not None else None,
+            "routes": {f"{target}:{reason}": int(n) for (target, reason), n in sorted(DB_ROUTES.values().items())},
+        }
+
+
+replica_router = ReplicaRouter()
+
+
+def mark_write(request: Request):
+    """不經過 get_session 的寫入（attachment 上傳）也要記下來，之後的讀取才會看到"""
+    request.session[WROTE_AT_KEY] = time.time()
+
+
+def primary_bind(session: Session):
+    """session 在 replica 上、卻需要寫入時（GET 裡排 job）用對應的 primary engine"""
+    bind = session.get_bind()
+    if read_engine is not None and bind is read_engine:
+        return engine
+    if async_read_engine is not None and bind is async_read_engine.sync_engine:
+        return async_engine.sync_engine
+    return bind
+
+
+def get_sync_session(request: Request):
+    """依賴注入函式，用於獲取資料庫會話 (Session)。GET / HEAD 可能拿到 replica（ReplicaRouter）"""
+    # Use the global engine, which is guaranteed to be set if init_db succeeds
+    with Session(read_engine if replica_router.route(request) else engine) as session:
+        yield session
+
+
+def get_sync_read_session(request: Request):
+    with Session(read_engine if replica_router.route(request, read_only=True) else engine) as session:
+        yield session
+
+
+async def get_async_session(request: Request):
+    """async 版本；expire_on_commit=False 讓 commit 後的物件仍可在 template 中讀取"""
+    bind = async_read_engine if replica_router.route(request) else async_engine
+    async with AsyncSession(bind, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_read_session(request: Request):
+    bind = async_read_engine if replica_router.route(request, read_only=True) else async_engine
+    async with AsyncSession(bind, expire_on_commit=False) as session:
+        yield session
+
+
+# routes 一律 Depends(get_session)，由 DB_ASYNC 決定實際用哪一種；
+# 不是 GET 但只讀的 route（POST /query）用 get_read_session，一樣可以走 replica
+get_session = get_async_session if settings.DB_ASYNC else get_sync_session
+get_read_session = get_async_read_session if settings.DB_ASYNC else get_sync_read_session
+
+
+async def run_db(session, fn, *args, **kwargs):
+    """
+    執行 sync 的 DB 程式 fn(session, *args)，不卡住 event loop：
+    AsyncSession 走 run_sync（greenlet，真正的 async I/O，不佔 thread），sync Session 丟到 threadpool。
+    """
+    if isinstance(session, AsyncSession):
+        return await session.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, session, *args, **kwargs)
+
+
+async def run_in_session(fn, *args, **kwargs):
+    """自己開 session 的 run_db()：route 的 session dependency 已經關掉之後才跑的程式（SSE / streaming body）用"""
+    if settings.DB_ASYNC:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await session.run_sync(fn, *args, **kwargs)
+
+    def run():
+        with Session(engine) as session:
+            return fn(session, *args, **kwargs)
+
+    return await run_in_threadpool(run)
@@ -0,0 +1,216 @@
+# export.py
+# /export：依 /query 的 filters 串流匯出所有 report（CSV / NDJSON / BibTeX）。
+# Report 用 server-side cursor 分批讀（yield_per / stream_results），關聯資料每批一次 IN 查詢，
+# 逐列編碼後以 ~64KB chunk 送出；記憶體用量只跟 batch 大小有關，跟匯出筆數無關。
+
+import csv
+import io
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from .models import (
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    Comment,
+    LabMeeting,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+    User,
+)
+from .query import base_statement
+
+EXPORT_BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+
+# 欄位名稱與 bulk_import 相同，匯出的 CSV / NDJSON 可以直接再匯入
+CSV_COLUMNS = [
+    "report_id", "report_title", "report_summary", "slides_link", "presenter", "created_at",
+    "meeting_title", "meeting_date", "meeting_location",
+    "paper_title", "published_year", "published_month", "journal_or_conference",
+    "authors", "tags", "comment_count",
+]
+
+# format -> (media type, file extension)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "bibtex": ("application/x-bibtex; charset=utf-8", "bib"),
+}
+
+
+# ---------------- batched loaders ----------------
+# 只 select 需要的欄位（不建 ORM 物件），identity map 不會隨匯出量長大
+def _rows_by_id(session: Session, columns, id_col, ids) -> Dict[int, Any]:
+    ids = list(set(i for i in ids if i is not None))
+    if not ids:
+        return {}
+    return {row[0]: row for row in session.execute(select(id_col, *columns).where(id_col.in_(ids)))}
+
+
+def load_export_batch(session: Session, reports: List[Any]) -> Iterator[dict]:
+    """reports 是 report table 的 Row；回傳每筆 report 展開後的 dict"""
+    report_ids = [r.id for r in reports]
+    paper_ids = list({r.paper_id for r in reports if r.paper_id})
+
+    users = _rows_by_id(session, [User.username], User.id, (r.user_id for r in reports))
+    meetings = _rows_by_id(
+        session, [LabMeeting.meeting_title, LabMeeting.meeting_date, LabMeeting.meeting_location],
+        LabMeeting.id, (r.meeting_id for r in reports),
+    )
+    papers = _rows_by_id(
+        session, [Paper.paper_title, Paper.published_year, Paper.published_month, Paper.journal_or_conference],
+        Paper.id, paper_ids,
+    )
+
+    authors_by_paper: Dict[int, List[tuple]] = defaultdict(list)
+    tags_by_paper: Dict[int, List[str]] = defaultdict(list)
+    affs_by_author: Dict[int, List[str]] = defaultdict(list)
+    if paper_ids:
+        for paper_id, author_id, name in session.execute(
+            select(PaperAuthorLink.paper_id, Author.id, Author.name)
+            .join(Author, Author.id == PaperAuthorLink.author_id)
+            .where(PaperAuthorLink.paper_id.in_(paper_ids))
+            .order_by(PaperAuthorLink.paper_id, Author.id)
+        ):
+            authors_by_paper[paper_id].append((author_id, name))
+        author_ids = list({a for authors in authors_by_paper.values() for a, _ in authors})
+        if author_ids:
+            for author_id, name in session.execute(
+                select(AuthorAffiliationLink.author_id, Affiliation.name)
+                .join(Affiliation, Affiliation.id == AuthorAffiliationLink.affiliation_id)
+                .where(AuthorAffiliationLink.author_id.in_(author_ids))
+                .order_by(Affiliation.name)
+            ):
+                affs_by_author[author_id].append(name)
+        for paper_id, name in session.execute(
+            select(PaperTag.paper_id, Tag.name)
+            .join(Tag, Tag.id == PaperTag.tag_id)
+            .where(PaperTag.paper_id.in_(paper_ids))
+            .order_by(Tag.name)
+        ):
+            tags_by_paper[paper_id].append(name)
+
+    comment_counts = dict(session.execute(
+        select(Comment.report_id, func.count(Comment.id))
+        .where(Comment.report_id.in_(report_ids))
+        .group_by(Comment.report_id)
+    ).all())
+
+    for r in reports:
+        user = users.get(r.user_id)
+        meeting = meetings.get(r.meeting_id)
+        paper = papers.get(r.paper_id)
+        yield {
+            "report_id": r.id,
+            "report_title": r.report_title,
+            "report_summary": r.report_summary,
+            "slides_link": r.slides_link,
+            "presenter": user.username if user else None,
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+            "meeting_title": meeting.meeting_title if meeting else None,
+            "meeting_date": meeting.meeting_date.isoformat() if meeting else None,
+            "meeting_location": meeting.meeting_location if meeting else None,
+            "paper_title": paper.paper_title if paper else None,
+            "published_year": paper.published_year if paper else None,
+            "published_month": paper.published_month if paper else None,
+            "journal_or_conference": paper.journal_or_conference if paper else None,
+            "authors": [
+                {"name": name, "affiliations": affs_by_author.get(author_id, [])}
+                for author_id, name in authors_by_paper.get(r.paper_id, [])
+            ],
+            "tags": tags_by_paper.get(r.paper_id, []),
+            "comment_count": comment_counts.get(r.id, 0),
+        }
+
+
+def iter_export_rows(session: Session, plan, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """plan 是 query.prepare_query() 的結果"""
+    shape, params, sort, descending = plan
+    stmt = base_statement(shape, sort, descending).with_only_columns(*Report.__table__.columns)
+    result = session.execute(stmt, params, execution_options={"yield_per": batch_size})
+    for reports in result.partitions():
+        yield from load_export_batch(session, reports)
+
+
+# ---------------- encoders ----------------
+def encode_csv(rows: Iterable[dict]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        row = dict(row)
+        # 與 bulk_import.parse_authors 的 CSV 格式相同："Alice [MIT, Stanford]; Bob"
+        row["authors"] = "; ".join(
+            f"{a['name']} [{', '.join(a['affiliations'])}]" if a["affiliations"] else a["name"]
+            for a in row["authors"]
+        )
+        row["tags"] = ", ".join(row["tags"])
+        writer.writerow([row[c] for c in CSV_COLUMNS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def encode_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def _bib_value(value) -> str:
+    # 大括號會破壞 BibTeX 的巢狀結構，直接拿掉
+    return str(value).replace("{", "").replace("}", "")
+
+
+def encode_bibtex(rows: Iterable[dict]) -> Iterator[str]:
+    """每筆 report 一個 @article；report / meeting 資訊放在非標準欄位與 note"""
+    for row in rows:
+        fields = [
+            ("title", row["paper_title"] or row["report_title"]),
+            ("author", " and ".join(a["name"] for a in row["authors"])),
+            ("year", row["published_year"] or None),
+            ("month", row["published_month"] or None),
+            ("journal", row["journal_or_conference"]),
+            ("keywords", ", ".join(row["tags"])),
+            ("note", f"Presented by {row['presenter']} at {row['meeting_title']} ({row['meeting_date']})"),
+            ("report_title", row["report_title"]),
+            ("slides_link", row["slides_link"]),
+            ("comment_count", row["comment_count"]),
+        ]
+        body = ",\n".join(f"  {k} = {{{_bib_value(v)}}}" for k, v in fields if v not in (None, ""))
+        yield f"@article{{report{row['report_id']},\n{body}\n}}\n\n"
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "bibtex": encode_bibtex}
+
+
+def chunked(pieces: Iterable[str], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """把逐列的小字串合併成 ~size bytes 的 chunk，減少 ASGI send 次數"""
+    buf: List[str] = []
+    length = 0
+    for piece in pieces:
+        buf.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buf).encode("utf-8")
+            buf, length = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+# ---------------- public API ----------------
+def stream_export(engine, plan, fmt: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """
+    StreamingResponse 的 body。自己開 sync Session：response 開始送出時 route 的 session
+    dependency 可能已經關閉，而且 sync iterator 會由 Starlette 丟到 threadpool 跑，不會卡 event loop。
+    """
+    with Session(engine) as session:
+        yield from chunked(ENCODERS[fmt](iter_export_rows(session, plan, batch_size)))
@@ -0,0 +1,139 @@
+# feed.py
+# report feed：依 (created_at, id) 做 keyset 分頁，關聯資料整頁一次批次載入。
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlmodel import Session, select
+
+from .models import Author, LabMeeting, Paper, PaperAuthorLink, PaperTag, Report, Tag, User
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+# ---------------- cursor ----------------
+def make_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def encode_cursor(report: Report) -> str:
+    return make_cursor(report.created_at, report.id)
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """把 cursor 還原成 (created_at, id)，格式錯誤時丟 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, report_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(report_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def after_cursor(stmt, cursor: str):
+    """新到舊排序的 Report statement 只留下比 cursor 更舊的列"""
+    created_at, report_id = decode_cursor(cursor)
+    return stmt.where(
+        or_(
+            Report.created_at < created_at,
+            and_(Report.created_at == created_at, Report.id < report_id),
+        )
+    )
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+# ---------------- batched loaders ----------------
+def load_by_id(session: Session, model, ids: Iterable[int]) -> Dict[int, object]:
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    rows = session.exec(select(model).where(model.id.in_(ids))).all()
+    return {row.id: row for row in rows}
+
+
+def load_tags_by_paper(session: Session, paper_ids: Iterable[int]) -> Dict[int, List[Tag]]:
+    paper_ids = {i for i in paper_ids if i is not None}
+    if not paper_ids:
+        return {}
+    rows = session.exec(
+        select(PaperTag.paper_id, Tag)
+        .join(Tag, Tag.id == PaperTag.tag_id)
+        .where(PaperTag.paper_id.in_(paper_ids))
+        .order_by(Tag.name)
+    ).all()
+    tags: Dict[int, List[Tag]] = {}
+    for paper_id, tag in rows:
+        tags.setdefault(paper_id, []).append(tag)
+    return tags
+
+
+def load_authors_by_paper(session: Session, paper_ids: Iterable[int]) -> Dict[int, List[Author]]:
+    paper_ids = {i for i in paper_ids if i is not None}
+    if not paper_ids:
+        return {}
+    rows = session.exec(
+        select(PaperAuthorLink.paper_id, Author)
+        .join(Author, Author.id == PaperAuthorLink.author_id)
+        .where(PaperAuthorLink.paper_id.in_(paper_ids))
+        .order_by(Author.id)
+    ).all()
+    authors: Dict[int, List[Author]] = {}
+    for paper_id, author in rows:
+        authors.setdefault(paper_id, []).append(author)
+    return authors
+
+
+def enrich_reports(session: Session, reports: List[Report], with_authors: bool = False) -> List[dict]:
+    """
+    一次載入一頁 reports 的 user / meeting / paper / tags。
+    每種關聯資料一個 IN 查詢：query 數量固定，不隨筆數增加。
+    """
+    users = load_by_id(session, User, (r.user_id for r in reports))
+    meetings = load_by_id(session, LabMeeting, (r.meeting_id for r in reports))
+    papers = load_by_id(session, Paper, (r.paper_id for r in reports))
+    tags = load_tags_by_paper(session, papers.keys())
+    items = [
+        {
+            "r": r,
+            "user": users.get(r.user_id),
+            "meeting": meetings.get(r.meeting_id),
+            "paper": papers.get(r.paper_id),
+            "tags": tags.get(r.paper_id, []),
+        }
+        for r in reports
+    ]
+    if with_authors:
+        authors = load_authors_by_paper(session, papers.keys())
+        for item in items:
+            item["authors"] = authors.get(item["r"].paper_id, [])
+    return items
+
+
+# ---------------- feed page ----------------
+def load_feed_page(session: Session, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """回傳 (enriched items, next_cursor)；next_cursor 為 None 代表沒有下一頁"""
+    return paginate_reports(session, select(Report), cursor, limit)
+
+
+def paginate_reports(session: Session, stmt, cursor: Optional[str] = None, limit: Optional[int] = None, with_authors: bool = False):
+    """把任意 select(Report) 依 (created_at, id) 新到舊做 keyset 分頁，回傳 (enriched items, next_cursor)"""
+    limit = clamp_limit(limit)
+    stmt = stmt.order_by(Report.created_at.desc(), Report.id.desc())
+    if cursor:
+        stmt = after_cursor(stmt, cursor)
+    # 多抓一筆判斷是否還有下一頁
+    reports = session.exec(stmt.limit(limit + 1)).all()
+    has_more = len(reports) > limit
+    reports = reports[:limit]
+    next_cursor = encode_cursor(reports[-1]) if has_more and reports else None
+    return enrich_reports(session, reports, with_authors=with_authors), next_cursor
@@ -0,0 +1,521 @@
+# graph.py
+# 共同作者 / affiliation graph：PaperAuthorLink 與 AuthorAffiliationLink 載入成 CSR 形式的 adjacency
+# （array.array，每條邊 4 bytes），查詢全部在記憶體裡走，不再每個 author 一個 lazy load 查詢。
+# 本 worker 的寫入在 commit 後進 delta buffer（超過 GRAPH_DELTA_MAX 才併回 CSR）；
+# 其他 worker 的寫入由 refresh（每 GRAPH_REFRESH_SECONDS）補上。
+
+import threading
+import time
+from array import array
+from collections import Counter, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, func
+from sqlmodel import Session, select
+
+from .config import settings
+from .models import Affiliation, Author, AuthorAffiliationLink, Paper, PaperAuthorLink, Report
+
+LOAD_BATCH_SIZE = 10000
+DEFAULT_GRAPH_LIMIT = 20
+MAX_GRAPH_LIMIT = 200
+# co-author 數超過這個的 author（例如大型合作論文）在 network 展開時不再往外走，避免一跳就涵蓋整個 graph
+HUB_DEGREE = 500
+
+
+def clamp_graph_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_GRAPH_LIMIT
+    return min(limit, MAX_GRAPH_LIMIT)
+
+
+# ---------------- adjacency ----------------
+class CSR:
+    """
+    row -> neighbors：indices[indptr[row]:indptr[row + 1]]。
+    row / neighbor 直接用 DB id（serial，幾乎連續），不另外建 id 對照表。
+    """
+
+    __slots__ = ("indptr", "indices")
+
+    def __init__(self, indptr: array, indices: array):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def build(cls, src: array, dst: array, n_rows: int) -> "CSR":
+        """counting sort：兩次線性掃過 (src, dst)，不建立 tuple list"""
+        indptr = array("q", bytes(8 * (n_rows + 1)))
+        for s in src:
+            indptr[s + 1] += 1
+        for i in range(n_rows):
+            indptr[i + 1] += indptr[i]
+        pos = indptr[:-1]
+        indices = array("i", bytes(4 * len(src)))
+        for s, d in zip(src, dst):
+            indices[pos[s]] = d
+            pos[s] += 1
+        return cls(indptr, indices)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.itemsize * len(self.indptr) + self.indices.itemsize * len(self.indices)
+
+    def row(self, r: int) -> array:
+        if r < 0 or r >= self.n_rows:
+            return array("i")
+        return self.indices[self.indptr[r]:self.indptr[r + 1]]
+
+    def merged(self, delta: Dict[int, List[int]]) -> "CSR":
+        """把 delta（row -> 新增的 neighbors）併進來，回傳新的 CSR；原本的不動，讀的人不用加鎖"""
+        n_rows = max(self.n_rows, max(delta, default=-1) + 1)
+        indptr = array("q", bytes(8 * (n_rows + 1)))
+        indices = array("i")
+        for r in range(n_rows):
+            if r < self.n_rows:
+                indices.extend(self.indices[self.indptr[r]:self.indptr[r + 1]])
+            extra = delta.get(r)
+            if extra:
+                indices.extend(extra)
+            indptr[r + 1] = len(indices)
+        return CSR(indptr, indices)
+
+
+class Adjacency:
+    """CSR + delta buffer。compact 時換成新的 Adjacency，reader 拿到的永遠是一致的 (csr, delta)"""
+
+    __slots__ = ("csr", "delta", "n_delta")
+
+    def __init__(self, csr: CSR):
+        self.csr = csr
+        self.delta: Dict[int, List[int]] = {}
+        self.n_delta = 0
+
+    def neighbors(self, r: int) -> List[int]:
+        extra = self.delta.get(r)
+        base = self.csr.row(r)
+        return list(base) + extra if extra else list(base)
+
+    def degree(self, r: int) -> int:
+        n = self.csr.indptr[r + 1] - self.csr.indptr[r] if 0 <= r < self.csr.n_rows else 0
+        return n + len(self.delta.get(r, ()))
+
+    def has_edge(self, r: int, x: int) -> bool:
+        return x in self.csr.row(r) or x in self.delta.get(r, ())
+
+    def add(self, r: int, x: int):
+        self.delta.setdefault(r, []).append(x)
+        self.n_delta += 1
+
+    def compacted(self) -> "Adjacency":
+        return Adjacency(self.csr.merged(self.delta)) if self.n_delta else self
+
+    @property
+    def n_edges(self) -> int:
+        return self.csr.n_edges + self.n_delta
+
+    @property
+    def n_rows(self) -> int:
+        return max(self.csr.n_rows, max(self.delta, default=-1) + 1)
+
+    def rows(self) -> Iterator[Tuple[int, Sequence[int]]]:
+        """依序走過每個 row；直接讀 array，全圖掃描時比逐一呼叫 neighbors() 快"""
+        indptr, indices, delta = self.csr.indptr, self.csr.indices, self.delta
+        n = self.csr.n_rows
+        for r in range(self.n_rows):
+            base = indices[indptr[r]:indptr[r + 1]] if r < n else ()
+            extra = delta.get(r)
+            yield r, (list(base) + extra if extra else base)
+
+
+# ---------------- graph ----------------
+class CollabGraph:
+    """
+    bipartite：paper <-> author <-> affiliation，四個方向各一份 adjacency。
+    co-author 關係不另外存（會是 O(作者數²) 條邊），查詢時經由 paper 走兩步。
+    """
+
+    def __init__(self, paper_author: Tuple[array, array], author_aff: Tuple[array, array]):
+        pa_paper, pa_author = paper_author
+        aa_author, aa_aff = author_aff
+        n_papers = max(pa_paper, default=-1) + 1
+        n_authors = max(max(pa_author, default=-1), max(aa_author, default=-1)) + 1
+        n_affs = max(aa_aff, default=-1) + 1
+        self.paper_authors = Adjacency(CSR.build(pa_paper, pa_author, n_papers))
+        self.author_papers = Adjacency(CSR.build(pa_author, pa_paper, n_authors))
+        self.author_affs = Adjacency(CSR.build(aa_author, aa_aff, n_authors))
+        self.aff_authors = Adjacency(CSR.build(aa_aff, aa_author, n_affs))
+        self.max_paper_id = n_papers - 1
+        self.max_author_id = max(aa_author, default=-1)
+        self.version = 0
+        self.built_at = time.time()
+        self._lock = threading.Lock()
+        self._top_affiliations: Optional[Tuple[int, float, List[dict]]] = None
+
+    # ---- writes ----
+    def add_links(self, paper_author: Iterable[Tuple[int, int]] = (), author_aff: Iterable[Tuple[int, int]] = ()) -> int:
+        """已經在 graph 裡的邊直接略過（insert_links 的 ON CONFLICT DO NOTHING 不會告訴我們哪些是新的）"""
+        added = 0
+        with self._lock:
+            for paper_id, author_id in paper_author:
+                if not self.paper_authors.has_edge(paper_id, author_id):
+                    self.paper_authors.add(paper_id, author_id)
+                    self.author_papers.add(author_id, paper_id)
+                    self.max_paper_id = max(self.max_paper_id, paper_id)
+                    added += 1
+            for author_id, aff_id in author_aff:
+                if not self.author_affs.has_edge(author_id, aff_id):
+                    self.author_affs.add(author_id, aff_id)
+                    self.aff_authors.add(aff_id, author_id)
+                    self.max_author_id = max(self.max_author_id, author_id)
+                    added += 1
+            if added:
+                self.version += 1
+                if self.n_delta > settings.GRAPH_DELTA_MAX:
+                    self._compact()
+        return added
+
+    def _compact(self):
+        self.paper_authors = self.paper_authors.compacted()
+        self.author_papers = self.author_papers.compacted()
+        self.author_affs = self.author_affs.compacted()
+        self.aff_authors = self.aff_authors.compacted()
+
+    @property
+    def n_delta(self) -> int:
+        return self.paper_authors.n_delta + self.author_affs.n_delta
+
+    def stats(self) -> dict:
+        adjs = (self.paper_authors, self.author_papers, self.author_affs, self.aff_authors)
+        return {
+            "paper_author_edges": self.paper_authors.n_edges,
+            "author_affiliation_edges": self.author_affs.n_edges,
+            "delta_edges": self.n_delta,
+            "bytes": sum(a.csr.nbytes for a in adjs),
+            "version": self.version,
+            "built_at": self.built_at,
+        }
+
+    # ---- queries ----
+    def coauthors(self, author_id: int) -> Counter:
+        """co-author id -> 共同 paper 數"""
+        counts: Counter = Counter()
+        for paper_id in self.author_papers.neighbors(author_id):
+            counts.update(self.paper_authors.neighbors(paper_id))
+        counts.pop(author_id, None)
+        return counts
+
+    def _step(self, author_id: int) -> Iterable[Tuple[int, int]]:
+        for paper_id in self.author_papers.neighbors(author_id):
+            for other in self.paper_authors.neighbors(paper_id):
+                if other != author_id:
+                    yield other, paper_id
+
+    def shortest_path(self, source: int, target: int, max_depth: int) -> Optional[List[Tuple[int, Optional[int]]]]:
+        """
+        雙向 BFS（每次展開比較小的那一側）。
+        回傳 [(author_id, 與前一位共同的 paper_id)]，第一個的 paper 為 None；超過 max_depth 步找不到時回傳 None。
+        """
+        if source == target:
+            return [(source, None)]
+        # author -> (前一位 author, 經過的 paper)
+        parents = [{source: None}, {target: None}]
+        frontiers = [[source], [target]]
+        for _ in range(max_depth):
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            seen, other_seen = parents[side], parents[1 - side]
+            nxt = []
+            for author_id in frontiers[side]:
+                for other, paper_id in self._step(author_id):
+                    if other in seen:
+                        continue
+                    seen[other] = (author_id, paper_id)
+                    if other in other_seen:
+                        return self._join(parents, other)
+                    nxt.append(other)
+            if not nxt:
+                return None
+            frontiers[side] = nxt
+        return None
+
+    @staticmethod
+    def _join(parents, meet: int) -> List[Tuple[int, Optional[int]]]:
+        fwd, bwd = parents
+        # source -> meet
+        chain = []
+        node = meet
+        while fwd[node] is not None:
+            prev, paper_id = fwd[node]
+            chain.append((node, paper_id))
+            node = prev
+        chain.append((node, None))
+        chain.reverse()
+        # meet -> target
+        node = meet
+        while bwd[node] is not None:
+            nxt, paper_id = bwd[node]
+            chain.append((nxt, paper_id))
+            node = nxt
+        return chain
+
+    def top_affiliations(self, limit: int) -> List[dict]:
+        """
+        依「有共同作者的其他 affiliation 數」排序；全圖算一次 O(Σ 每篇 paper 的 affiliation 數²)。
+        結果 cache 住，graph 有新邊時最多每 GRAPH_REFRESH_SECONDS 重算一次（排行榜晚一點更新沒關係）。
+        """
+        cached = self._top_affiliations
+        if cached is None or (cached[0] != self.version
+                              and time.monotonic() - cached[1] > settings.GRAPH_REFRESH_SECONDS):
+            version = self.version
+            cached = self._top_affiliations = (version, time.monotonic(), self._rank_affiliations())
+        return cached[2][:limit]
+
+    def _rank_affiliations(self) -> List[dict]:
+        aff_of: List[tuple] = [()] * self.author_affs.n_rows
+        for author_id, affs in self.author_affs.rows():
+            if affs:
+                aff_of[author_id] = tuple(affs)
+        n_authors = len(aff_of)
+        partners: Dict[int, set] = {}
+        papers: Counter = Counter()
+        for _, authors in self.paper_authors.rows():
+            affs = set()
+            for a in authors:
+                if a < n_authors:
+                    affs.update(aff_of[a])
+            papers.update(affs)
+            if len(affs) > 1:
+                for aff in affs:
+                    partners.setdefault(aff, set()).update(affs)
+        rows = [
+            {
+                "affiliation_id": aff,
+                "partners": len(partners[aff]) - 1 if aff in partners else 0,
+                "authors": self.aff_authors.degree(aff),
+                "papers": n,
+            }
+            for aff, n in papers.items()
+        ]
+        rows.sort(key=lambda x: (-x["partners"], -x["papers"], x["affiliation_id"]))
+        return rows
+
+    def network(self, seeds: Iterable[int], depth: int) -> Dict[int, int]:
+        """seed authors 往外走 depth 步 co-author：author id -> 距離（seeds 為 0）"""
+        dist = {a: 0 for a in seeds}
+        queue = deque(dist)
+        while queue:
+            author_id = queue.popleft()
+            d = dist[author_id]
+            if d >= depth or (d > 0 and self.author_papers.degree(author_id) > HUB_DEGREE):
+                continue
+            for other, _ in self._step(author_id):
+                if other not in dist:
+                    dist[other] = d + 1
+                    queue.append(other)
+        return dist
+
+    def network_papers(self, seeds: Iterable[int], depth: int, exclude: Iterable[int], limit: int) -> List[Tuple[int, int]]:
+        """network 裡的人寫的 paper，依 network 作者數（再依 id 新到舊）排序：[(paper_id, n_authors)]"""
+        exclude = set(exclude)
+        counts: Counter = Counter()
+        for author_id in self.network(seeds, depth):
+            for paper_id in self.author_papers.neighbors(author_id):
+                if paper_id not in exclude:
+                    counts[paper_id] += 1
+        return sorted(counts.items(), key=lambda x: (-x[1], -x[0]))[:limit]
+
+
+# ---------------- load / refresh ----------------
+def _load_pairs(session: Session, stmt) -> Tuple[array, array]:
+    src, dst = array("i"), array("i")
+    for a, b in session.execute(stmt, execution_options={"yield_per": LOAD_BATCH_SIZE}):
+        src.append(a)
+        dst.append(b)
+    return src, dst
+
+
+def load_graph(session: Session) -> CollabGraph:
+    return CollabGraph(
+        _load_pairs(session, select(PaperAuthorLink.paper_id, PaperAuthorLink.author_id)),
+        _load_pairs(session, select(AuthorAffiliationLink.author_id, AuthorAffiliationLink.affiliation_id)),
+    )
+
+
+def _link_counts(session: Session) -> Tuple[int, int]:
+    return (
+        session.exec(select(func.count()).select_from(PaperAuthorLink)).one(),
+        session.exec(select(func.count()).select_from(AuthorAffiliationLink)).one(),
+    )
+
+
+class GraphIndex:
+    """
+    process 內共用的 CollabGraph。第一次查詢時載入；之後每 GRAPH_REFRESH_SECONDS：
+    先數兩張 link table，再拉 id 比上次大的 paper / author 的 link；
+    如果 graph 的邊數還是比 DB 少（其他 worker 替舊 paper 補了 link），整個重新載入。
+    重新載入期間其他 request 繼續用舊的 graph。
+    """
+
+    def __init__(self):
+        self.graph: Optional[CollabGraph] = None
+        self.refreshed_at = 0.0
+        self._build_lock = threading.Lock()
+
+    def get(self, session: Session) -> CollabGraph:
+        if self.graph is None:
+            # 不在 lock 上等：DB_ASYNC 時 run_sync 跑在 event loop thread 上，等 lock 會卡住整個 loop。
+            # 同時進來的第一次查詢各自載入，先完成的放進來
+            graph = load_graph(session)
+            if self.graph is None:
+                self.graph = graph
+                self.refreshed_at = time.monotonic()
+            return graph
+        elif time.monotonic() - self.refreshed_at > settings.GRAPH_REFRESH_SECONDS:
+            if self._build_lock.acquire(blocking=False):
+                try:
+                    self.refresh(session)
+                finally:
+                    self._build_lock.release()
+        return self.graph
+
+    def refresh(self, session: Session):
+        graph = self.graph
+        n_pa, n_aa = _link_counts(session)
+        graph.add_links(
+            session.execute(
+                select(PaperAuthorLink.paper_id, PaperAuthorLink.author_id)
+                .where(PaperAuthorLink.paper_id > graph.max_paper_id)
+            ).all(),
+            session.execute(
+                select(AuthorAffiliationLink.author_id, AuthorAffiliationLink.affiliation_id)
+                .where(AuthorAffiliationLink.author_id > graph.max_author_id)
+            ).all(),
+        )
+        if graph.paper_authors.n_edges < n_pa or graph.author_affs.n_edges < n_aa:
+            self.graph = load_graph(session)
+        self.refreshed_at = time.monotonic()
+
+    def clear(self):
+        self.graph = None
+
+
+graph_index = GraphIndex()
+
+
+# ---------------- write-side: apply after commit ----------------
+# 與 cache.cache_after_commit 同樣的做法：commit 成功才把新 link 放進 graph，rollback 就丟掉
+_PENDING_KEY = "graph_pending"
+
+
+def graph_after_commit(session: Session, paper_author: Iterable[dict] = (), author_aff: Iterable[dict] = ()):
+    """rows 是 insert_links 用的 dict；graph 還沒載入時不用記"""
+    if graph_index.graph is None:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, ([], []))
+    pending[0].extend((r["paper_id"], r["author_id"]) for r in paper_author)
+    pending[1].extend((r["author_id"], r["affiliation_id"]) for r in author_aff)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending and graph_index.graph is not None:
+        graph_index.graph.add_links(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ---------------- public API ----------------
+# 以下都回傳 JSON-ready dict；名稱每次一個 IN 查詢補上。找不到 author 時丟 LookupError。
+def _names(session: Session, model, col, ids: Iterable[int]) -> Dict[int, str]:
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    return dict(session.exec(select(model.id, col).where(model.id.in_(ids))).all())
+
+
+def _require_author(session: Session, author_id: int) -> str:
+    name = session.exec(select(Author.name).where(Author.id == author_id)).first()
+    if name is None:
+        raise LookupError(f"author {author_id} not found")
+    return name
+
+
+def load_coauthors(session: Session, author_id: int, limit: Optional[int] = None) -> dict:
+    name = _require_author(session, author_id)
+    graph = graph_index.get(session)
+    counts = graph.coauthors(author_id)
+    top = sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:clamp_graph_limit(limit)]
+    names = _names(session, Author, Author.name, (a for a, _ in top))
+    return {
+        "author": {"id": author_id, "name": name},
+        "total": len(counts),
+        "coauthors": [{"id": a, "name": names.get(a), "shared_papers": n} for a, n in top],
+    }
+
+
+def load_collaboration_path(session: Session, source: int, target: int) -> dict:
+    _require_author(session, source)
+    _require_author(session, target)
+    graph = graph_index.get(session)
+    path = graph.shortest_path(source, target, settings.GRAPH_MAX_PATH_DEPTH)
+    if path is None:
+        return {"found": False, "length": None, "path": []}
+    names = _names(session, Author, Author.name, (a for a, _ in path))
+    titles = _names(session, Paper, Paper.paper_title, (p for _, p in path if p is not None))
+    return {
+        "found": True,
+        "length": len(path) - 1,
+        "path": [
+            {"id": a, "name": names.get(a), "via_paper": {"id": p, "title": titles.get(p)} if p is not None else None}
+            for a, p in path
+        ],
+    }
+
+
+def load_top_affiliations(session: Session, limit: Optional[int] = None) -> List[dict]:
+    rows = graph_index.get(session).top_affiliations(clamp_graph_limit(limit))
+    names = _names(session, Affiliation, Affiliation.name, (x["affiliation_id"] for x in rows))
+    return [{**x, "name": names.get(x["affiliation_id"])} for x in rows]
+
+
+def load_network_papers(session: Session, user_id: int, depth: int = 1, limit: Optional[int] = None) -> dict:
+    """
+    「我的 network」= 這位 user 報告過的 paper 的作者，加上往外 depth 步的 co-author；
+    回傳他們寫的、這位 user 還沒報告過的 paper。
+    """
+    depth = max(0, min(depth, settings.GRAPH_MAX_PATH_DEPTH))
+    reported = {p for p in session.exec(select(Report.paper_id).where(Report.user_id == user_id)).all() if p}
+    graph = graph_index.get(session)
+    seeds = {a for p in reported for a in graph.paper_authors.neighbors(p)}
+    network = graph.network(seeds, depth)
+    top = graph.network_papers(seeds, depth, reported, clamp_graph_limit(limit))
+    papers = {
+        pid: (title, year)
+        for pid, title, year in session.exec(
+            select(Paper.id, Paper.paper_title, Paper.published_year).where(Paper.id.in_([p for p, _ in top]))
+        ).all()
+    } if top else {}
+    return {
+        "seed_authors": len(seeds),
+        "network_size": len(network),
+        "papers": [
+            {"id": p, "title": papers.get(p, (None, None))[0], "published_year": papers.get(p, (None, None))[1], "network_authors": n}
+            for p, n in top
+        ],
+    }
+
+
+def graph_stats(session: Session) -> dict:
+    return graph_index.get(session).stats()
@@ -0,0 +1,378 @@
+# ingest.py
+# /upload 寫入流程：整個 report 一個 transaction，名稱一次 IN (...) 查完，缺的用 INSERT ... ON CONFLICT DO NOTHING 補
+
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from .cache import cache_after_commit, name_cache_for
+from .db import insert_for
+from .graph import graph_after_commit
+from .jobs import enqueue, job_handler
+from .models import (
+    ActivityCounter,
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    Comment,
+    LabMeeting,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+    TagStats,
+)
+
+def clean_names(values: Iterable) -> List[str]:
+    """去掉前後空白，空白的名稱直接丟掉（upload 表單與 bulk import 共用）"""
+    return [n for n in (str(v).strip() for v in values if v is not None) if n]
+
+
+def split_names(raw: Optional[str]) -> List[str]:
+    return clean_names((raw or "").split(","))
+
+
+def _unique(names: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(n for n in names if n))
+
+
+# ---------------- bulk name resolution ----------------
+def resolve_names(session: Session, model, names: Iterable[str], column=None, make_row=None) -> Dict[str, int]:
+    """
+    Author / Affiliation / Tag（或 column=User.username 時的 User）的 name -> id。
+    先查 name cache，其餘一次 IN (...)；缺的用一個 multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING 補，
+    只有被同時寫入的人搶先建立的名稱才再查一次。make_row(name) 提供新增列的其他欄位。
+    """
+    col = column if column is not None else model.name
+    cache = name_cache_for(model) if column is None else None
+    names = _unique(names)
+    if not names:
+        return {}
+    ids: Dict[str, int] = {}
+    if cache is not None:
+        for n in names:
+            cached = cache.get(n)
+            if cached is not None:
+                ids[n] = cached
+    lookup = [n for n in names if n not in ids]
+    if lookup:
+        found = dict(session.exec(select(col, model.id).where(col.in_(lookup))).all())
+        ids.update(found)
+        if cache is not None:
+            for n, row_id in found.items():
+                cache.set(n, row_id)
+    missing = [n for n in lookup if n not in ids]
+    if missing:
+        # executemany 形式：SQLAlchemy 會批次成 multi-row VALUES，且 compiled SQL 可被 cache
+        table = model.__table__
+        stmt = insert_for(session, model).on_conflict_do_nothing().returning(table.c.id, table.c[col.key])
+        rows = [make_row(n) if make_row else {col.key: n} for n in missing]
+        for row_id, name in session.execute(stmt, rows).all():
+            ids[name] = row_id
+        if cache is not None:
+            for n in missing:
+                if n in ids:
+                    cache_after_commit(session, cache, n, ids[n])
+        lost = [n for n in missing if n not in ids]
+        if lost:
+            ids.update(session.exec(select(col, model.id).where(col.in_(lost))).all())
+    return ids
+
+
+def insert_links(session: Session, model, rows: List[dict], returning: bool = False):
+    """
+    link table 的 composite PK 本身就擋重複，已存在的列直接略過。
+    returning=True 時回傳實際新增的列（dict）。
+    """
+    rows = list({tuple(r.items()): r for r in rows}.values())
+    if not rows:
+        return []
+    stmt = insert_for(session, model).on_conflict_do_nothing()
+    if not returning:
+        session.execute(stmt, rows)
+        return []
+    return [dict(r._mapping) for r in session.execute(stmt.returning(*model.__table__.c), rows).all()]
+
+
+# ---------------- tag stats ----------------
+# TagStats 在寫入的同一個 transaction 以 delta 累加（INSERT ... ON CONFLICT DO UPDATE），
+# 同時寫入的 upload 不會互相蓋掉；/tags 目錄只讀 tagstats，不做 GROUP BY。
+def bump_tag_stats(session: Session, paper_deltas: Dict[int, int], report_deltas: Dict[int, int]):
+    """tag_id -> 增加的 paper / report 數；呼叫端負責 commit"""
+    tag_ids = set(paper_deltas) | set(report_deltas)
+    if not tag_ids:
+        return
+    table = TagStats.__table__
+    stmt = insert_for(session, TagStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.tag_id],
+        set_={
+            "paper_count": table.c.paper_count + stmt.excluded.paper_count,
+            "report_count": table.c.report_count + stmt.excluded.report_count,
+        },
+    )
+    session.execute(stmt, [
+        {"tag_id": t, "paper_count": paper_deltas.get(t, 0), "report_count": report_deltas.get(t, 0)}
+        for t in sorted(tag_ids)  # 固定順序鎖 row，避免兩個 upload 互相 deadlock
+    ])
+
+
+def tag_stats_deltas(session: Session, new_links: Iterable[tuple], report_paper_ids: Iterable[Optional[int]]):
+    """
+    回傳 (paper_deltas, report_deltas)。
+    new_links: 這次新增的 (paper_id, tag_id)；report_paper_ids: 這次新增的 reports 的 paper_id。
+    新 link 讓該 paper 的所有 reports（含這次新增的）都多一個 tag；
+    新 report 則只對 paper 原本就有的 tag 計數，避免與前者重複。
+    新的列 flush 之後、commit 之前呼叫。
+    """
+    new_links = set(new_links)
+    paper_deltas = Counter(tag_id for _, tag_id in new_links)
+    report_deltas: Counter = Counter()
+
+    linked_papers = list({paper_id for paper_id, _ in new_links})
+    if linked_papers:
+        counts = dict(session.exec(
+            select(Report.paper_id, func.count(Report.id))
+            .where(Report.paper_id.in_(linked_papers))
+            .group_by(Report.paper_id)
+        ).all())
+        for paper_id, tag_id in new_links:
+            report_deltas[tag_id] += counts.get(paper_id, 0)
+
+    reports_per_paper = Counter(p for p in report_paper_ids if p)
+    if reports_per_paper:
+        for paper_id, tag_id in session.exec(
+            select(PaperTag.paper_id, PaperTag.tag_id).where(PaperTag.paper_id.in_(list(reports_per_paper)))
+        ).all():
+            if (paper_id, tag_id) not in new_links:
+                report_deltas[tag_id] += reports_per_paper[paper_id]
+    return paper_deltas, report_deltas
+
+
+def update_tag_stats(session: Session, new_links: Iterable[tuple], report_paper_ids: Iterable[Optional[int]]):
+    """tag_stats_deltas() 之後直接累加（bulk import 用；upload 改由 counters job 累加）"""
+    bump_tag_stats(session, *tag_stats_deltas(session, new_links, report_paper_ids))
+
+
+# ---------------- activity counters ----------------
+# /stats dashboard 的 summary table；key 的算法只寫在這裡，incremental 與 rebuild 共用
+NO_VENUE = "(none)"
+
+
+def report_counters(user_id, meeting_id, paper_id, created_at, year=None, venue=None) -> Counter:
+    c: Counter = Counter()
+    c[("presenter", str(user_id), "reports")] += 1
+    c[("month", created_at.strftime("%Y-%m"), "reports")] += 1
+    c[("meeting", str(meeting_id), "reports")] += 1
+    if paper_id:
+        c[("paper", str(paper_id), "reports")] += 1
+        c[("year", str(year), "reports")] += 1
+        c[("venue", venue or NO_VENUE, "reports")] += 1
+    return c
+
+
+def comment_counters(created_at, user_id, meeting_id, paper_id, year=None, venue=None) -> Counter:
+    """user_id / meeting_id / paper_id 是被留言的 report 的欄位"""
+    c: Counter = Counter()
+    c[("presenter", str(user_id), "comments")] += 1
+    c[("month", created_at.strftime("%Y-%m"), "comments")] += 1
+    c[("meeting", str(meeting_id), "comments")] += 1
+    if paper_id:
+        c[("paper", str(paper_id), "comments")] += 1
+        c[("year", str(year), "comments")] += 1
+        c[("venue", venue or NO_VENUE, "comments")] += 1
+    return c
+
+
+def bump_counters(session: Session, deltas: Counter):
+    """(dimension, key, metric) -> delta，upsert 累加；呼叫端負責 commit"""
+    if not deltas:
+        return
+    table = ActivityCounter.__table__
+    stmt = insert_for(session, ActivityCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.dimension, table.c.key, table.c.metric],
+        set_={"value": table.c.value + stmt.excluded.value},
+    )
+    session.execute(stmt, [
+        {"dimension": d, "key": k, "metric": m, "value": v}
+        for (d, k, m), v in sorted(deltas.items())  # 固定順序鎖 row，避免 deadlock
+    ])
+
+
+# upload / comment 不在 request 裡累加：deltas 跟著寫入的 transaction 排成 counters job，
+# 熱門的 row（例如本月的 "month" counter）不會讓同時寫入的 request 互相等 row lock。
+def enqueue_counters(session: Session, activity: Counter, tag_papers: Optional[Dict[int, int]] = None,
+                     tag_reports: Optional[Dict[int, int]] = None):
+    enqueue(session, "counters", {
+        "activity": [[d, k, m, v] for (d, k, m), v in sorted(activity.items())],
+        "tag_papers": tag_papers or {},
+        "tag_reports": tag_reports or {},
+    })
+
+
+@job_handler("counters")
+def apply_counters(session: Session, payload: dict):
+    bump_counters(session, Counter({(d, k, m): v for d, k, m, v in payload["activity"]}))
+    # JSON 的 key 一定是字串
+    bump_tag_stats(
+        session,
+        {int(t): n for t, n in payload["tag_papers"].items()},
+        {int(t): n for t, n in payload["tag_reports"].items()},
+    )
+
+
+def add_comment(session: Session, report_id: int, user_id: int, content: str) -> Comment:
+    """寫入 comment，activity counters 的 delta 排進同一個 transaction 的 job；report 不存在時丟 ValueError"""
+    target = session.exec(
+        select(Report.user_id, Report.meeting_id, Report.paper_id, Paper.published_year, Paper.journal_or_conference)
+        .outerjoin(Paper, Paper.id == Report.paper_id)
+        .where(Report.id == report_id)
+    ).first()
+    if target is None:
+        raise ValueError("Report not found")
+    try:
+        c = Comment(report_id=report_id, user_id=user_id, content=content)
+        session.add(c)
+        session.flush()
+        enqueue_counters(session, comment_counters(c.created_at, *target))
+        # 不讓 commit expire c：呼叫端（comment stream）讀 id / created_at 時不必再查一次
+        session.expunge(c)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return c
+
+
+# ---------------- form -> upload dict ----------------
+def _int_or_none(raw) -> Optional[int]:
+    return int(raw) if raw and str(raw).isdigit() else None
+
+
+def parse_upload_form(form) -> dict:
+    """把 upload.html 的表單整理成 ingest_report() 吃的 dict"""
+    authors = []
+    idx = 0
+    while form.get(f"author_name_{idx}"):
+        name = form.get(f"author_name_{idx}").strip()
+        if name:  # 只有空白的欄位略過，不建立沒有名字的 author
+            authors.append({"name": name, "affiliations": split_names(form.get(f"author_affiliations_{idx}"))})
+        idx += 1
+
+    meeting_date = None
+    if form.get("meeting_date"):
+        try:
+            meeting_date = datetime.fromisoformat(form.get("meeting_date")).date()
+        except ValueError:
+            pass
+
+    return {
+        "report_title": form.get("report_title"),
+        "report_summary": form.get("report_summary", ""),
+        "slides_link": form.get("slides_link", ""),
+        "meeting_id": _int_or_none(form.get("existing_meeting_id")),
+        "meeting": {
+            "meeting_title": form.get("meeting_title"),
+            "meeting_date": meeting_date,
+            "meeting_location": form.get("meeting_location"),
+        },
+        "paper_id": _int_or_none(form.get("existing_paper_id") or form.get("paper_id")),
+        "paper": {
+            "paper_title": form.get("paper_title"),
+            "published_year": _int_or_none(form.get("published_year")) or 0,
+            "published_month": _int_or_none(form.get("published_month")) or 0,
+            "journal_or_conference": form.get("journal_or_conference") or "",
+        },
+        "authors": authors,
+        "tags": split_names(form.get("tags")),
+    }
+
+
+# ---------------- ingest ----------------
+def add_paper_links(session: Session, paper_id: int, authors: List[dict], tags: List[str]) -> List[int]:
+    """建立 paper 的 author / affiliation / tag 與所有 link，每種 entity 各一次 lookup；回傳 tag ids"""
+    author_ids = resolve_names(session, Author, (a["name"] for a in authors))
+    aff_ids = resolve_names(session, Affiliation, (aff for a in authors for aff in a["affiliations"]))
+    author_aff = [
+        {"author_id": author_ids[a["name"]], "affiliation_id": aff_ids[aff]}
+        for a in authors for aff in a["affiliations"]
+    ]
+    paper_author = [{"paper_id": paper_id, "author_id": author_ids[a["name"]]} for a in authors]
+    insert_links(session, AuthorAffiliationLink, author_aff)
+    insert_links(session, PaperAuthorLink, paper_author)
+    graph_after_commit(session, paper_author, author_aff)
+    tag_ids = resolve_names(session, Tag, tags)
+    insert_links(session, PaperTag, [
+        {"paper_id": paper_id, "tag_id": tag_id} for tag_id in tag_ids.values()
+    ])
+    return list(tag_ids.values())
+
+
+def ingest_report(session: Session, user_id: Optional[int], data: dict) -> Report:
+    """
+    一次 commit 寫入 meeting / paper / authors / affiliations / tags / links / report。
+    任何一步失敗整個 rollback，不會留下沒有 report 的 meeting / paper。
+    """
+    if not data.get("report_title"):
+        raise ValueError("A report title is required")
+    try:
+        meeting_id = data.get("meeting_id")
+        meeting_data = data.get("meeting") or {}
+        if not meeting_id and meeting_data.get("meeting_title"):
+            meeting = LabMeeting(
+                meeting_title=meeting_data["meeting_title"],
+                meeting_date=meeting_data.get("meeting_date") or date.today(),
+                meeting_location=meeting_data.get("meeting_location") or "",
+            )
+            session.add(meeting)
+            session.flush()
+            meeting_id = meeting.id
+        if not meeting_id:
+            raise ValueError("A meeting is required")
+        if data.get("meeting_id") and session.get(LabMeeting, meeting_id) is None:
+            raise ValueError(f"Meeting {meeting_id} does not exist")
+
+        paper_id = data.get("paper_id")
+        paper_data = data.get("paper") or {}
+        if paper_id and session.get(Paper, paper_id) is None:
+            raise ValueError(f"Paper {paper_id} does not exist")
+        if not paper_id and paper_data.get("paper_title"):
+            paper = Paper(**paper_data)
+            session.add(paper)
+            session.flush()
+            paper_id = paper.id
+            new_tag_ids = add_paper_links(session, paper_id, data.get("authors", []), data.get("tags", []))
+        else:
+            new_tag_ids = None
+
+        r = Report(
+            report_title=data["report_title"],
+            report_summary=data.get("report_summary") or "",
+            slides_link=data.get("slides_link") or "",
+            user_id=user_id,
+            meeting_id=meeting_id,
+            paper_id=paper_id,
+        )
+        session.add(r)
+        session.flush()
+        paper = session.get(Paper, paper_id) if paper_id else None
+        if new_tag_ids is not None:
+            # 新 paper：每個 tag 都是新 link，且這份 report 是它唯一的 report
+            tag_papers, tag_reports = {t: 1 for t in new_tag_ids}, {t: 1 for t in new_tag_ids}
+        else:
+            tag_papers, tag_reports = tag_stats_deltas(session, [], [paper_id])
+        enqueue_counters(session, report_counters(
+            user_id, meeting_id, paper_id, r.created_at,
+            paper.published_year if paper else None, paper.journal_or_conference if paper else None,
+        ), tag_papers, tag_reports)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    session.refresh(r)
+    return r
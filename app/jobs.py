@@ -0,0 +1,339 @@
+# jobs.py
+# DB-backed background jobs。寫入端在自己的 transaction 裡 enqueue()：commit 才算數，rollback 就一起消失。
+# runner 以 UPDATE job ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) 領取，多個 process 不會拿到同一個；
+# SQLite 沒有 row lock（FOR UPDATE 不會編譯出來），同一個 UPDATE 在資料庫的 write lock 下執行，一樣不會重複領取。
+# handler 在 thread pool（預設）或 process pool 裡執行；handler 的寫入與「job 完成」是同一個 commit。
+
+import importlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, event, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, create_engine, select
+
+from . import db
+from .config import settings
+from .db import insert_for
+from .metrics import JOB_DEPTH, JOB_LAG_SECONDS, JOB_SECONDS, JOBS_PROCESSED
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# handler 註冊在各自的 module 裡，runner 啟動時先 import
+HANDLER_MODULES = ("app.ingest", "app.recommend")
+DEPTH_REFRESH_SECONDS = 5
+CLEANUP_SECONDS = 600
+MAX_ERROR_CHARS = 2000
+
+HANDLERS: Dict[str, Callable[[Session, dict], None]] = {}
+
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def job_handler(kind: str):
+    """@job_handler("kind") 註冊 fn(session, payload)；fn 不 commit，由 runner 連同 job 狀態一起 commit"""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+# ---------------- enqueue ----------------
+_WAKE_KEY = "jobs_enqueued"
+
+
+def enqueue(session: Session, kind: str, payload: Optional[dict] = None, dedup_key: Optional[str] = None,
+            delay: float = 0, max_attempts: Optional[int] = None):
+    """
+    加進 session 目前的 transaction，呼叫端 commit。
+    dedup_key 相同的 job 還在排隊時不會再加一個（已經在跑的不算，跑完之後的變更仍會有人處理）。
+    """
+    now = datetime.utcnow()
+    session.execute(insert_for(session, Job).on_conflict_do_nothing().values(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        dedup_key=dedup_key,
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+    ))
+    session.info[_WAKE_KEY] = True
+
+
+def enqueue_detached(session: Session, kind: str, payload: Optional[dict] = None, dedup_key: Optional[str] = None):
+    """用另一個 session 寫入並 commit：呼叫端只是在讀資料，不該為了排一個 job commit 自己的 transaction（讀的可能是 replica）"""
+    with Session(db.primary_bind(session)) as own:
+        enqueue(own, kind, payload, dedup_key)
+        own.commit()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_runner(session):
+    if session.info.pop(_WAKE_KEY, False):
+        job_runner.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_wake(session):
+    session.info.pop(_WAKE_KEY, None)
+
+
+# ---------------- claim / run ----------------
+def claim_jobs(session: Session, worker_id: str, limit: int) -> List[dict]:
+    """把最多 limit 個到期的 job 標成 running 並回傳；running 太久的（worker 當掉）也會被重新領取"""
+    now = datetime.utcnow()
+    due = (
+        select(Job.id)
+        .where(or_(
+            and_(Job.status == "queued", Job.run_at <= now),
+            and_(Job.status == "running", Job.locked_at < now - timedelta(seconds=settings.JOB_TIMEOUT_SECONDS)),
+        ))
+        .order_by(Job.run_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = session.execute(
+        update(Job)
+        .where(Job.id.in_(due))
+        .values(status="running", locked_at=now, locked_by=worker_id, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.kind, Job.payload, Job.run_at, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    session.commit()
+    return [{**row._mapping, "worker_id": worker_id} for row in sorted(rows, key=lambda r: r.id)]
+
+
+def _mark(session: Session, job: dict, **values) -> int:
+    """只更新仍由這個 worker 持有的 job；被重新領取或被刪掉（rebuild_stats）時回傳 0"""
+    return session.execute(
+        update(Job)
+        .where(Job.id == job["id"], Job.status == "running", Job.locked_by == job["worker_id"])
+        .values(locked_at=None, locked_by=None, **values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def run_job(job: dict) -> tuple:
+    """在 pool 裡執行，回傳 (outcome, seconds)；process pool 時 job / 回傳值都要能 pickle"""
+    started = time.perf_counter()
+    with Session(db.engine) as session:
+        try:
+            handler = HANDLERS.get(job["kind"])
+            if handler is None:
+                raise LookupError(f"no handler for job kind {job['kind']!r}")
+            handler(session, json.loads(job["payload"]))
+            if not _mark(session, job, status="done", finished_at=datetime.utcnow(), last_error=None):
+                session.rollback()
+                return "cancelled", time.perf_counter() - started
+            session.commit()
+            return "done", time.perf_counter() - started
+        except Exception as e:
+            session.rollback()
+            logger.warning("job %s (%s) attempt %d/%d failed", job["id"], job["kind"], job["attempts"], job["max_attempts"], exc_info=True)
+            return _retry_or_fail(session, job, e), time.perf_counter() - started
+
+
+def _retry_or_fail(session: Session, job: dict, error: Exception) -> str:
+    now = datetime.utcnow()
+    message = f"{type(error).__name__}: {error}"[:MAX_ERROR_CHARS]
+    if job["attempts"] >= job["max_attempts"]:
+        outcome, values = "failed", {"status": "failed", "finished_at": now}
+    else:
+        backoff = settings.JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1)
+        outcome, values = "retry", {"status": "queued", "run_at": now + timedelta(seconds=backoff)}
+    try:
+        _mark(session, job, last_error=message, **values)
+        session.commit()
+    except IntegrityError:
+        # 同一個 dedup_key 已經有新的 job 在排隊，由它處理
+        session.rollback()
+        _mark(session, job, status="done", finished_at=now, last_error=f"{message} (superseded)")
+        session.commit()
+        outcome = "superseded"
+    return outcome
+
+
+def run_until_empty(worker_id: Optional[str] = None, limit: int = 20) -> Dict[str, int]:
+    """在目前的 thread 裡把到期的 job 跑完（scripts/run_jobs.py --once）"""
+    load_handlers()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:once"
+    outcomes: Dict[str, int] = {}
+    while True:
+        with Session(db.engine) as session:
+            jobs = claim_jobs(session, worker_id, limit)
+        if not jobs:
+            return outcomes
+        for job in jobs:
+            outcome, _ = run_job(job)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+
+# ---------------- stats / cleanup ----------------
+def queue_depth(session: Session) -> Dict[tuple, int]:
+    rows = session.execute(
+        select(Job.status, Job.kind, func.count())
+        .where(Job.status.in_(("queued", "running", "failed")))
+        .group_by(Job.status, Job.kind)
+    ).all()
+    return {(status, kind): n for status, kind, n in rows}
+
+
+def job_stats(session: Session) -> dict:
+    depth: Dict[str, Dict[str, int]] = {}
+    for (status, kind), n in queue_depth(session).items():
+        depth.setdefault(status, {})[kind] = n
+    return {"depth": depth, "runner": job_runner.stats()}
+
+
+def delete_finished(session: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.JOB_KEEP_DONE_SECONDS)
+    n = session.execute(delete(Job).where(Job.status == "done", Job.finished_at < cutoff)).rowcount
+    session.commit()
+    return n
+
+
+# ---------------- runner ----------------
+def _init_process():
+    """process pool 的 worker：fork 來的 connection pool 不能共用，換一個新的"""
+    load_handlers()
+    if db.engine is not None:
+        db.engine.dispose(close=False)
+    else:
+        db.engine = create_engine(settings.DATABASE_URL, **db.engine_options(settings.DATABASE_URL, "primary"))
+
+
+class JobRunner:
+    """
+    一條 polling thread 領取 job、丟給 pool 執行；pool 滿了就不再領。
+    同一個 process 裡 enqueue 的 job commit 後會叫醒它，其他 process 的 job 最慢 JOB_POLL_SECONDS 之後處理。
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool = None
+        self._broken = False
+        self.workers = 0
+        self.inflight = 0
+        self.claimed = 0
+        self._depth_at = 0.0
+        self._cleanup_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _make_pool(self):
+        if settings.JOB_POOL == "process":
+            return ProcessPoolExecutor(self.workers, initializer=_init_process)
+        if settings.JOB_POOL == "thread":
+            return ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        raise ValueError(f"JOB_POOL must be 'thread' or 'process', got {settings.JOB_POOL!r}")
+
+    def start(self):
+        if self.running:
+            return
+        load_handlers()
+        # fork 之後 pid 才確定（uvicorn --workers）
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.workers = max(1, settings.JOB_WORKERS)
+        self._pool = self._make_pool()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        """不再領新的 job，等執行中的跑完"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._pool.shutdown(wait=True)
+        self._thread = self._pool = None
+
+    def wake(self):
+        self._wake.set()
+
+    def stats(self) -> dict:
+        return {"running": self.running, "worker_id": self.worker_id, "pool": settings.JOB_POOL,
+                "workers": self.workers, "inflight": self.inflight, "claimed": self.claimed}
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.poll()
+            except Exception:
+                logger.exception("job runner poll failed")
+                claimed = 0
+            if not claimed:
+                self._wake.wait(settings.JOB_POLL_SECONDS)
+                self._wake.clear()
+
+    def poll(self) -> int:
+        self._housekeeping()
+        if self._broken:
+            # process pool 的 worker 被殺掉之後整個 pool 不能用，換一個
+            self._pool.shutdown(wait=False)
+            self._pool, self._broken = self._make_pool(), False
+        with self._lock:
+            free = self.workers - self.inflight
+        if free <= 0:
+            return 0
+        with Session(db.engine) as session:
+            jobs = claim_jobs(session, self.worker_id, free)
+        now = datetime.utcnow()
+        for job in jobs:
+            JOB_LAG_SECONDS.observe((job["kind"],), max(0.0, (now - job["run_at"]).total_seconds()))
+            with self._lock:
+                self.inflight += 1
+                self.claimed += 1
+            self._pool.submit(run_job, job).add_done_callback(partial(self._done, job["kind"]))
+        return len(jobs)
+
+    def _done(self, kind: str, future):
+        try:
+            outcome, seconds = future.result()
+            JOB_SECONDS.observe((kind,), seconds)
+        except BrokenExecutor:
+            # job 還是 running，JOB_TIMEOUT_SECONDS 之後會被重新領取
+            outcome = "crashed"
+            self._broken = True
+        except Exception:
+            logger.exception("job %s crashed", kind)
+            outcome = "crashed"
+        JOBS_PROCESSED.inc((kind, outcome))
+        with self._lock:
+            self.inflight -= 1
+        self._wake.set()
+
+    def _housekeeping(self):
+        now = time.monotonic()
+        if now - self._depth_at < DEPTH_REFRESH_SECONDS:
+            return
+        self._depth_at = now
+        with Session(db.engine) as session:
+            JOB_DEPTH.replace(queue_depth(session))
+            if now - self._cleanup_at >= CLEANUP_SECONDS:
+                self._cleanup_at = now
+                delete_finished(session)
+
+
+job_runner = JobRunner()
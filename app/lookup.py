@@ -0,0 +1,246 @@
+# lookup.py
+# /upload 的 typeahead：paper / meeting / author / affiliation / tag 以名稱 prefix + fuzzy 查詢，
+# 回傳少量排序好的結果，表單不再把整張表 render 成 <select>。
+# Postgres 走 pg_trgm index（ILIKE 'q%' 與 %> 都用得到）；LOOKUP_TRIE=true 時 prefix 先查 in-memory trie。
+
+import heapq
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, false, func, literal, or_
+from sqlmodel import Session, select
+
+from .config import settings
+from .models import Affiliation, Author, LabMeeting, Paper, Tag
+from .search import TRGM_THRESHOLD, trigrams, word_similarity
+
+DEFAULT_LOOKUP_LIMIT = 10
+MAX_LOOKUP_LIMIT = 50
+
+# trie 每個 node 最多保留幾個候選 id（短的名稱優先），避免 1 個字元的 prefix 掃整棵子樹
+TRIE_NODE_CAP = 256
+
+# kind -> (model, label column, detail column or None)
+LOOKUPS = {
+    "paper": (Paper, Paper.paper_title, Paper.published_year),
+    "meeting": (LabMeeting, LabMeeting.meeting_title, LabMeeting.meeting_date),
+    "author": (Author, Author.name, None),
+    "affiliation": (Affiliation, Affiliation.name, None),
+    "tag": (Tag, Tag.name, None),
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def words(s: str) -> List[str]:
+    return _WORD_RE.findall((s or "").lower())
+
+
+def clamp_lookup_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_LOOKUP_LIMIT
+    return min(limit, MAX_LOOKUP_LIMIT)
+
+
+def _escape_like(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _item(row_id: int, label: str, detail, score: float) -> dict:
+    return {"id": row_id, "label": label, "detail": str(detail) if detail is not None else None, "score": round(score, 4)}
+
+
+def rank(q: str, label: str) -> float:
+    """整個名稱以 q 開頭 > 某個字以 q 開頭 > 只有 fuzzy；同分時 caller 再比長度"""
+    lowered = (label or "").lower()
+    if lowered.startswith(q.lower()):
+        return 2.0
+    q_words = words(q)
+    label_words = words(label)
+    if q_words and all(any(w.startswith(qw) for w in label_words) for qw in q_words):
+        return 1.0
+    return word_similarity(trigrams(q), label)
+
+
+# ---------------- DB ----------------
+def _word_prefix_condition(col, q: str):
+    """q 的每個字都要是名稱中某個字的開頭（"neu mes" 可以找到 "Neural Message Passing"）"""
+    conds = []
+    for w in words(q):
+        escaped = _escape_like(w)
+        conds.append(or_(col.ilike(escaped + "%", escape="\\"), col.ilike("% " + escaped + "%", escape="\\")))
+    return and_(*conds) if conds else false()
+
+
+def _lookup_db(session: Session, kind: str, q: str, limit: int) -> List[dict]:
+    model, col, detail = LOOKUPS[kind]
+    prefix = _escape_like(q) + "%"
+    detail_col = detail if detail is not None else literal(None)
+    word_match = _word_prefix_condition(col, q)
+    is_prefix = case((col.ilike(prefix, escape="\\"), 2), (word_match, 1), else_=0)
+
+    if session.get_bind().dialect.name == "postgresql":
+        # ILIKE 與 %> 都吃 gin_trgm_ops index；word_similarity 補 fuzzy 的排序
+        cond = or_(col.ilike(prefix, escape="\\"), word_match, col.op("%>")(q))
+        score = is_prefix + func.word_similarity(q, col)
+    else:
+        # 沒有 pg_trgm：只做 prefix / word prefix，fuzzy 由 trie 補
+        cond = or_(col.ilike(prefix, escape="\\"), word_match)
+        score = is_prefix
+
+    rows = session.exec(
+        select(model.id, col, detail_col, score.label("score"))
+        .where(cond)
+        .order_by(score.desc(), func.length(col), model.id)
+        .limit(limit)
+    ).all()
+    return [_item(row_id, label, d, float(s)) for row_id, label, d, s in rows]
+
+
+# ---------------- in-memory prefix trie ----------------
+class PrefixTrie:
+    """
+    名稱裡每個字的每個 prefix 對應一個 node；node 以 heap 保留 TRIE_NODE_CAP 個最短名稱的 id。
+    名稱只增不改，refresh() 只載入 id 大於上次看到的 row。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.root: Dict = {}
+        self.labels: Dict[int, Tuple[str, object]] = {}
+        self.max_id = 0
+        self.refreshed_at = 0.0
+
+    def refresh(self, session: Session, model, col, detail):
+        detail_col = detail if detail is not None else literal(None)
+        rows = session.exec(
+            select(model.id, col, detail_col).where(model.id > self.max_id).order_by(model.id)
+        ).all()
+        with self._lock:
+            for row_id, label, d in rows:
+                self._insert(row_id, label, d)
+                self.max_id = max(self.max_id, row_id)
+            self.refreshed_at = time.monotonic()
+        return len(rows)
+
+    def _insert(self, row_id: int, label: str, detail):
+        self.labels[row_id] = (label, detail)
+        length = len(label or "")
+        prefixes = {w[:i] for w in words(label) for i in range(1, len(w) + 1)}
+        for prefix in prefixes:
+            node = self.root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            # heap 的頂端是目前最長的名稱 (-長度, -id)：滿了時 O(log k) 換掉它，不必每次掃整個 node
+            heap = node.setdefault("", [])
+            entry = (-length, -row_id)
+            if len(heap) < TRIE_NODE_CAP:
+                heapq.heappush(heap, entry)
+            elif -heap[0][0] > length:
+                heapq.heapreplace(heap, entry)
+
+    def _candidates(self, prefix: str) -> List[int]:
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        return [-neg_id for _, neg_id in node.get("", [])]
+
+    def search(self, q: str, limit: int) -> List[dict]:
+        q_words = words(q)
+        if not q_words:
+            return []
+        with self._lock:
+            # 最長的字最有鑑別度，用它的候選再以 rank() 過濾其他字
+            candidates = self._candidates(max(q_words, key=len))
+            scored = []
+            for row_id in candidates:
+                label, d = self.labels[row_id]
+                score = rank(q, label)
+                if score >= 1.0:
+                    scored.append((-score, len(label), row_id, label, d))
+        scored.sort()
+        return [_item(row_id, label, d, -neg) for neg, _, row_id, label, d in scored[:limit]]
+
+
+class LookupIndex:
+    def __init__(self):
+        self.tries = {kind: PrefixTrie() for kind in LOOKUPS}
+
+    def warm(self, session: Session):
+        for kind, (model, col, detail) in LOOKUPS.items():
+            self.tries[kind].refresh(session, model, col, detail)
+
+    def refresh_if_stale(self, session: Session, kind: str):
+        """其他 worker 寫入的名稱最多延遲 LOOKUP_TRIE_REFRESH_SECONDS 才看得到"""
+        trie = self.tries[kind]
+        if time.monotonic() - trie.refreshed_at > settings.LOOKUP_TRIE_REFRESH_SECONDS:
+            model, col, detail = LOOKUPS[kind]
+            trie.refresh(session, model, col, detail)
+
+    def clear(self):
+        self.tries = {kind: PrefixTrie() for kind in LOOKUPS}
+
+
+lookup_index = LookupIndex()
+
+
+# ---------------- public API ----------------
+def lookup(session: Session, kind: str, q: str, limit: Optional[int] = None) -> List[dict]:
+    """
+    [{"id", "label", "detail", "score"}]，score 高的在前。
+    kind 不存在時丟 ValueError。
+    """
+    if kind not in LOOKUPS:
+        raise ValueError(f"unknown lookup kind: {kind}")
+    q = (q or "").strip()
+    limit = clamp_lookup_limit(limit)
+    if not q:
+        return []
+
+    results: List[dict] = []
+    if settings.LOOKUP_TRIE:
+        lookup_index.refresh_if_stale(session, kind)
+        results = lookup_index.tries[kind].search(q, limit)
+        if len(results) >= limit:
+            return results
+
+    seen = {r["id"] for r in results}
+    for item in _lookup_db(session, kind, q, limit):
+        if item["id"] not in seen:
+            results.append(item)
+            seen.add(item["id"])
+
+    if len(results) < limit and session.get_bind().dialect.name != "postgresql":
+        results.extend(_fuzzy_fallback(session, kind, q, limit - len(results), seen))
+    return results[:limit]
+
+
+def _fuzzy_fallback(session: Session, kind: str, q: str, limit: int, seen) -> List[dict]:
+    """非 Postgres 的 fuzzy：只看 trie 已載入的名稱（沒開 trie 時不做）"""
+    if not settings.LOOKUP_TRIE:
+        return []
+    q_grams = trigrams(q)
+    trie = lookup_index.tries[kind]
+    scored = []
+    with trie._lock:
+        for row_id, (label, d) in trie.labels.items():
+            if row_id in seen:
+                continue
+            score = word_similarity(q_grams, label)
+            if score >= TRGM_THRESHOLD:
+                scored.append((score, row_id, label, d))
+    scored.sort(key=lambda x: (-x[0], len(x[2] or "")))
+    return [_item(row_id, label, d, score) for score, row_id, label, d in scored[:limit]]
+
+
+def refresh_lookup_index(session: Session):
+    """upload / import 之後呼叫，把新名稱補進 trie（沒開 trie 時不做事）"""
+    if settings.LOOKUP_TRIE:
+        lookup_index.warm(session)
@@ -1,12 +1,80 @@
 # main.py
 
-from fastapi import FastAPI, Request, Depends, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+# 第一個 import：冷啟動的計時從這裡開始
+from .startup import (
+    ReadinessMiddleware,
+    load_all_templates,
+    preload_lazy_modules,
+    startup,
+    template_bytecode_cache,
+)
+from fastapi import BackgroundTasks, FastAPI, Request, Depends, Form, HTTPException, UploadFile, File
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from sqlmodel import select, Session, SQLModel
+from sqlalchemy.orm import joinedload, selectinload
 from .config import settings
-from .db import engine, create_db_and_tables, get_session
+from . import db
+from .db import (
+    auto_migrate, init_db, get_read_session, get_session, get_sync_session, mark_write, pool_stats, pool_state,
+    replica_router, run_db, run_in_session, wait_for_db,
+)
+from .feed import load_feed_page
+from .query import prepare_query, run_filter_query
+from .export import FORMATS as EXPORT_FORMATS, stream_export
+from .search import index_report, invalidate_index, search_reports
+from .comments import (
+    comment_broadcaster,
+    comment_item,
+    comment_stream,
+    load_comment_page,
+    load_report_comments,
+    load_stream_start,
+    publish_comment,
+    start_cursor,
+)
+from .feed import decode_cursor
+from .attachments import (
+    AttachmentTooLarge,
+    attachment_response,
+    check_report,
+    clean_filename,
+    iter_upload,
+    list_attachments,
+    load_attachment,
+    save_attachment,
+    store_stream,
+    thumbnail_response,
+)
+from .ingest import add_comment, ingest_report, parse_upload_form
+from .bulk_import import DEFAULT_BATCH_SIZE, detect_format, import_stream
+from .tags import load_tag_directory, load_tag_page
+from .stats import load_dashboard
+from .recommend import load_related_reports, refresh_related, related_version
+from .graph import (
+    graph_stats,
+    load_collaboration_path,
+    load_coauthors,
+    load_network_papers,
+    load_top_affiliations,
+)
+from .metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, POOL_CONNECTIONS, STARTUP_SECONDS, MetricsMiddleware, TimedTemplates, render_metrics,
+)
+from .jobs import job_runner, job_stats
+from .lookup import lookup, lookup_index, refresh_lookup_index
+from .cache import cache_stats, get_cached_user, invalidate_user, user_snapshot
+from .page_cache import (
+    cached_page,
+    feed_version,
+    invalidate_all_pages,
+    invalidate_feed_pages,
+    invalidate_report_pages,
+    page_cache,
+    report_version,
+)
 from .models import (
     User,
     LabMeeting,
@@ -21,357 +89,631 @@ from .models import (
     PaperTag
 )
 
+from datetime import date
 from typing import List, Optional
+import asyncio
+import json
+import threading
 import uvicorn
 
 app = FastAPI()
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
-templates = Jinja2Templates(directory="templates")
+if settings.FAST_STARTUP:
+    app.add_middleware(ReadinessMiddleware)
+if settings.METRICS_ENABLED:
+    # 最後加的在最外層：量到的時間包含 session middleware
+    app.add_middleware(MetricsMiddleware)
+templates = TimedTemplates(directory="templates")
+if settings.TEMPLATE_BYTECODE_DIR:
+    templates.env.bytecode_cache = template_bytecode_cache(settings.TEMPLATE_BYTECODE_DIR)
 
 # ---------------- startup ----------------
+# FAST_STARTUP=false：startup 裡等 DB 連上（blocking，uvicorn 在這之後才開始收 request）。
+# true：startup 立刻結束，DB probe 與 warm-up 在背景跑，ready 之前除了 /healthz /readyz /metrics 都回 503。
+_startup_tasks = set()
+
+def warm_up():
+    """DB 連上之後、開始服務之前：template 全部載入（bytecode cache）、lookup trie"""
+    load_all_templates(templates.env)
+    startup.mark("templates")
+    if settings.LOOKUP_TRIE:
+        with Session(db.engine) as session:
+            lookup_index.warm(session)
+        startup.mark("lookup_trie")
+
+def finish_startup():
+    if settings.JOB_RUNNER:
+        job_runner.start()
+        startup.mark("job_runner")
+    startup.set_ready(settings.STARTUP_BUDGET_SECONDS)
+    # numpy / scipy 等延後 import 的 module：ready 之後在背景先載入
+    threading.Thread(target=preload_lazy_modules, name="preload", daemon=True).start()
+
+async def prepare_in_background():
+    try:
+        startup.db_attempts = await wait_for_db(on_retry=startup.db_retry)
+        startup.db_error = None
+        startup.mark("db")
+        if settings.AUTO_MIGRATE:
+            await run_in_threadpool(auto_migrate)
+            startup.mark("migrations")
+        await run_in_threadpool(warm_up)
+        finish_startup()
+    except Exception as e:
+        startup.fail(e)
+
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+async def on_startup():
+    startup.mark("imports")
+    if settings.FAST_STARTUP:
+        task = asyncio.create_task(prepare_in_background())
+        _startup_tasks.add(task)
+        task.add_done_callback(_startup_tasks.discard)
+        return
+    init_db()
+    startup.mark("db")
+    warm_up()
+    finish_startup()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    for task in _startup_tasks:
+        task.cancel()
+    job_runner.stop()
+
+@app.get("/healthz")
+async def healthz():
+    """liveness：event loop 有在回應就好；startup 遇到不能重試的錯誤時回 503，讓 orchestrator 重啟"""
+    if startup.error:
+        return JSONResponse({"status": "failed", "error": startup.error}, status_code=503)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """readiness：startup 完成前 503；body 是各階段的時間（冷啟動 budget 用）"""
+    report = startup.report(settings.STARTUP_BUDGET_SECONDS or None)
+    return JSONResponse(report, status_code=200 if startup.ready else 503)
 
 # ---------------- helpers ----------------
-def get_current_user(request: Request, session=Depends(get_session)):
-    username = request.session.get("username")
-    if not username:
-        return None
-    user = session.exec(select(User).where(User.username == username)).first()
-    return user
-
-def get_report_tags(session: Session, report: Report) -> List[Tag]:
-    """
-    取得 report 對應 paper 的 tags，若 report 沒有 paper 回傳空 list
-    """
-    if not report.paper_id:
-        return []
-    paper = session.get(Paper, report.paper_id)
-    if not paper:
-        return []
-    # 使用 selectinload 或直接 access
-    return paper.tags if hasattr(paper, "tags") else []
+# 每個 route 的 DB 工作都寫成 sync 函式 fn(session, ...)，再用 run_db() 執行：
+# DB_ASYNC=true 走 AsyncSession.run_sync，否則丟到 threadpool。
+def load_current_user(session: Session, username: Optional[str]) -> Optional[dict]:
+    """{"id", "username", "display_name"} snapshot，走 app/cache.py 的 user cache"""
+    return get_cached_user(session, username)
 
 # ---------------- index ----------------
+def get_feed_page(session: Session, cursor: Optional[str], limit: Optional[int]):
+    try:
+        return load_feed_page(session, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def load_index(session: Session, username: Optional[str], cursor: Optional[str], limit: Optional[int]):
+    return get_feed_page(session, cursor, limit), load_current_user(session, username)
+
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, session = Depends(get_session)):
-    reports = session.exec(select(Report).order_by(Report.created_at.desc())).all()
-    enriched = []
-    for r in reports:
-        user = session.get(User, r.user_id) if r.user_id else None
-        meeting = session.get(LabMeeting, r.meeting_id) if r.meeting_id else None
-        tags = get_report_tags(session, r)
-        enriched.append({"r": r, "user": user, "meeting": meeting, "tags": tags})
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request, "reports": enriched, "current_user": get_current_user(request, session)}
-    )
+async def index(request: Request, cursor: Optional[str] = None, limit: Optional[int] = None, session = Depends(get_session)):
+    username = request.session.get("username")
+    version, last_modified = await run_db(session, feed_version)
+
+    async def render():
+        (enriched, next_cursor), current_user = await run_db(session, load_index, username, cursor, limit)
+        return templates.TemplateResponse(
+            "index.html",
+            {"request": request, "reports": enriched, "next_cursor": next_cursor, "current_user": current_user}
+        )
+
+    return await cached_page(request, ("feed", cursor, limit, username), version, last_modified, render)
+
+@app.get("/api/reports")
+async def list_reports(cursor: Optional[str] = None, limit: Optional[int] = None, session = Depends(get_session)):
+    enriched, next_cursor = await run_db(session, get_feed_page, cursor, limit)
+    return {"items": jsonable_encoder(enriched), "next_cursor": next_cursor}
 
 # ---------------- report detail ----------------
-@app.get("/reports/{report_id}", response_class=HTMLResponse)
-def report_detail(request: Request, report_id: int, session = Depends(get_session)):
-    r = session.get(Report, report_id)
+def load_report_detail(session: Session, report_id: int, username: Optional[str]):
+    # template 用到的關聯全部 eager load，render 時不會再 lazy load（async mode 下也不能 lazy load）
+    r = session.exec(
+        select(Report)
+        .where(Report.id == report_id)
+        .options(
+            joinedload(Report.user),
+            joinedload(Report.meeting),
+            joinedload(Report.paper).selectinload(Paper.authors).selectinload(Author.affiliations),
+            joinedload(Report.paper).selectinload(Paper.tags),
+        )
+    ).first()
     if not r:
         raise HTTPException(status_code=404, detail="Report not found")
-    user = session.get(User, r.user_id) if r.user_id else None
-    meeting = session.get(LabMeeting, r.meeting_id) if r.meeting_id else None
-    tags = get_report_tags(session, r)
-    comments = session.exec(select(Comment).where(Comment.report_id == r.id).order_by(Comment.created_at)).all()
+    # 第一頁 comments；其餘由頁面上的 script 分頁載入，新的經 SSE 推過來
+    comments = load_comment_page(session, r.id)
+    related = load_related_reports(session, r.id, earlier_only=True)
+    return r, comments, related, list_attachments(session, r.id), load_current_user(session, username)
+
+def report_page_version(session: Session, report_id: int):
+    found = report_version(session, report_id)
+    if found is None:
+        return None
+    version, last_modified = found
+    # related 區塊換 snapshot 時也會變；它還沒有確定的時間時不送 Last-Modified，只靠 ETag
+    related, related_at = related_version(session, report_id)
+    return (*version, related), (max(last_modified, related_at) if related_at else None)
+
+@app.get("/reports/{report_id}", response_class=HTMLResponse)
+async def report_detail(request: Request, report_id: int, session = Depends(get_session)):
+    username = request.session.get("username")
+    found = await run_db(session, report_page_version, report_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    version, last_modified = found
+
+    async def render():
+        r, (comments, next_cursor), related, attachments, current_user = await run_db(session, load_report_detail, report_id, username)
+        tags = sorted(r.paper.tags, key=lambda t: t.name) if r.paper else []
+        last_cursor = comments[-1]["cursor"] if comments else start_cursor(r)
+        return templates.TemplateResponse(
+            "report_detail.html",
+            {"request": request, "report": r, "user": r.user, "meeting": r.meeting, "tags": tags, "comments": comments,
+             "next_cursor": next_cursor, "last_cursor": last_cursor, "related": related, "attachments": attachments,
+             "current_user": current_user}
+        )
+
+    return await cached_page(request, ("report", report_id, username), version, last_modified, render)
+
+def load_related_api(session: Session, report_id: int, k: Optional[int], earlier: bool):
+    if session.get(Report, report_id) is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return jsonable_encoder(load_related_reports(session, report_id, k, earlier_only=earlier))
+
+@app.get("/api/reports/{report_id}/related")
+async def related_reports_api(report_id: int, k: Optional[int] = None, earlier: bool = False, session = Depends(get_session)):
+    return {"report_id": report_id, "results": await run_db(session, load_related_api, report_id, k, earlier)}
+
+# ---------------- tags ----------------
+def load_tag_view(session: Session, name: str, username: Optional[str], cursor: Optional[str], limit: Optional[int]):
+    try:
+        page = load_tag_page(session, name, cursor=cursor, limit=limit)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Tag not found")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return page, load_current_user(session, username)
+
+@app.get("/tags/{name}", response_class=HTMLResponse)
+async def tag_reports(request: Request, name: str, cursor: Optional[str] = None, limit: Optional[int] = None, session = Depends(get_session)):
+    (items, next_cursor), current_user = await run_db(session, load_tag_view, name, request.session.get("username"), cursor, limit)
     return templates.TemplateResponse(
-        "report_detail.html",
-        {"request": request, "report": r, "user": user, "meeting": meeting, "tags": tags, "comments": comments, "current_user": get_current_user(request, session)}
+        "tag_list.html",
+        {"request": request, "tag": name, "reports": items, "next_cursor": next_cursor, "current_user": current_user}
+    )
+
+def load_tag_directory_view(session: Session, sort: str, username: Optional[str]):
+    try:
+        rows = load_tag_directory(session, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return rows, load_current_user(session, username)
+
+@app.get("/tags", response_class=HTMLResponse)
+async def tag_directory(request: Request, sort: str = "reports", session = Depends(get_session)):
+    rows, current_user = await run_db(session, load_tag_directory_view, sort, request.session.get("username"))
+    return templates.TemplateResponse(
+        "tags.html", {"request": request, "tags": rows, "sort": sort, "current_user": current_user}
     )
 
 # ---------------- upload ----------------
+# 既有 meeting / paper 改由 /api/lookup typeahead 選，表單大小不再隨 DB 成長
 @app.get("/upload", response_class=HTMLResponse)
-def upload_form(request: Request, session = Depends(get_session)):
-    current_user = get_current_user(request, session)
+async def upload_form(request: Request, session = Depends(get_session)):
+    current_user = await run_db(session, load_current_user, request.session.get("username"))
     if not current_user:
         return RedirectResponse(url="/login")
-    meetings = session.exec(select(LabMeeting).order_by(LabMeeting.meeting_date.desc())).all()
-    papers = session.exec(select(Paper)).all()
-    return templates.TemplateResponse(
-        "upload.html", {"request": request, "meetings": meetings, "papers": papers, "current_user": current_user}
-    )
+    return templates.TemplateResponse("upload.html", {"request": request, "current_user": current_user})
 
 
-@app.post("/upload")
-async def create_report(request: Request, session=Depends(get_session)):
-    from datetime import datetime
+def save_report(session: Session, username: Optional[str], data: dict) -> Report:
+    user = load_current_user(session, username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        r = ingest_report(session, user["id"], data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return r
+
+# 這個 process 內的 in-memory index（其他 worker 靠各自的定期 refresh）；response 送出後才跑。
+# 寫進 DB 的後續工作（counters、related snapshot）走 app/jobs.py 的 job queue。
+def refresh_after_upload(session: Session, report_id: int):
+    index_report(session, report_id)
+    refresh_lookup_index(session)
+    refresh_related(session)
+
+def refresh_after_import(session: Session):
+    refresh_lookup_index(session)
+    refresh_related(session)
 
+@app.post("/upload")
+async def create_report(request: Request, background_tasks: BackgroundTasks, session=Depends(get_session)):
     form = await request.form()  # <--- async 取得表單
-    username = request.session.get("username")
-    user = session.exec(select(User).where(User.username == username)).first() if username else None
-
-    # --------------------
-    # 取得基本 Report 欄位
-    # --------------------
-    report_title = form.get("report_title")
-    report_summary = form.get("report_summary", "")
-    slides_link = form.get("slides_link", "")
-
-    # --------------------
-    # LabMeeting
-    # --------------------
-    meeting_id = None
-    existing_meeting_id_raw = form.get("existing_meeting_id")
-    existing_meeting_id = int(existing_meeting_id_raw) if existing_meeting_id_raw and existing_meeting_id_raw.isdigit() else None
-    if existing_meeting_id:
-        meeting_id = existing_meeting_id
-    else:
-        meeting_title = form.get("meeting_title")
-        meeting_date = form.get("meeting_date")
-        meeting_location = form.get("meeting_location")
-        if meeting_title:
-            meeting = LabMeeting(meeting_title=meeting_title, meeting_location=meeting_location)
-            if meeting_date:
-                try:
-                    meeting.meeting_date = datetime.fromisoformat(meeting_date).date()
-                except:
-                    pass
-            session.add(meeting)
-            session.commit()
-            session.refresh(meeting)
-            meeting_id = meeting.id
-
-    # --------------------
-    # Paper
-    # --------------------
-    paper_id_raw = form.get("existing_paper_id") or form.get("paper_id")
-    paper_id = int(paper_id_raw) if paper_id_raw and paper_id_raw.isdigit() else None
-
-    # 新 Paper 欄位
-    paper_title = form.get("paper_title")
-    published_year = form.get("published_year")
-    published_month = form.get("published_month")
-    journal_or_conference = form.get("journal_or_conference")
-    tags_raw = form.get("tags", "")
-
-    if not paper_id and paper_title:
-        paper = Paper(
-            paper_title=paper_title,
-            published_year=int(published_year) if published_year and published_year.isdigit() else 0,
-            published_month=int(published_month) if published_month and published_month.isdigit() else 0,
-            journal_or_conference=journal_or_conference or ""
-        )
-        session.add(paper)
-        session.commit()
-        session.refresh(paper)
-        paper_id = paper.id
-
-        # --------------------
-        # Authors & Affiliations
-        # --------------------
-        author_idx = 0
-        while True:
-            author_name = form.get(f"author_name_{author_idx}")
-            author_affils = form.get(f"author_affiliations_{author_idx}")
-            if not author_name:
-                break
-            # 建立 Author
-            author = session.exec(select(Author).where(Author.name == author_name)).first()
-            if not author:
-                author = Author(name=author_name)
-                session.add(author)
-                session.commit()
-                session.refresh(author)
-            # Affiliations
-            if author_affils:
-                for aff_name in [x.strip() for x in author_affils.split(",") if x.strip()]:
-                    aff = session.exec(select(Affiliation).where(Affiliation.name == aff_name)).first()
-                    if not aff:
-                        aff = Affiliation(name=aff_name)
-                        session.add(aff)
-                        session.commit()
-                        session.refresh(aff)
-                    # Link author ↔ affiliation
-                    link_exists = session.exec(
-                        select(AuthorAffiliationLink).where(
-                            AuthorAffiliationLink.author_id == author.id,
-                            AuthorAffiliationLink.affiliation_id == aff.id
-                        )
-                    ).first()
-                    if not link_exists:
-                        session.add(AuthorAffiliationLink(author_id=author.id, affiliation_id=aff.id))
-                        session.commit()
-            # Link author ↔ paper
-            link_exists = session.exec(
-                select(PaperAuthorLink).where(
-                    PaperAuthorLink.author_id == author.id,
-                    PaperAuthorLink.paper_id == paper.id
-                )
-            ).first()
-            if not link_exists:
-                session.add(PaperAuthorLink(author_id=author.id, paper_id=paper.id))
-                session.commit()
-            author_idx += 1
-
-        # --------------------
-        # Tags
-        # --------------------
-        if tags_raw:
-            for t_name in [x.strip() for x in tags_raw.split(",") if x.strip()]:
-                tag = session.exec(select(Tag).where(Tag.name == t_name)).first()
-                if not tag:
-                    tag = Tag(name=t_name)
-                    session.add(tag)
-                    session.commit()
-                    session.refresh(tag)
-                # Link paper ↔ tag
-                link_exists = session.exec(
-                    select(PaperTag).where(
-                        PaperTag.paper_id == paper.id,
-                        PaperTag.tag_id == tag.id
-                    )
-                ).first()
-                if not link_exists:
-                    session.add(PaperTag(paper_id=paper.id, tag_id=tag.id))
-                    session.commit()
-
-    # --------------------
-    # Create Report
-    # --------------------
-    r = Report(
-        report_title=report_title,
-        report_summary=report_summary,
-        slides_link=slides_link,
-        user_id=user.id if user else None,
-        meeting_id=meeting_id,
-        paper_id=paper_id
-    )
-    session.add(r)
-    session.commit()
-    session.refresh(r)
-
+    r = await run_db(session, save_report, request.session.get("username"), parse_upload_form(form))
+    invalidate_feed_pages()
+    background_tasks.add_task(run_in_session, refresh_after_upload, r.id)
     return RedirectResponse(url=f"/reports/{r.id}", status_code=303)
 
 
+# ---------------- bulk import ----------------
+MAX_REJECTS_IN_RESPONSE = 100
+
+# 匯入是 CPU-bound 的長時間工作，刻意維持 sync route + sync Session（跑在 threadpool），不佔用 event loop
+@app.post("/import")
+def bulk_import(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...), format: Optional[str] = Form(None), batch_size: int = Form(DEFAULT_BATCH_SIZE), session=Depends(get_sync_session)):
+    if not load_current_user(session, request.session.get("username")):
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        fmt = format or detect_format(file.filename or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rejects = []
+    def on_reject(ref, error, raw):
+        if len(rejects) < MAX_REJECTS_IN_RESPONSE:
+            rejects.append({"ref": ref, "error": error, "record": raw})
+
+    # UploadFile 已經 spool 到暫存檔，這裡逐列讀（binary，import_stream 逐列 decode），不會整份載入記憶體
+    try:
+        stats = import_stream(session, file.file, fmt, batch_size=batch_size, on_reject=on_reject)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    invalidate_index()
+    invalidate_all_pages()
+    background_tasks.add_task(run_in_session, refresh_after_import)
+    return {**stats, "rejects": rejects}
+
+
 # ---------------- register / login / logout ----------------
 @app.get("/register", response_class=HTMLResponse)
-def register_form(request: Request):
+async def register_form(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
-@app.post("/register")
-def register(request: Request, username: str = Form(...), display_name: str = Form(None), session = Depends(get_session)):
-    exists = session.exec(select(User).where(User.username == username)).first()
-    if exists:
-        return templates.TemplateResponse("register.html", {"request": request, "error": "username exists"})
+def save_user(session: Session, username: str, display_name: Optional[str]) -> Optional[dict]:
+    """建立 user；username 已存在時回傳 None"""
+    if load_current_user(session, username):
+        return None
     u = User(username=username, display_name=display_name)
     session.add(u)
     session.commit()
+    session.refresh(u)
+    invalidate_user(username)
+    return user_snapshot(u)
+
+@app.post("/register")
+async def register(request: Request, username: str = Form(...), display_name: str = Form(None), session = Depends(get_session)):
+    u = await run_db(session, save_user, username, display_name)
+    if not u:
+        return templates.TemplateResponse("register.html", {"request": request, "error": "username exists"})
     request.session["username"] = username
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/login", response_class=HTMLResponse)
-def login_form(request: Request):
+async def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
+def login_or_create(session: Session, username: str):
+    user = load_current_user(session, username)
+    if user:
+        return user, False
+    return save_user(session, username, username), True
+
 @app.post("/login")
-def login(request: Request, username: str = Form(...), session = Depends(get_session)):
-    user = session.exec(select(User).where(User.username == username)).first()
-    auto_created = False
-    if not user:
-        user = User(username=username, display_name=username)
-        session.add(user)
-        session.commit()
-        auto_created = True
+async def login(request: Request, username: str = Form(...), session = Depends(get_session)):
+    user, auto_created = await run_db(session, login_or_create, username)
     request.session["username"] = username
     if auto_created:
         return templates.TemplateResponse("index.html", {"request": request, "current_user": user, "info": "已自動建立帳號"})
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/")
 
 # ---------------- comment ----------------
-@app.post("/comments")
-def create_comment(request: Request, report_id: int = Form(...), content: str = Form(...), session = Depends(get_session)):
-    username = request.session.get("username")
-    user = session.exec(select(User).where(User.username == username)).first() if username else None
+def save_comment(session: Session, username: Optional[str], report_id: int, content: str) -> Optional[dict]:
+    user = load_current_user(session, username)
     if not user:
+        return None
+    try:
+        c = add_comment(session, report_id, user["id"], content)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return comment_item(c, user)
+
+def wants_json(request: Request) -> bool:
+    return "application/json" in request.headers.get("accept", "")
+
+@app.post("/comments")
+async def create_comment(request: Request, report_id: int = Form(...), content: str = Form(...), session = Depends(get_session)):
+    """表單送出時 redirect 回 report 頁面；Accept: application/json（頁面上的 script）時回 201 + comment"""
+    item = await run_db(session, save_comment, request.session.get("username"), report_id, content)
+    if not item:
+        if wants_json(request):
+            raise HTTPException(status_code=401, detail="Login required")
         return RedirectResponse(url="/login")
-    c = Comment(report_id=report_id, user_id=user.id, content=content)
-    session.add(c)
-    session.commit()
+    invalidate_report_pages(report_id)
+    publish_comment(item)
+    if wants_json(request):
+        return JSONResponse(jsonable_encoder(item), status_code=201)
     return RedirectResponse(url=f"/reports/{report_id}", status_code=303)
 
+def load_comments_api(session: Session, report_id: int, cursor: Optional[str], limit: Optional[int]):
+    try:
+        return load_report_comments(session, report_id, cursor, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/reports/{report_id}/comments")
+async def list_comments(report_id: int, cursor: Optional[str] = None, limit: Optional[int] = None, session = Depends(get_session)):
+    """舊到新；next_cursor 為 None 時已到最新一則，之後改接 /comments/stream"""
+    items, next_cursor = await run_db(session, load_comments_api, report_id, cursor, limit)
+    return {"items": jsonable_encoder(items), "next_cursor": next_cursor}
+
+@app.get("/api/reports/{report_id}/comments/stream")
+async def stream_comments(request: Request, report_id: int, cursor: Optional[str] = None):
+    """
+    text/event-stream：cursor（重連時是 Last-Event-ID）之後的 comment，接著即時推送新的。
+    沒帶 cursor 時從頭開始。不用 Depends(get_session)：那個 session 會在整個 stream 期間佔住一條 connection。
+    """
+    cursor = request.headers.get("last-event-id") or cursor
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    else:
+        cursor = await run_in_session(load_stream_start, report_id)
+        if cursor is None:
+            raise HTTPException(status_code=404, detail="Report not found")
+    sub = comment_broadcaster.subscribe(report_id)
+    if sub is None:
+        raise HTTPException(status_code=503, detail="Too many comment streams", headers={"Retry-After": "5"})
+    return StreamingResponse(
+        comment_stream(sub, cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------------- attachments ----------------
+MULTIPART_OVERHEAD = 64 * 1024  # multipart 邊界與其他欄位
+
+def check_attachment_target(session: Session, username: Optional[str], report_id: int) -> Optional[dict]:
+    user = load_current_user(session, username)
+    if not user:
+        return None
+    try:
+        check_report(session, report_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return user
+
+def record_attachment(session: Session, report_id: int, user_id: int, filename: str, sha256: str, size: int) -> dict:
+    try:
+        return save_attachment(session, report_id, user_id, filename, sha256, size)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/reports/{report_id}/attachments")
+async def upload_attachment(request: Request, report_id: int, filename: Optional[str] = None):
+    """
+    body 就是檔案內容（?filename=，頁面上的 script 用這個），或 multipart/form-data 的 file 欄位（沒有 script 時的表單）。
+    邊收邊寫進 content store；不用 Depends(get_session)，上傳期間不佔住 connection。
+    """
+    is_form = request.headers.get("content-type", "").startswith("multipart/form-data")
+    user = await run_in_session(check_attachment_target, request.session.get("username"), report_id)
+    if not user:
+        if is_form:
+            return RedirectResponse(url="/login", status_code=303)
+        raise HTTPException(status_code=401, detail="Login required")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > settings.ATTACHMENT_MAX_BYTES + (MULTIPART_OVERHEAD if is_form else 0):
+        raise HTTPException(status_code=413, detail=f"File larger than {settings.ATTACHMENT_MAX_BYTES} bytes")
+
+    try:
+        if is_form:
+            form = await request.form(max_files=1)
+            try:
+                file = form.get("file")
+                if file is None or isinstance(file, str):
+                    raise ValueError("Missing file")
+                name = clean_filename(file.filename)
+                sha256, size = await store_stream(iter_upload(file), name)
+            finally:
+                await form.close()
+        else:
+            name = clean_filename(filename)
+            sha256, size = await store_stream(request.stream(), name)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    item = await run_in_session(record_attachment, report_id, user["id"], name, sha256, size)
+    mark_write(request)
+    invalidate_report_pages(report_id)
+    if is_form:
+        return RedirectResponse(url=f"/reports/{report_id}", status_code=303)
+    return JSONResponse(jsonable_encoder(item), status_code=201)
+
+def load_attachments_api(session: Session, report_id: int):
+    try:
+        check_report(session, report_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return list_attachments(session, report_id)
+
+@app.get("/api/reports/{report_id}/attachments")
+async def list_attachments_api(report_id: int, session = Depends(get_session)):
+    return {"items": jsonable_encoder(await run_db(session, load_attachments_api, report_id))}
+
+def load_attachment_or_404(session: Session, attachment_id: int) -> dict:
+    try:
+        return load_attachment(session, attachment_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.api_route("/attachments/{attachment_id}", methods=["GET", "HEAD"])
+async def download_attachment(attachment_id: int, download: bool = False, session = Depends(get_session)):
+    """Range / If-Range 由 FileResponse 處理；ETag 是內容的 sha256，URL 對應的內容不會變"""
+    item = await run_db(session, load_attachment_or_404, attachment_id)
+    return attachment_response(item, download)
+
+@app.get("/attachments/{attachment_id}/thumbnail")
+async def attachment_thumbnail(attachment_id: int, session = Depends(get_session)):
+    item = await run_db(session, load_attachment_or_404, attachment_id)
+    response = await thumbnail_response(item)
+    if response is None:
+        raise HTTPException(status_code=404, detail="No thumbnail")
+    return response
+
 # ---------------- query_ui ----------------
 @app.get("/query_ui", response_class=HTMLResponse)
-def query_ui(request: Request, session=Depends(get_session)):
-    return templates.TemplateResponse("query_ui.html", {"request": request, "current_user": get_current_user(request, session)})
+async def query_ui(request: Request, session=Depends(get_session)):
+    current_user = await run_db(session, load_current_user, request.session.get("username"))
+    return templates.TemplateResponse("query_ui.html", {"request": request, "current_user": current_user})
 
 # ---------------- dynamic query ----------------
-FIELD_MAP = {
-    "report_title": Report.report_title,
-    "presenter": User.display_name,
-    "paper_year": Paper.published_year,
-    "paper_tag": Tag.name,
-    "author_name": "author",
-    "affiliation_name": "affiliation",
-}
-
-def apply_filter(query, f, col):
-    op = f["op"]
-    value = f["value"]
-    if op == "contains":
-        return query.where(col.ilike(f"%{value}%"))
-    if op == "=":
-        return query.where(col == value)
-    if op == ">":
-        return query.where(col > value)
-    if op == ">=":
-        return query.where(col >= value)
-    if op == "<":
-        return query.where(col < value)
-    if op == "<=":
-        return query.where(col <= value)
-    return query
+def filter_query(session: Session, req: dict):
+    try:
+        return jsonable_encoder(run_filter_query(session, req))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/query")
-def run_query(req: dict, session=Depends(get_session)):
-    filters = req.get("filters", [])
-    q = select(Report)
-    joined = set()
-
-    for f in filters:
-        field = f["field"]
-        if field in ["paper_tag", "author_name", "affiliation_name", "paper_year"] and "paper" not in joined:
-            q = q.join(Paper, Paper.id == Report.paper_id)
-            joined.add("paper")
-        if field == "paper_tag" and "tag" not in joined:
-            q = q.join(Tag, Tag.id == Paper.id)  # 這邏輯可按你的 join table 調整
-            joined.add("tag")
-        if field == "author_name" and "author" not in joined:
-            q = q.join(Paper.authors)
-            joined.add("author")
-        if field == "affiliation_name" and "affiliation" not in joined:
-            q = q.join(Paper.authors).join(Author.affiliations)
-            joined.add("affiliation")
-        if field == "presenter" and "presenter" not in joined:
-            q = q.join(User, User.id == Report.user_id)
-            joined.add("presenter")
-
-    for f in filters:
-        col_key = FIELD_MAP.get(f["field"])
-        if col_key == "author":
-            col = Author.name
-        elif col_key == "affiliation":
-            col = Affiliation.name
-        else:
-            col = col_key
-        q = apply_filter(q, f, col)
-
-    results = session.exec(q).all()
-    enriched = []
-    for r in results:
-        user = session.get(User, r.user_id)
-        meeting = session.get(LabMeeting, r.meeting_id)
-        tags = get_report_tags(session, r)
-        enriched.append({"r": r, "user": user, "meeting": meeting, "tags": tags})
-    return enriched
+async def run_query(req: dict, session=Depends(get_read_session)):
+    return await run_db(session, filter_query, req)
+
+# ---------------- export ----------------
+def export_response(req: dict, fmt):
+    if not isinstance(fmt, str) or fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"unknown export format: {fmt}")
+    try:
+        plan = prepare_query(req)  # 先驗證，開始串流之後就不能再回 400
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, ext = EXPORT_FORMATS[fmt]
+    filename = f"reports-{date.today():%Y%m%d}.{ext}"
+    return StreamingResponse(
+        stream_export(replica_router.read_engine(), plan, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/export")
+async def export_get(format: str = "csv", filters: Optional[str] = None, sort: Optional[str] = None, order: Optional[str] = None):
+    """filters 是 /query 的 filter tree（JSON 字串）"""
+    try:
+        parsed = json.loads(filters) if filters else []
+    except (ValueError, RecursionError):
+        raise HTTPException(status_code=400, detail="filters must be JSON")
+    return export_response({"filters": parsed, "sort": sort, "order": order}, format)
+
+@app.post("/export")
+async def export_post(req: dict, format: str = "csv"):
+    """body 與 /query 相同（limit / offset / cursor 不適用），可另外帶 format"""
+    return export_response(req, req.get("format") or format)
+
+# ---------------- full-text search ----------------
+def full_text_search(session: Session, q: str, limit: Optional[int], offset: int):
+    return jsonable_encoder(search_reports(session, q, limit=limit, offset=offset))
+
+@app.get("/search")
+async def search(q: str, limit: Optional[int] = None, offset: int = 0, session=Depends(get_session)):
+    return await run_db(session, full_text_search, q, limit, offset)
+
+# ---------------- stats dashboard ----------------
+def load_stats_view(session: Session, username: Optional[str]):
+    return load_dashboard(session), load_current_user(session, username)
+
+@app.get("/stats", response_class=HTMLResponse)
+async def stats_page(request: Request, session=Depends(get_session)):
+    stats, current_user = await run_db(session, load_stats_view, request.session.get("username"))
+    return templates.TemplateResponse("stats.html", {"request": request, "stats": stats, "current_user": current_user})
+
+@app.get("/api/stats")
+async def stats_api(session=Depends(get_session)):
+    return await run_db(session, load_dashboard)
+
+# ---------------- collaboration graph ----------------
+def graph_query(session: Session, fn, *args):
+    try:
+        return fn(session, *args)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def load_user_network(session: Session, username: Optional[str], depth: int, limit: Optional[int]):
+    user = load_current_user(session, username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    return load_network_papers(session, user["id"], depth, limit)
+
+@app.get("/api/graph/authors/{author_id}/coauthors")
+async def coauthors_api(author_id: int, limit: Optional[int] = None, session=Depends(get_session)):
+    return await run_db(session, graph_query, load_coauthors, author_id, limit)
+
+@app.get("/api/graph/path")
+async def collaboration_path_api(source: int, target: int, session=Depends(get_session)):
+    return await run_db(session, graph_query, load_collaboration_path, source, target)
+
+@app.get("/api/graph/affiliations")
+async def top_affiliations_api(limit: Optional[int] = None, session=Depends(get_session)):
+    return await run_db(session, load_top_affiliations, limit)
+
+@app.get("/api/graph/network")
+async def network_papers_api(request: Request, depth: int = 1, limit: Optional[int] = None, session=Depends(get_session)):
+    return await run_db(session, load_user_network, request.session.get("username"), depth, limit)
+
+@app.get("/api/graph/stats")
+async def graph_stats_api(session=Depends(get_session)):
+    return await run_db(session, graph_stats)
+
+# ---------------- typeahead lookup ----------------
+def lookup_names(session: Session, kind: str, q: str, limit: Optional[int]):
+    try:
+        return lookup(session, kind, q, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/lookup/{kind}")
+async def lookup_api(kind: str, q: str = "", limit: Optional[int] = None, session=Depends(get_session)):
+    return {"kind": kind, "q": q, "results": await run_db(session, lookup_names, kind, q, limit)}
+
+# ---------------- cache stats ----------------
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return {**cache_stats(), "page": page_cache.stats(), "comment_stream": comment_broadcaster.stats()}
+
+# ---------------- background jobs ----------------
+@app.get("/api/jobs/stats")
+async def get_job_stats(session=Depends(get_session)):
+    return await run_db(session, job_stats)
+
+# ---------------- database ----------------
+@app.get("/api/db/stats")
+async def db_stats():
+    return {"pools": pool_stats(), "replica": replica_router.stats()}
+
+# ---------------- metrics ----------------
+@app.get("/metrics")
+async def metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    STARTUP_SECONDS.replace(startup.metric_values())
+    pools = {name: pool_state(e) for name, e in db.all_engines().items()}
+    POOL_CONNECTIONS.replace({
+        (name, state): pool[state] for name, pool in pools.items() for state in ("checked_out", "idle", "overflow")
+    })
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 # ---------------- main ----------------
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+# metrics.py
+# 每個 request 的 SQL 數、DB 時間、template render 時間與總延遲：
+# engine event 計 SQL、ASGI middleware 包住整個 request、TimedTemplates 量 render。
+# 結果累積成 Prometheus histogram（GET /metrics，每個 worker process 各自一份），
+# 慢的 SQL 連同參數的「形狀」（型別 / 長度，不記值）寫進 log；
+# METRICS_DEBUG_HEADER=true 時 response 帶 Server-Timing 與 X-SQL-Statements。
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi.templating import Jinja2Templates
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+SQL_HEADER = "X-SQL-Statements"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+MAX_LOGGED_SQL = 500
+
+
+# ---------------- metric types ----------------
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1.0):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        with _lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in items)
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def replace(self, values: Dict[tuple, float]):
+        """整組換掉（例如每次重新數的 queue depth），沒出現的 label 就不再輸出"""
+        with _lock:
+            self._values = dict(values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with _lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in items)
+        return lines
+
+
+class Histogram:
+    """每組 label 一個 list：各 bucket 的次數（最後一格是 +Inf）再加上 sum"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def totals(self) -> Dict[tuple, Tuple[int, float]]:
+        """label -> (count, sum)"""
+        with _lock:
+            return {k: (sum(v[:-1]), v[-1]) for k, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Total request latency.", ("method", "route"))
+REQUEST_QUERIES = Histogram("db_queries_per_request", "SQL statements executed per request.", ("method", "route"), QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("db_time_per_request_seconds", "Time spent in SQL per request.", ("method", "route"))
+RENDER_SECONDS = Histogram("template_render_seconds", "Jinja template render time.", ("template",))
+SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.", ("route",))
+
+# app/jobs.py 的 runner 更新（只有有跑 runner 的 process 會有值）
+JOB_DEPTH = Gauge("jobs_in_queue", "Jobs by status and kind (queued / running / failed).", ("status", "kind"))
+JOBS_PROCESSED = Counter("jobs_processed_total", "Finished job attempts by kind and outcome.", ("kind", "outcome"))
+JOB_SECONDS = Histogram("job_duration_seconds", "Job handler run time.", ("kind",))
+JOB_LAG_SECONDS = Histogram("job_lag_seconds", "Delay between a job becoming due and a worker claiming it.", ("kind",))
+
+# app/db.py 的 connection pool 與 replica routing（每個 worker process 各自的 pool）
+POOL_CONNECTIONS = Gauge("db_pool_connections", "Pooled connections by engine and state (checked_out / idle / overflow).", ("engine", "state"))
+POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Time spent waiting to check a connection out of the pool.", ("engine",),
+                              (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+POOL_HOLD_SECONDS = Histogram("db_pool_checkout_seconds", "How long a connection stays checked out.", ("engine",))
+POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT.", ("engine",))
+DB_ROUTES = Counter("db_session_routes_total", "Request sessions by target engine and reason.", ("target", "reason"))
+REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds", "Last measured replication lag of READ_DATABASE_URL.")
+
+# app/startup.py 的各階段時間（ready 時設定一次）
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Cold-start time by phase, including deferred imports.", ("phase",))
+
+REGISTRY = [
+    REQUESTS, REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, RENDER_SECONDS, SLOW_QUERIES,
+    JOB_DEPTH, JOBS_PROCESSED, JOB_SECONDS, JOB_LAG_SECONDS, STARTUP_SECONDS,
+    POOL_CONNECTIONS, POOL_WAIT_SECONDS, POOL_HOLD_SECONDS, POOL_TIMEOUTS, DB_ROUTES, REPLICA_LAG_SECONDS,
+]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ---------------- per-request stats ----------------
+# contextvar 會跟著 run_in_threadpool（copy context）與 AsyncSession.run_sync（同一個 task）走
+_current: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+
+def new_stats(scope: Optional[dict] = None) -> dict:
+    return {"scope": scope, "queries": 0, "db_seconds": 0.0, "render_seconds": 0.0}
+
+
+def current_stats() -> Optional[dict]:
+    return _current.get()
+
+
+def route_label(scope: Optional[dict]) -> str:
+    """route 的 path template（/reports/{report_id}），不用實際 URL，避免 label 無限增加"""
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+# ---------------- SQL ----------------
+_PLACEHOLDER_RUN = re.compile(r"(\?|%\(\w+\)s|%s|\$\d+|:\w+)(\s*,\s*(\?|%\(\w+\)s|%s|\$\d+|:\w+))+")
+
+
+def sql_shape(statement: str) -> str:
+    """空白合併、IN (...) 展開的一長串 placeholder 縮成一個，過長截斷"""
+    sql = " ".join(statement.split())
+    sql = _PLACEHOLDER_RUN.sub(lambda m: f"{m.group(1)}, ...×{m.group(0).count(',') + 1}", sql)
+    return sql if len(sql) <= MAX_LOGGED_SQL else sql[:MAX_LOGGED_SQL] + "…"
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def param_shape(parameters, executemany: bool = False) -> str:
+    """bound parameter 的型別與長度，不含值（log 裡不該出現使用者資料）"""
+    if executemany:
+        rows = list(parameters or ())
+        return f"{len(rows)} × {param_shape(rows[0])}" if rows else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {_value_shape(v)}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(_value_shape(v) for v in parameters) + ")"
+    return _value_shape(parameters)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current.get()
+    if stats is not None:
+        stats["queries"] += 1
+        stats["db_seconds"] += elapsed
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        route = route_label(stats["scope"]) if stats else "-"
+        SLOW_QUERIES.inc((route,))
+        logger.warning(
+            "slow query %.1f ms [%s] %s params=%s",
+            elapsed * 1000, route, sql_shape(statement), param_shape(parameters, executemany),
+        )
+
+
+# ---------------- templates ----------------
+class TimedTemplates(Jinja2Templates):
+    """TemplateResponse 會在建立時 render，量整個呼叫的時間"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        name = kwargs.get("name") or next((a for a in args if isinstance(a, str)), "?")
+        started = time.perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            RENDER_SECONDS.observe((name,), elapsed)
+            stats = _current.get()
+            if stats is not None:
+                stats["render_seconds"] += elapsed
+
+
+# ---------------- middleware ----------------
+def debug_headers(stats: dict, elapsed: float) -> List[Tuple[bytes, bytes]]:
+    timing = (
+        f'db;dur={stats["db_seconds"] * 1000:.2f};desc="{stats["queries"]} queries", '
+        f'render;dur={stats["render_seconds"] * 1000:.2f}, '
+        f'total;dur={elapsed * 1000:.2f}'
+    )
+    return [(b"server-timing", timing.encode()), (SQL_HEADER.lower().encode(), str(stats["queries"]).encode())]
+
+
+class MetricsMiddleware:
+    """pure ASGI（不用 BaseHTTPMiddleware，streaming response 不會被整個讀進記憶體）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = new_stats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if settings.METRICS_DEBUG_HEADER:
+                    headers = list(message.get("headers", [])) + debug_headers(stats, time.perf_counter() - started)
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            labels = (scope["method"], route_label(scope))
+            REQUESTS.inc((*labels, str(status[0])))
+            REQUEST_SECONDS.observe(labels, elapsed)
+            REQUEST_QUERIES.observe(labels, stats["queries"])
+            REQUEST_DB_SECONDS.observe(labels, stats["db_seconds"])
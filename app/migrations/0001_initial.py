@@ -0,0 +1,27 @@
+"""Initial schema (tables previously created by create_all at startup)."""
+
+from sqlmodel import SQLModel
+
+from ..models import (
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    Comment,
+    LabMeeting,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+    User,
+)
+
+TABLES = [
+    User, LabMeeting, Paper, Author, Affiliation, Tag,
+    PaperAuthorLink, AuthorAffiliationLink, PaperTag, Report, Comment,
+]
+
+
+def upgrade(conn):
+    # checkfirst：舊資料庫已由 create_all 建好的表會直接略過
+    SQLModel.metadata.create_all(conn, tables=[m.__table__ for m in TABLES], checkfirst=True)
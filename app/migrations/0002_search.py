@@ -0,0 +1,15 @@
+"""Full-text tsvector columns and trigram indexes (Postgres only)."""
+
+from ..search import SEARCH_INDEXES, backfill_search_vectors, install_search_columns
+from . import create_index
+
+
+def upgrade(conn):
+    # 只加 nullable 欄位與 trigger，不重寫表；新寫入的 row 從這裡開始就有 search_vector
+    install_search_columns(conn)
+
+
+def upgrade_concurrent(conn):
+    backfill_search_vectors(conn)
+    for name, table, columns in SEARCH_INDEXES:
+        create_index(conn, name, table, columns, using="GIN")
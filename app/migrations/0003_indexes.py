@@ -0,0 +1,67 @@
+"""Lookup indexes and unique names for users, tags, authors and affiliations."""
+
+from sqlalchemy import text
+
+from . import create_index
+
+# (index name, table, columns, unique)
+INDEXES = [
+    ("ix_user_username", "user", ["username"], True),
+    ("ix_tag_name", "tag", ["name"], True),
+    ("ix_author_name", "author", ["name"], True),
+    ("ix_affiliation_name", "affiliation", ["name"], True),
+    ("ix_report_created_at_id", "report", ["created_at", "id"], False),
+    ("ix_report_user_id", "report", ["user_id"], False),
+    ("ix_report_meeting_id", "report", ["meeting_id"], False),
+    ("ix_report_paper_id", "report", ["paper_id"], False),
+    ("ix_comment_report_id_created_at", "comment", ["report_id", "created_at", "id"], False),
+    ("ix_labmeeting_meeting_date", "labmeeting", ["meeting_date"], False),
+    ("ix_paper_title_year", "paper", ["paper_title", "published_year"], False),
+    # link table 的 PK 是 (a, b)，反向查詢 (b -> a) 需要另外的 index
+    ("ix_paperauthorlink_author_id", "paperauthorlink", ["author_id"], False),
+    ("ix_authoraffiliationlink_affiliation_id", "authoraffiliationlink", ["affiliation_id"], False),
+    ("ix_papertag_tag_id", "papertag", ["tag_id"], False),
+]
+
+# 建 unique index 前先合併重複名稱：
+# (table, name column, [(link table, fk, other column)], [(referencing table, fk)])
+DEDUPE = [
+    ("tag", "name", [("papertag", "tag_id", "paper_id")], []),
+    ("author", "name", [("paperauthorlink", "author_id", "paper_id"),
+                        ("authoraffiliationlink", "author_id", "affiliation_id")], []),
+    ("affiliation", "name", [("authoraffiliationlink", "affiliation_id", "author_id")], []),
+    ("user", "username", [], [("report", "user_id"), ("comment", "user_id")]),
+]
+
+
+def merge_duplicates(conn, table, column, links, refs):
+    dups = conn.execute(text(f"""
+        SELECT t.id AS dup_id, k.keep_id
+          FROM "{table}" t
+          JOIN (SELECT {column} AS v, min(id) AS keep_id
+                  FROM "{table}" GROUP BY {column} HAVING count(*) > 1) k
+            ON k.v = t.{column}
+         WHERE t.id <> k.keep_id
+    """)).mappings().all()
+    if not dups:
+        return
+    params = [dict(row) for row in dups]
+    for link, fk, other in links:
+        conn.execute(text(
+            f'INSERT INTO "{link}" ({fk}, {other}) SELECT :keep_id, {other} FROM "{link}" '
+            f"WHERE {fk} = :dup_id ON CONFLICT DO NOTHING"
+        ), params)
+        conn.execute(text(f'DELETE FROM "{link}" WHERE {fk} = :dup_id'), params)
+    for ref, fk in refs:
+        conn.execute(text(f'UPDATE "{ref}" SET {fk} = :keep_id WHERE {fk} = :dup_id'), params)
+    conn.execute(text(f'DELETE FROM "{table}" WHERE id = :dup_id'), params)
+
+
+def upgrade(conn):
+    for table, column, links, refs in DEDUPE:
+        merge_duplicates(conn, table, column, links, refs)
+
+
+def upgrade_concurrent(conn):
+    for name, table, columns, unique in INDEXES:
+        create_index(conn, name, table, columns, unique=unique)
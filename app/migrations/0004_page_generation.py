@@ -0,0 +1,7 @@
+"""Shared page-cache generation row, bumped by writes that change existing report pages."""
+
+from ..models import PageGeneration
+
+
+def upgrade(conn):
+    PageGeneration.__table__.create(conn, checkfirst=True)
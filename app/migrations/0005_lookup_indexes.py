@@ -0,0 +1,17 @@
+"""Trigram index on meeting titles for the /api/lookup typeahead (Postgres only)."""
+
+from . import create_index
+
+# paper_title / author / affiliation / tag 的 trigram index 已在 0002 建立
+INDEXES = [
+    ("ix_labmeeting_meeting_title_trgm", "labmeeting", ["meeting_title gin_trgm_ops"]),
+]
+
+
+def upgrade(conn):
+    pass
+
+
+def upgrade_concurrent(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns, using="GIN")
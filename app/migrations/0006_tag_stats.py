@@ -0,0 +1,19 @@
+"""Tag statistics counter table for the /tags directory, backfilled from existing links."""
+
+from sqlalchemy import text
+
+from ..models import TagStats
+
+
+def upgrade(conn):
+    TagStats.__table__.create(conn, checkfirst=True)
+    # 之後由 upload / import 以 delta 維護；這裡一次算出既有資料的起始值
+    conn.execute(text("""
+        INSERT INTO tagstats (tag_id, paper_count, report_count)
+        SELECT t.id,
+               (SELECT count(*) FROM papertag pt WHERE pt.tag_id = t.id),
+               (SELECT count(*) FROM papertag pt JOIN report r ON r.paper_id = pt.paper_id
+                 WHERE pt.tag_id = t.id)
+          FROM tag t
+         WHERE NOT EXISTS (SELECT 1 FROM tagstats s WHERE s.tag_id = t.id)
+    """))
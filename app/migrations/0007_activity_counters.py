@@ -0,0 +1,9 @@
+"""Activity summary table for the /stats dashboard, backfilled from existing reports and comments."""
+
+from ..models import ActivityCounter
+from ..stats import rebuild_activity
+
+
+def upgrade(conn):
+    ActivityCounter.__table__.create(conn, checkfirst=True)
+    rebuild_activity(conn)
@@ -0,0 +1,7 @@
+"""Background job queue table."""
+
+from ..models import Job
+
+
+def upgrade(conn):
+    Job.__table__.create(conn, checkfirst=True)
@@ -0,0 +1,7 @@
+"""Report attachment table (slides / PDFs stored by content hash)."""
+
+from ..models import Attachment
+
+
+def upgrade(conn):
+    Attachment.__table__.create(conn, checkfirst=True)
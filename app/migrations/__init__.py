@@ -0,0 +1,113 @@
+# migrations/__init__.py
+# 版本化 schema migration：取代啟動時的 create_all。
+# 每個 NNNN_name.py 提供 upgrade(conn)（在 transaction 內執行），
+# 可選 upgrade_concurrent(conn)（Postgres 上以 autocommit 執行，給 CREATE INDEX CONCURRENTLY 用）。
+# run: python -m app.migrations upgrade
+
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# 避免兩個 migrate process 同時跑（pg_advisory_lock 的 key，任意固定值）
+ADVISORY_LOCK_KEY = 4_817_2024
+
+_MODULE_RE = re.compile(r"^(\d{4})_\w+$")
+
+
+def discover():
+    """依版本號排序回傳所有 migration module"""
+    modules = []
+    for info in pkgutil.iter_modules(__path__):
+        m = _MODULE_RE.match(info.name)
+        if not m:
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        module.VERSION = int(m.group(1))
+        module.DESCRIPTION = (module.__doc__ or info.name).strip().splitlines()[0]
+        modules.append(module)
+    return sorted(modules, key=lambda mod: mod.VERSION)
+
+
+def applied_versions(conn) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def status(engine) -> List[dict]:
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+    return [{"version": m.VERSION, "description": m.DESCRIPTION, "applied": m.VERSION in done} for m in discover()]
+
+
+def upgrade(engine, log: Callable[[str], None] = print) -> int:
+    """套用所有尚未執行的 migration，回傳套用的數量"""
+    is_pg = engine.dialect.name == "postgresql"
+    count = 0
+    with engine.connect() as conn:
+        if is_pg:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            done = applied_versions(conn)
+            conn.commit()
+            for m in discover():
+                if m.VERSION in done:
+                    continue
+                log(f"Applying migration {m.VERSION:04d}: {m.DESCRIPTION}")
+                with conn.begin():
+                    m.upgrade(conn)
+                if hasattr(m, "upgrade_concurrent"):
+                    if is_pg:
+                        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as ac:
+                            m.upgrade_concurrent(ac)
+                    else:
+                        with conn.begin():
+                            m.upgrade_concurrent(conn)
+                with conn.begin():
+                    conn.execute(schema_migrations.insert().values(
+                        version=m.VERSION, description=m.DESCRIPTION, applied_at=datetime.utcnow()
+                    ))
+                count += 1
+        finally:
+            if is_pg:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                conn.commit()
+    return count
+
+
+# ---------------- helpers for migration modules ----------------
+def create_index(conn, name: str, table: str, columns: Sequence[str], unique: bool = False, using: Optional[str] = None):
+    """
+    可重複執行的 index 建立。Postgres 上必須在 autocommit connection（upgrade_concurrent）裡跑，
+    用 CREATE INDEX CONCURRENTLY 不擋寫入；之前中斷留下的 INVALID index 會先 drop 再重建。
+    using= 指定 access method（例如 "GIN"），只有 Postgres 有，其他 dialect 直接略過。
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cols = ", ".join(columns)
+    if using and conn.dialect.name != "postgresql":
+        return
+    method = f" USING {using}" if using else ""
+    if conn.dialect.name == "postgresql":
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+        conn.execute(text(f'CREATE {kind} CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}"{method} ({cols})'))
+    else:
+        conn.execute(text(f'CREATE {kind} IF NOT EXISTS "{name}" ON "{table}" ({cols})'))
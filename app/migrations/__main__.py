@@ -0,0 +1,26 @@
+# run: python -m app.migrations [upgrade|status]
+import sys
+
+from sqlmodel import create_engine
+
+from ..config import settings
+from . import status, upgrade
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    engine = create_engine(settings.DATABASE_URL)
+    if command == "upgrade":
+        applied = upgrade(engine)
+        print(f"{applied} migration(s) applied." if applied else "Schema is up to date.")
+    elif command == "status":
+        for m in status(engine):
+            print(f"{m['version']:04d} {'applied' if m['applied'] else 'pending':8} {m['description']}")
+    else:
+        print(f"unknown command: {command} (expected upgrade or status)", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
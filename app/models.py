@@ -1,4 +1,5 @@
 from typing import Optional, List
+from sqlalchemy import Column, Index, Text, text
 from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime, date
 
@@ -7,28 +8,28 @@ from datetime import datetime, date
 # ----------------------------
 class PaperAuthorLink(SQLModel, table=True):
     paper_id: Optional[int] = Field(default=None, foreign_key="paper.id", primary_key=True)
-    author_id: Optional[int] = Field(default=None, foreign_key="author.id", primary_key=True)
+    author_id: Optional[int] = Field(default=None, foreign_key="author.id", primary_key=True, index=True)
 
 # ----------------------------
 # Author ↔ Affiliation 多對多
 # ----------------------------
 class AuthorAffiliationLink(SQLModel, table=True):
     author_id: Optional[int] = Field(default=None, foreign_key="author.id", primary_key=True)
-    affiliation_id: Optional[int] = Field(default=None, foreign_key="affiliation.id", primary_key=True)
+    affiliation_id: Optional[int] = Field(default=None, foreign_key="affiliation.id", primary_key=True, index=True)
 
 # ----------------------------
 # Paper ↔ Tag 多對多
 # ----------------------------
 class PaperTag(SQLModel, table=True):
     paper_id: Optional[int] = Field(default=None, foreign_key="paper.id", primary_key=True)
-    tag_id: Optional[int] = Field(default=None, foreign_key="tag.id", primary_key=True)
+    tag_id: Optional[int] = Field(default=None, foreign_key="tag.id", primary_key=True, index=True)
 
 # ----------------------------
 # Author
 # ----------------------------
 class Author(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
+    name: str = Field(index=True, unique=True)
 
     papers: List["Paper"] = Relationship(back_populates="authors", link_model=PaperAuthorLink)
     affiliations: List["Affiliation"] = Relationship(back_populates="authors", link_model=AuthorAffiliationLink)
@@ -38,7 +39,7 @@ class Author(SQLModel, table=True):
 # ----------------------------
 class Affiliation(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
+    name: str = Field(index=True, unique=True)
 
     authors: List[Author] = Relationship(back_populates="affiliations", link_model=AuthorAffiliationLink)
 
@@ -46,6 +47,8 @@ class Affiliation(SQLModel, table=True):
 # Paper
 # ----------------------------
 class Paper(SQLModel, table=True):
+    __table_args__ = (Index("ix_paper_title_year", "paper_title", "published_year"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     paper_title: str
     published_year: int
@@ -61,7 +64,7 @@ class Paper(SQLModel, table=True):
 # ----------------------------
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    username: str
+    username: str = Field(index=True, unique=True)
     display_name: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -74,7 +77,7 @@ class User(SQLModel, table=True):
 class LabMeeting(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     meeting_title: str
-    meeting_date: date
+    meeting_date: date = Field(index=True)
     meeting_location: str
 
     reports: List["Report"] = Relationship(back_populates="meeting")
@@ -84,7 +87,7 @@ class LabMeeting(SQLModel, table=True):
 # ----------------------------
 class Tag(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
+    name: str = Field(index=True, unique=True)
 
     papers: List[Paper] = Relationship(back_populates="tags", link_model=PaperTag)
 
@@ -92,23 +95,43 @@ class Tag(SQLModel, table=True):
 # Report
 # ----------------------------
 class Report(SQLModel, table=True):
+    # feed 的 keyset pagination 依 (created_at, id) 排序
+    __table_args__ = (Index("ix_report_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     report_title: str
     report_summary: str
     slides_link: str
-    user_id: int = Field(foreign_key="user.id")
-    meeting_id: int = Field(foreign_key="labmeeting.id")
-    paper_id: Optional[int] = Field(default=None, foreign_key="paper.id")
+    user_id: int = Field(foreign_key="user.id", index=True)
+    meeting_id: int = Field(foreign_key="labmeeting.id", index=True)
+    paper_id: Optional[int] = Field(default=None, foreign_key="paper.id", index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     user: Optional[User] = Relationship(back_populates="reports")
     meeting: Optional[LabMeeting] = Relationship(back_populates="reports")
     paper: Optional[Paper] = Relationship(back_populates="reports")
     comments: List["Comment"] = Relationship(back_populates="report")
 
+# ----------------------------
+# Attachment（投影片 / PDF，檔案本身在 ATTACHMENT_DIR 以 sha256 定址）
+# ----------------------------
+class Attachment(SQLModel, table=True):
+    __table_args__ = (Index("ix_attachment_report_id_id", "report_id", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    report_id: int = Field(foreign_key="report.id")
+    user_id: int = Field(foreign_key="user.id")
+    sha256: str = Field(index=True)  # 同一份內容可以被多筆 attachment 共用
+    filename: str
+    content_type: str
+    size: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 # ----------------------------
 # Comment
 # ----------------------------
 class Comment(SQLModel, table=True):
+    __table_args__ = (Index("ix_comment_report_id_created_at", "report_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     report_id: int = Field(foreign_key="report.id")
     user_id: int = Field(foreign_key="user.id")
@@ -117,3 +140,62 @@ class Comment(SQLModel, table=True):
 
     report: Optional[Report] = Relationship(back_populates="comments")
     user: Optional[User] = Relationship(back_populates="comments")
+
+# ----------------------------
+# TagStats（/tags 目錄用的計數，upload / import 時以 delta 累加，不在 request 時 GROUP BY）
+# ----------------------------
+class TagStats(SQLModel, table=True):
+    tag_id: int = Field(foreign_key="tag.id", primary_key=True)
+    paper_count: int = Field(default=0)
+    report_count: int = Field(default=0)
+
+# ----------------------------
+# ActivityCounter（/stats dashboard 的 summary table：dimension / key / metric -> value）
+# 例：("presenter", "3", "reports") -> 12；由 upload / comment / import 以 delta 累加
+# ----------------------------
+class ActivityCounter(SQLModel, table=True):
+    # dashboard 的 top-N 查詢：WHERE dimension = ? AND metric = ? ORDER BY value DESC LIMIT n
+    __table_args__ = (Index("ix_activitycounter_dimension_metric_value", "dimension", "metric", "value"),)
+
+    dimension: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    metric: str = Field(primary_key=True)
+    value: int = Field(default=0)
+
+# ----------------------------
+# Job（app/jobs.py 的 background job queue；寫入端在同一個 transaction 裡 enqueue）
+# status: queued -> running -> done / failed（失敗且還有次數時回到 queued，run_at 往後延）
+# ----------------------------
+class Job(SQLModel, table=True):
+    __table_args__ = (
+        # worker 領取：WHERE status = 'queued' AND run_at <= now ORDER BY run_at, id
+        Index("ix_job_status_run_at_id", "status", "run_at", "id"),
+        # dedup_key 相同的 job 同時只會有一個在排隊
+        Index(
+            "ux_job_dedup_key_queued", "dedup_key", unique=True,
+            postgresql_where=text("status = 'queued'"), sqlite_where=text("status = 'queued'"),
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    payload: str = Field(default="{}", sa_column=Column(Text, nullable=False))  # JSON
+    dedup_key: Optional[str] = None
+    status: str = Field(default="queued")
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=5)
+    run_at: datetime = Field(default_factory=datetime.utcnow)
+    locked_at: Optional[datetime] = None
+    locked_by: Optional[str] = None
+    last_error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+# ----------------------------
+# PageGeneration（只有 id = 1 一列）：bulk import 這類改到既有 report 頁面內容（例如替舊 paper 補 tag）的寫入
+# 在同一個 transaction 裡 +1，所有 worker 的 page ETag / Last-Modified 一起變（app/page_cache.py）
+# ----------------------------
+class PageGeneration(SQLModel, table=True):
+    id: int = Field(default=1, primary_key=True)
+    generation: int = Field(default=0)
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,157 @@
+# page_cache.py
+# report / feed 頁面的 conditional GET（ETag / Last-Modified -> 304）與 rendered HTML cache。
+# 版本號由 DB 的便宜查詢算出（comment 數 / 最新 id / PageGeneration），多個 worker 之間也一致；
+# in-process 的 cache 只是省掉 render 與 template 需要的那幾個查詢。
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from .cache import LRUCache
+from .config import settings
+from .db import insert_for
+from .models import Attachment, Comment, PageGeneration, Report
+
+# value = (etag, body bytes)；以 body 大小計重
+page_cache = LRUCache(
+    "page",
+    settings.CACHE_MAX_ENTRIES,
+    settings.PAGE_CACHE_TTL_SECONDS,
+    weigher=lambda v: len(v[1]),
+    maxweight=settings.PAGE_CACHE_MAX_BYTES,
+)
+
+
+# ---------------- version keys ----------------
+def _generation_columns():
+    """PageGeneration 那一列，當成 scalar subquery 併進版本查詢（不多一次 round trip）；還沒有那一列時是 NULL"""
+    return (
+        select(PageGeneration.generation).where(PageGeneration.id == 1).scalar_subquery(),
+        select(PageGeneration.changed_at).where(PageGeneration.id == 1).scalar_subquery(),
+    )
+
+
+def _latest(*values: Optional[datetime]) -> Optional[datetime]:
+    found = [v for v in values if v is not None]
+    return max(found) if found else None
+
+
+def report_version(session: Session, report_id: int) -> Optional[Tuple[tuple, datetime]]:
+    """
+    report 頁面的 (version, last_modified)；report 不存在時回傳 None。
+    report 本身不會被編輯，只有新 comment / attachment 會改變頁面內容。
+    """
+    last_attachment = (
+        select(func.max(Attachment.id)).where(Attachment.report_id == Report.id).correlate(Report).scalar_subquery()
+    )
+    last_attachment_at = (
+        select(func.max(Attachment.created_at)).where(Attachment.report_id == Report.id).correlate(Report).scalar_subquery()
+    )
+    row = session.exec(
+        select(Report.created_at, func.count(Comment.id), func.max(Comment.id), func.max(Comment.created_at),
+               last_attachment, last_attachment_at, *_generation_columns())
+        .select_from(Report)
+        .outerjoin(Comment, Comment.report_id == Report.id)
+        .where(Report.id == report_id)
+        .group_by(Report.id, Report.created_at)
+    ).first()
+    if row is None:
+        return None
+    created_at, n_comments, last_comment_id, last_comment_at, last_attachment_id, attached_at, generation, changed_at = row
+    last_modified = _latest(created_at, last_comment_at, attached_at, changed_at)
+    return (n_comments, last_comment_id, last_attachment_id, generation), last_modified
+
+
+def feed_version(session: Session) -> Tuple[tuple, Optional[datetime]]:
+    """新 report 一定拿到更大的 id，max(id) 就足以當 feed 的版本號"""
+    last_id, last_at, generation, changed_at = session.exec(
+        select(func.max(Report.id), func.max(Report.created_at), *_generation_columns())
+    ).one()
+    return (last_id, generation), _latest(last_at, changed_at)
+
+
+# ---------------- conditional GET ----------------
+def make_etag(key: Hashable, version: tuple) -> str:
+    return '"' + hashlib.sha1(repr((key, version)).encode()).hexdigest()[:20] + '"'
+
+
+def _http_date(dt: datetime) -> str:
+    # DB 裡存的是 naive UTC（datetime.utcnow）
+    return format_datetime(dt.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """If-None-Match 優先；沒有時才看 If-Modified-Since（秒為單位比較）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+async def cached_page(
+    request: Request,
+    key: Hashable,
+    version: tuple,
+    last_modified: Optional[datetime],
+    render: Callable[[], Awaitable[Response]],
+) -> Response:
+    """
+    key 要包含所有影響 HTML 的東西（page、參數、登入的 username）。
+    304 不 render 也不查 template 需要的資料；cache hit 直接回 bytes；miss 才呼叫 render()。
+    """
+    etag = make_etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    hit = page_cache.get(key)
+    if hit is not None and hit[0] == etag:
+        return HTMLResponse(hit[1], headers=headers)
+
+    response = await render()
+    if response.status_code == 200:
+        page_cache.set(key, (etag, response.body))
+    response.headers.update(headers)
+    return response
+
+
+# ---------------- invalidation ----------------
+def invalidate_report_pages(report_id: int):
+    page_cache.invalidate_where(lambda k: k[0] == "report" and k[1] == report_id)
+
+
+def invalidate_feed_pages():
+    page_cache.invalidate_where(lambda k: k[0] == "feed")
+
+
+def bump_generation(session: Session):
+    """在呼叫端的 transaction 裡 +1；commit 之後每個 worker 算出的版本號都不同了，舊的 ETag / cache entry 自然失效"""
+    now = datetime.utcnow()
+    table = PageGeneration.__table__
+    session.execute(
+        insert_for(session, PageGeneration)
+        .values(id=1, generation=1, changed_at=now)
+        .on_conflict_do_update(index_elements=["id"], set_={"generation": table.c.generation + 1, "changed_at": now})
+    )
+
+
+def invalidate_all_pages():
+    """這個 process 的 cache 立刻清掉（其他 worker 的 entry 因為版本號不同不會再被用到）"""
+    page_cache.clear()
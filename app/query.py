@@ -0,0 +1,260 @@
+# query.py
+# /query 的動態條件 compiler：filter tree -> 單一 SELECT（多對多一律用 EXISTS，不會重複列）
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, and_, bindparam, exists, or_, true
+from sqlmodel import Session, select
+
+from .feed import clamp_limit, decode_cursor, encode_cursor, enrich_reports
+from .models import (
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+    User,
+)
+
+# field -> (column, relation the column lives on)
+FIELD_MAP = {
+    "report_title": (Report.report_title, "report"),
+    "report_summary": (Report.report_summary, "report"),
+    "presenter": (User.display_name, "presenter"),
+    "paper_title": (Paper.paper_title, "paper"),
+    "paper_year": (Paper.published_year, "paper"),
+    "venue": (Paper.journal_or_conference, "paper"),
+    "paper_tag": (Tag.name, "tag"),
+    "author_name": (Author.name, "author"),
+    "affiliation_name": (Affiliation.name, "affiliation"),
+}
+
+OPS = ("contains", "=", ">", ">=", "<", "<=")
+
+SORT_MAP = {
+    "created_at": Report.created_at,
+    "report_title": Report.report_title,
+    # correlated scalar subquery 而不 join Paper，outer FROM 只有 report，EXISTS 才不會被 auto-correlate 吃掉
+    "paper_year": select(Paper.published_year).where(Paper.id == Report.paper_id).correlate(Report).scalar_subquery(),
+}
+
+GROUP_KEYS = ("and", "or")
+
+# filter tree 的上限：太深會 RecursionError，節點太多則 shape（lru_cache 的 key）與 SQL 都會無限變大
+MAX_FILTER_DEPTH = 8
+MAX_FILTER_NODES = 100
+
+
+class QueryError(ValueError):
+    pass
+
+
+# ---------------- parse: filter tree -> (shape, values) ----------------
+def parse_filters(node, values: List[Any], depth: int = 0, counter: Optional[List[int]] = None):
+    """
+    把 request 的 filter tree 拆成「形狀」(可 hash，用來 cache statement) 與依序的參數值。
+    list 代表 AND；{"and": [...]} / {"or": [...]} 是明確的群組；葉節點是 {"field", "op", "value"}。
+    超過 MAX_FILTER_DEPTH 層或 MAX_FILTER_NODES 個節點時丟 QueryError。
+    """
+    counter = counter if counter is not None else [0]
+    counter[0] += 1
+    if counter[0] > MAX_FILTER_NODES:
+        raise QueryError(f"filter has more than {MAX_FILTER_NODES} nodes")
+    if depth > MAX_FILTER_DEPTH:
+        raise QueryError(f"filter is nested more than {MAX_FILTER_DEPTH} levels deep")
+    if isinstance(node, list):
+        return ("and", tuple(parse_filters(n, values, depth + 1, counter) for n in node))
+    if not isinstance(node, dict):
+        raise QueryError("filter must be an object or a list")
+    for key in GROUP_KEYS:
+        if key in node:
+            children = node[key]
+            if not isinstance(children, list):
+                raise QueryError(f"'{key}' must be a list")
+            return (key, tuple(parse_filters(n, values, depth + 1, counter) for n in children))
+
+    field, op = node.get("field"), node.get("op")
+    if not isinstance(field, str) or not isinstance(op, str):
+        raise QueryError("filter needs string 'field' and 'op'")
+    if field not in FIELD_MAP:
+        raise QueryError(f"unknown field: {field}")
+    if op not in OPS:
+        raise QueryError(f"unknown op: {op}")
+    col, _ = FIELD_MAP[field]
+    values.append(coerce_value(col, op, node.get("value")))
+    return ("leaf", field, op)
+
+
+def coerce_value(col, op, value):
+    is_int = isinstance(col.type, Integer)
+    if value is None or isinstance(value, (dict, list)):
+        raise QueryError(f"{col.key} {op} needs a string or number value")
+    if op == "contains":
+        if is_int:
+            raise QueryError(f"'contains' is not supported on {col.key}")
+        escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{escaped}%"
+    if is_int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise QueryError(f"{col.key} expects an integer")
+    return value
+
+
+# ---------------- compile: shape -> SQL ----------------
+def apply_filter(col, op, param):
+    if op == "contains":
+        return col.ilike(param, escape="\\")
+    if op == "=":
+        return col == param
+    if op == ">":
+        return col > param
+    if op == ">=":
+        return col >= param
+    if op == "<":
+        return col < param
+    if op == "<=":
+        return col <= param
+    raise QueryError(f"unknown op: {op}")
+
+
+def related_condition(relation: str, cond):
+    """
+    關聯 table 上的條件包成對 Report 的 correlated EXISTS，多對多比對不會讓 report 重複出現。
+    """
+    if relation == "report":
+        return cond
+    if relation == "presenter":
+        return exists().where(User.id == Report.user_id, cond).correlate(Report)
+    if relation == "paper":
+        return exists().where(Paper.id == Report.paper_id, cond).correlate(Report)
+    if relation == "tag":
+        return exists().where(
+            PaperTag.paper_id == Report.paper_id,
+            Tag.id == PaperTag.tag_id,
+            cond,
+        ).correlate(Report)
+    if relation == "author":
+        return exists().where(
+            PaperAuthorLink.paper_id == Report.paper_id,
+            Author.id == PaperAuthorLink.author_id,
+            cond,
+        ).correlate(Report)
+    if relation == "affiliation":
+        return exists().where(
+            PaperAuthorLink.paper_id == Report.paper_id,
+            AuthorAffiliationLink.author_id == PaperAuthorLink.author_id,
+            Affiliation.id == AuthorAffiliationLink.affiliation_id,
+            cond,
+        ).correlate(Report)
+    raise QueryError(f"unknown relation: {relation}")
+
+
+def compile_condition(shape, counter: List[int]):
+    kind = shape[0]
+    if kind == "leaf":
+        _, field, op = shape
+        col, relation = FIELD_MAP[field]
+        param = bindparam(f"p{counter[0]}", type_=col.type)
+        counter[0] += 1
+        return related_condition(relation, apply_filter(col, op, param))
+    children = [compile_condition(child, counter) for child in shape[1]]
+    if not children:
+        return true()
+    return and_(*children) if kind == "and" else or_(*children)
+
+
+@lru_cache(maxsize=256)
+def base_statement(shape, sort: str, descending: bool):
+    """filter + ORDER BY，沒有 paging；/export 直接拿這個串流"""
+    stmt = select(Report).where(compile_condition(shape, [0]))
+    sort_col = SORT_MAP[sort]
+    if descending:
+        return stmt.order_by(sort_col.desc(), Report.id.desc())
+    return stmt.order_by(sort_col.asc(), Report.id.asc())
+
+
+@lru_cache(maxsize=256)
+def compile_statement(shape, sort: str, descending: bool, with_cursor: bool, with_offset: bool):
+    """
+    每種 filter 形狀只建一次 SELECT，值在執行時才 bind：
+    同樣形狀的查詢重複使用這個物件，也用得到 SQLAlchemy 的 compiled-SQL cache。
+    """
+    stmt = base_statement(shape, sort, descending)
+
+    if with_cursor:
+        cursor_ts = bindparam("cursor_ts", type_=Report.created_at.type)
+        cursor_id = bindparam("cursor_id", type_=Report.id.type)
+        if descending:
+            stmt = stmt.where(or_(Report.created_at < cursor_ts, and_(Report.created_at == cursor_ts, Report.id < cursor_id)))
+        else:
+            stmt = stmt.where(or_(Report.created_at > cursor_ts, and_(Report.created_at == cursor_ts, Report.id > cursor_id)))
+
+    stmt = stmt.limit(bindparam("limit"))
+    if with_offset:
+        stmt = stmt.offset(bindparam("offset"))
+    return stmt
+
+
+# ---------------- run ----------------
+def prepare_query(req: Dict[str, Any]) -> Tuple[tuple, Dict[str, Any], str, bool]:
+    """驗證 filters / sort / order，回傳 (shape, params, sort, descending)；錯誤丟 QueryError"""
+    values: List[Any] = []
+    shape = parse_filters(req.get("filters") or [], values)
+
+    sort = req.get("sort") or "created_at"
+    if sort not in SORT_MAP:
+        raise QueryError(f"unknown sort: {sort}")
+    order = req.get("order") or "desc"
+    if order not in ("asc", "desc"):
+        raise QueryError(f"unknown order: {order}")
+    params: Dict[str, Any] = {f"p{i}": v for i, v in enumerate(values)}
+    return shape, params, sort, order == "desc"
+
+
+def run_filter_query(session: Session, req: Dict[str, Any]):
+    """
+    req:
+      filters: list (AND) or {"and"/"or": [...]} tree
+      sort: created_at | report_title | paper_year (default created_at)
+      order: desc | asc (default desc)
+      limit, offset, cursor (cursor only with sort=created_at)
+    回傳 {"results": [...], "next_cursor": ..., "has_more": ...}
+    """
+    shape, params, sort, descending = prepare_query(req)
+
+    cursor = req.get("cursor")
+    if cursor is not None and not isinstance(cursor, str):
+        raise QueryError("cursor must be a string")
+    if cursor and sort != "created_at":
+        raise QueryError("cursor paging requires sort=created_at")
+    try:
+        offset = int(req.get("offset") or 0)
+        limit = clamp_limit(int(req["limit"]) if req.get("limit") else None)
+    except (TypeError, ValueError):
+        raise QueryError("limit/offset must be integers")
+
+    stmt = compile_statement(shape, sort, descending, bool(cursor), offset > 0)
+
+    params["limit"] = limit + 1
+    if offset > 0:
+        params["offset"] = offset
+    if cursor:
+        params["cursor_ts"], params["cursor_id"] = decode_cursor(cursor)
+
+    reports = session.execute(stmt, params).scalars().all()
+    has_more = len(reports) > limit
+    reports = reports[:limit]
+    next_cursor = None
+    if has_more and reports and sort == "created_at":
+        next_cursor = encode_cursor(reports[-1])
+    return {
+        "results": enrich_reports(session, reports),
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }
@@ -0,0 +1,462 @@
+# recommend.py
+# /reports/{id} 的 "related reports"：report_title / report_summary / paper_title / tag names 建成
+# sparse TF-IDF matrix（scipy CSR，每列已 L2 normalize），cosine similarity 就是一次 sparse matrix 乘法。
+# IDF 在整批 build 時固定；新的 report 用同一組 IDF 算好後接在 matrix 後面（tail），不用重算整張。
+# matrix 存成 .npy，worker 啟動時以 mmap 開啟，只補上 snapshot 之後新增的 report。
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .config import settings
+from .feed import enrich_reports, load_by_id, load_tags_by_paper
+from .jobs import enqueue_detached, job_handler
+from .models import Paper, Report
+from .search import tokenize
+from .startup import lazy_module
+
+# numpy + scipy 的 import 佔了冷啟動的一大段，第一次用到 related index 時才 import
+np = lazy_module("numpy")
+sparse = lazy_module("scipy.sparse")
+
+# 與 search.InvertedIndex.FIELD_WEIGHTS 同樣的想法：標題比摘要重要
+FIELD_WEIGHTS = {"report_title": 1.0, "report_summary": 0.4, "paper_title": 1.0, "tags": 0.8}
+BUILD_BATCH_SIZE = 2000
+# 一次 batch 查詢最多幾列一起乘（dense 結果是 rows × n_docs 個 float32）
+QUERY_BATCH_ROWS = 64
+MIN_SCORE = 0.05
+MAX_RELATED_K = 50
+
+_CURRENT = "CURRENT"
+
+
+# ---------------- documents ----------------
+def doc_terms(report_title: str, report_summary: str, paper_title: Optional[str], tag_names: Iterable[str]) -> Dict[str, float]:
+    """term -> 加權後的 term frequency"""
+    tf: Counter = Counter()
+    for field, text_ in (("report_title", report_title), ("report_summary", report_summary), ("paper_title", paper_title)):
+        for token in tokenize(text_):
+            tf[token] += FIELD_WEIGHTS[field]
+    for name in tag_names:
+        for token in tokenize(name):
+            tf[token] += FIELD_WEIGHTS["tags"]
+    return tf
+
+
+def iter_docs(session: Session, after_id: int = 0) -> Iterable[List[Tuple[int, Dict[str, float]]]]:
+    """id > after_id 的 reports，依 id 排序，每批 [(report_id, terms)]"""
+    result = session.execute(
+        select(Report.id, Report.report_title, Report.report_summary, Report.paper_id, Paper.paper_title)
+        .outerjoin(Paper, Paper.id == Report.paper_id)
+        .where(Report.id > after_id)
+        .order_by(Report.id),
+        execution_options={"yield_per": BUILD_BATCH_SIZE},
+    )
+    for rows in result.partitions():
+        tags = load_tags_by_paper(session, (r.paper_id for r in rows))
+        yield [
+            (r.id, doc_terms(r.report_title, r.report_summary, r.paper_title, (t.name for t in tags.get(r.paper_id, []))))
+            for r in rows
+        ]
+
+
+# ---------------- index ----------------
+class RelatedIndex:
+    """
+    base：snapshot 的 matrix 與其轉置（可能是 mmap）；tail：之後新增、還沒存檔的列。
+    row 依 report id 遞增，所以 row 比較小就是比較早的 report。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.vocab: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.n_build_docs = 0
+        self.base = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.base_t = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.base_ids = np.zeros(0, dtype=np.int64)
+        self.tail_rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.tail_ids: List[int] = []
+        self._tail = None  # tail 的轉置，查詢時才建
+        self._ids = None
+        self.loaded = False
+        self.snapshot: Optional[str] = None
+        self.refreshed_at = 0.0
+
+    @property
+    def max_report_id(self) -> int:
+        if self.tail_ids:
+            return self.tail_ids[-1]
+        return int(self.base_ids[-1]) if len(self.base_ids) else 0
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.base_ids) + len(self.tail_ids)
+
+    # -------- build --------
+    def build(self, session: Session):
+        """整批重算：document frequency 掃一次，IDF 固定後每列算 TF-IDF 再 normalize"""
+        docs: List[Tuple[int, Dict[str, float]]] = []
+        for batch in iter_docs(session):
+            docs.extend(batch)
+        df: Counter = Counter()
+        for _, terms in docs:
+            df.update(terms.keys())
+        vocab = {term: i for i, term in enumerate(sorted(df))}
+        n = len(docs)
+        # 與 sklearn 的 smooth_idf 相同
+        idf = np.array([math.log((1 + n) / (1 + df[t])) + 1.0 for t in sorted(df)], dtype=np.float32)
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indices: List[np.ndarray] = []
+        data: List[np.ndarray] = []
+        for i, (_, terms) in enumerate(docs):
+            cols, vals = self._vectorize(terms, vocab, idf)
+            indices.append(cols)
+            data.append(vals)
+            indptr[i + 1] = indptr[i] + len(cols)
+        matrix = sparse.csr_matrix(
+            (np.concatenate(data) if data else np.zeros(0, np.float32),
+             np.concatenate(indices) if indices else np.zeros(0, np.int32),
+             indptr),
+            shape=(n, len(vocab)),
+        )
+        with self._lock:
+            self.reset()
+            self.vocab, self.idf, self.n_build_docs = vocab, idf, n
+            self.base, self.base_t = matrix, matrix.T.tocsr()
+            self.base_ids = np.array([doc_id for doc_id, _ in docs], dtype=np.int64)
+            self.loaded = True
+            self.refreshed_at = time.monotonic()
+
+    def _vectorize(self, terms: Dict[str, float], vocab: Dict[str, int], idf: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """sublinear tf × idf，L2 normalize；vocab 裡沒有的 term 直接略過（見 add_docs）"""
+        pairs = sorted((vocab[t], w) for t, w in terms.items() if t in vocab)
+        cols = np.fromiter((c for c, _ in pairs), dtype=np.int32, count=len(pairs))
+        vals = np.fromiter((1.0 + math.log(w) if w >= 1 else w for _, w in pairs), dtype=np.float32, count=len(pairs))
+        vals *= idf[cols]
+        norm = float(np.linalg.norm(vals))
+        if norm:
+            vals /= norm
+        return cols, vals
+
+    def add_docs(self, docs: List[Tuple[int, Dict[str, float]]]):
+        """
+        新 report 接到 tail。新出現的 term 加進 vocab，IDF 當成只出現在這一篇（最大值）；
+        下次整批 build 時才重新估計。
+        """
+        if not docs:
+            return
+        with self._lock:
+            max_idf = math.log(1 + self.n_build_docs) + 1.0
+            new_terms = sorted({t for _, terms in docs for t in terms if t not in self.vocab})
+            if new_terms:
+                start = len(self.vocab)
+                self.vocab.update({t: start + i for i, t in enumerate(new_terms)})
+                self.idf = np.concatenate([self.idf, np.full(len(new_terms), max_idf, dtype=np.float32)])
+            last = self.max_report_id
+            for doc_id, terms in docs:
+                if doc_id <= last:
+                    continue
+                self.tail_rows.append(self._vectorize(terms, self.vocab, self.idf))
+                self.tail_ids.append(doc_id)
+                last = doc_id
+            self._tail = None
+
+    def catch_up(self, session: Session) -> int:
+        added = 0
+        for batch in iter_docs(session, after_id=self.max_report_id):
+            self.add_docs(batch)
+            added += len(batch)
+        self.refreshed_at = time.monotonic()
+        return added
+
+    @property
+    def needs_snapshot(self) -> bool:
+        return len(self.tail_ids) >= settings.RELATED_SAVE_EVERY
+
+    # -------- query --------
+    def _matrices(self):
+        """
+        (base, base_t, tail_rows, tail_t, ids)，在 lock 裡一次取出：查詢期間 load() / build() 換掉 index 也不會混用新舊兩份。
+        base_t 是 base 的轉置（term -> docs，也是 CSR），查詢只會碰到跟 Q 有共同 term 的 docs，不必每次把整張 matrix 轉置。
+        """
+        with self._lock:
+            if self._tail is None:
+                tail = _csr_from_rows(self.tail_rows, len(self.vocab))
+                self._tail = tail.T.tocsr()
+                self._ids = np.concatenate([self.base_ids, np.array(self.tail_ids, dtype=np.int64)])
+            # tail_rows 之後只會 append（換掉 index 時是換成新的 list），ids 範圍內的列不會變
+            return self.base, self.base_t, self.tail_rows, self._tail, self._ids
+
+    @staticmethod
+    def _row(base, tail_rows, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_base = base.shape[0]
+        if row < n_base:
+            start, end = base.indptr[row], base.indptr[row + 1]
+            return base.indices[start:end], base.data[start:end]
+        return tail_rows[row - n_base]
+
+    def related(self, report_ids: List[int], k: int, earlier_only: bool = False) -> Dict[int, List[Tuple[int, float]]]:
+        """
+        report id -> [(related report id, cosine score)]，batch 一起算：
+        Q (m × terms) 乘 matrix.T 得到 m × n_docs 的相似度，每列 argpartition 取 top-k。
+        不在 index 裡的 id 回傳空 list。
+        """
+        base, base_t, tail_rows, tail_t, ids = self._matrices()
+        out: Dict[int, List[Tuple[int, float]]] = {rid: [] for rid in report_ids}
+        if not len(ids):
+            return out
+        rows = np.searchsorted(ids, report_ids)
+        found = [(rid, int(row)) for rid, row in zip(report_ids, rows) if row < len(ids) and ids[row] == rid]
+        n_base_terms = base_t.shape[0]
+        for start in range(0, len(found), QUERY_BATCH_ROWS):
+            chunk = found[start:start + QUERY_BATCH_ROWS]
+            q = _csr_from_rows([self._row(base, tail_rows, row) for _, row in chunk], tail_t.shape[0])
+            # snapshot 之後才出現的 term 不會出現在 base 的 docs 裡
+            scores = np.hstack([(q[:, :n_base_terms] @ base_t).toarray(), (q @ tail_t).toarray()])
+            for i, (rid, row) in enumerate(chunk):
+                s = scores[i]
+                s[row] = -1.0
+                if earlier_only:
+                    s[row:] = -1.0
+                kk = min(k, len(s))
+                top = np.argpartition(-s, kk - 1)[:kk]
+                top = top[np.argsort(-s[top], kind="stable")]
+                out[rid] = [(int(ids[j]), round(float(s[j]), 4)) for j in top if s[j] >= MIN_SCORE]
+        return out
+
+    # -------- persistence --------
+    def save(self, directory: Optional[str] = None):
+        """
+        base + tail 合併寫成新的 snapshot 目錄，再以 os.replace 換掉 CURRENT（多個 worker 同時存檔也不會讀到一半的檔案）。
+        存完後改用 mmap 開啟剛寫好的檔案，tail 清空。
+        """
+        directory = directory or settings.RELATED_DIR
+        with self._lock:
+            tail = _csr_from_rows(self.tail_rows, len(self.vocab))
+            base = self.base
+            if base.shape[1] != tail.shape[1]:
+                base = sparse.csr_matrix((base.data, base.indices, base.indptr), shape=(base.shape[0], tail.shape[1]))
+            matrix = sparse.vstack([base, tail], format="csr") if tail.shape[0] else base
+            ids = np.concatenate([self.base_ids, np.array(self.tail_ids, dtype=np.int64)])
+            vocab = sorted(self.vocab, key=self.vocab.get)
+            idf = np.array(self.idf)
+            n_build_docs = self.n_build_docs
+        name = f"snapshot-{int(time.time() * 1000)}-{os.getpid()}"
+        path = os.path.join(directory, name)
+        os.makedirs(path, exist_ok=True)
+        _save_csr(path, "", matrix)
+        _save_csr(path, "t_", matrix.T.tocsr())
+        np.save(os.path.join(path, "ids.npy"), ids)
+        np.save(os.path.join(path, "idf.npy"), idf)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"vocab": vocab, "n_build_docs": n_build_docs, "shape": list(matrix.shape)}, f, ensure_ascii=False)
+        tmp = os.path.join(directory, f"{_CURRENT}.{os.getpid()}")
+        with open(tmp, "w") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(directory, _CURRENT))
+        self.load(directory)
+        _prune_snapshots(directory, keep=name)
+
+    def load(self, directory: Optional[str] = None) -> bool:
+        """CURRENT 指到的 snapshot 以 mmap 開啟；沒有 snapshot 時回傳 False"""
+        directory = directory or settings.RELATED_DIR
+        name = current_snapshot(directory)
+        if name is None:
+            return False
+        path = os.path.join(directory, name)
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            n_docs, n_terms = meta["shape"]
+            matrix = _load_csr(path, "", (n_docs, n_terms))
+            matrix_t = _load_csr(path, "t_", (n_terms, n_docs))
+            ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+            idf = np.load(os.path.join(path, "idf.npy"))  # vocab 變大時要 concatenate，放 RAM
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self.reset()
+            self.vocab = {t: i for i, t in enumerate(meta["vocab"])}
+            self.idf = idf
+            self.n_build_docs = meta["n_build_docs"]
+            self.base, self.base_t = matrix, matrix_t
+            self.base_ids = ids
+            self.loaded = True
+            self.snapshot = name
+        return True
+
+
+def _csr_from_rows(rows: List[Tuple[np.ndarray, np.ndarray]], n_cols: int) -> sparse.csr_matrix:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c, _ in rows], out=indptr[1:])
+    return sparse.csr_matrix(
+        (np.concatenate([v for _, v in rows]) if rows else np.zeros(0, np.float32),
+         np.concatenate([c for c, _ in rows]) if rows else np.zeros(0, np.int32),
+         indptr),
+        shape=(len(rows), n_cols),
+    )
+
+
+def _save_csr(path: str, prefix: str, m: sparse.csr_matrix):
+    # scipy 會把放得下的 index 轉成 int32；直接存 int32，load 時才不會複製一份
+    index_dtype = np.int32 if m.nnz < 2 ** 31 else np.int64
+    np.save(os.path.join(path, f"{prefix}data.npy"), m.data.astype(np.float32, copy=False))
+    np.save(os.path.join(path, f"{prefix}indices.npy"), m.indices.astype(index_dtype, copy=False))
+    np.save(os.path.join(path, f"{prefix}indptr.npy"), m.indptr.astype(index_dtype, copy=False))
+
+
+def _load_csr(path: str, prefix: str, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    arrays = [np.load(os.path.join(path, f"{prefix}{part}.npy"), mmap_mode="r") for part in ("data", "indices", "indptr")]
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def current_snapshot(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, _CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _prune_snapshots(directory: str, keep: str):
+    """留下目前的與前一份（其他 worker 可能還 mmap 著）"""
+    snapshots = sorted(d for d in os.listdir(directory) if d.startswith("snapshot-"))
+    for d in snapshots[:-2]:
+        if d != keep:
+            shutil.rmtree(os.path.join(directory, d), ignore_errors=True)
+
+
+_related_index: Optional[RelatedIndex] = None
+_init_lock = threading.Lock()
+_create_lock = threading.Lock()
+_build_requested_at: Optional[float] = None
+
+
+def get_related_index() -> RelatedIndex:
+    """第一次用到時才建立：空的 index 也是 numpy / scipy 物件，module import 時不建立（冷啟動不 import numpy）"""
+    global _related_index
+    if _related_index is None:
+        with _create_lock:
+            if _related_index is None:
+                _related_index = RelatedIndex()
+    return _related_index
+
+
+# ---------------- public API ----------------
+def request_build(session: Session):
+    """還沒有 snapshot：整批 build 交給 related_snapshot job（幾秒到幾分鐘，不放在 request 裡），每個 refresh 週期最多排一次"""
+    global _build_requested_at
+    now = time.monotonic()
+    if _build_requested_at is None or now - _build_requested_at > settings.RELATED_REFRESH_SECONDS:
+        _build_requested_at = now
+        enqueue_detached(session, "related_snapshot", dedup_key="related_snapshot")
+
+
+def ensure_related_index(session: Session) -> RelatedIndex:
+    """
+    第一次用到時：有 snapshot 就 mmap 開啟再補上之後的 report；沒有就排一個 job 去 build，
+    在那之前 index 是空的（related 區塊不顯示）。
+    之後每 RELATED_REFRESH_SECONDS 補一次其他 worker 新增的 report；
+    snapshot 被換掉（rebuild_related 或其他 worker 存檔）時改開新的。
+    """
+    index = get_related_index()
+    stale = time.monotonic() - index.refreshed_at > settings.RELATED_REFRESH_SECONDS
+    # 不等 lock：DB_ASYNC 時 run_sync 跑在 event loop thread 上，等 lock 會卡住整個 loop。
+    # 別人正在載入 / 補資料時先用現有的 index（還沒載入就是空的，related 區塊暫時不顯示）
+    if (not index.loaded or stale) and _init_lock.acquire(blocking=False):
+        try:
+            if not index.loaded:
+                if index.load():
+                    index.catch_up(session)
+                else:
+                    request_build(session)
+            elif time.monotonic() - index.refreshed_at > settings.RELATED_REFRESH_SECONDS:
+                if index.snapshot != current_snapshot(settings.RELATED_DIR):
+                    index.load()
+                index.catch_up(session)
+                if index.needs_snapshot:
+                    enqueue_detached(session, "related_snapshot", dedup_key="related_snapshot")
+        finally:
+            _init_lock.release()
+    return index
+
+
+def snapshot_time(name: Optional[str]) -> Optional[datetime]:
+    """snapshot-{ms}-{pid} -> 存檔時間（naive UTC，與 DB 的時間欄位相同）"""
+    try:
+        return datetime.utcfromtimestamp(int(name.split("-")[1]) / 1000)
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def related_version(session: Session, report_id: int) -> Tuple[tuple, Optional[datetime]]:
+    """
+    report 頁面的 related 區塊（earlier_only）只在換 snapshot（IDF 重算）或這份 report 第一次進 index 時改變，
+    之後新增的 report 都比它晚，不會出現在區塊裡。回傳 (version, 區塊最後改變的時間)：
+    version 只用 snapshot 名稱與是否已進 index，每個 worker 算出來都一樣；
+    還沒進 index 時時間是 None（之後一定會變，但沒有時間可以比），頁面就不送 Last-Modified。
+    """
+    index = ensure_related_index(session)
+    indexed = index.loaded and report_id <= index.max_report_id
+    return (index.snapshot, indexed), snapshot_time(index.snapshot) if indexed else None
+
+
+def load_related_reports(session: Session, report_id: int, k: Optional[int] = None, earlier_only: bool = False) -> List[dict]:
+    """enriched reports（feed.enrich_reports 的格式）加上 "score"，相似度高的在前"""
+    k = min(k or settings.RELATED_TOP_K, MAX_RELATED_K)
+    hits = ensure_related_index(session).related([report_id], k, earlier_only)[report_id]
+    reports = load_by_id(session, Report, (rid for rid, _ in hits))
+    items = enrich_reports(session, [reports[rid] for rid, _ in hits if rid in reports])
+    scores = dict(hits)
+    for item in items:
+        item["score"] = scores[item["r"].id]
+    return items
+
+
+def refresh_related(session: Session):
+    """upload / import 之後呼叫；index 還沒載入時不做事（第一次查詢會處理）"""
+    index = _related_index
+    if index is not None and index.loaded:
+        index.catch_up(session)
+        if index.needs_snapshot:
+            enqueue_detached(session, "related_snapshot", dedup_key="related_snapshot")
+
+
+@job_handler("related_snapshot")
+def snapshot_related(session: Session, payload: dict):
+    """
+    tail 累積到 RELATED_SAVE_EVERY 之後存一份新的 snapshot（寫檔、轉置要幾秒，不放在 request 裡）。
+    process pool 的 worker 沒有現成的 index，先開 snapshot 再補上。
+    """
+    with _init_lock:
+        index = get_related_index()
+        if not index.loaded and not index.load():
+            index.build(session)
+            index.save()
+            return
+        index.catch_up(session)
+        if index.tail_ids:
+            index.save()
+
+
+def rebuild_related(session: Session, directory: Optional[str] = None) -> dict:
+    """重新估計 IDF、整批重算並存檔（scripts/rebuild_related.py）"""
+    index = RelatedIndex()
+    index.build(session)
+    index.save(directory)
+    return {"docs": index.n_docs, "terms": len(index.vocab), "nnz": int(index.base.nnz)}
@@ -0,0 +1,419 @@
+# search.py
+# 全文檢索：Postgres 用 tsvector (GIN) + pg_trgm；SQLite 等測試環境用純 Python inverted index
+
+import html
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlmodel import Session, select
+
+from .feed import clamp_limit, enrich_reports, load_by_id
+from .models import (
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+)
+
+TS_CONFIG = "english"
+
+# 與 pg_trgm 的預設 word_similarity_threshold 相同（名稱用 :q <% name 比對）
+TRGM_THRESHOLD = 0.6
+
+# fuzzy name hit 對 report 排名的權重（相對於全文命中）
+PAPER_WEIGHT = 0.5
+ENTITY_WEIGHT = 0.3
+
+# ts_headline / fallback snippet 先用控制字元標記，escape 後再換成 <mark>
+_START, _STOP = "\x02", "\x03"
+
+# search_vector 是一般欄位，由 trigger 維護：ADD COLUMN ... GENERATED ALWAYS ... STORED 會鎖住並重寫整張表，
+# 加一個沒有 default 的 nullable 欄位只改 catalog，既有的 row 之後分批補
+# {row} 是欄位前綴：trigger 裡用 "NEW."，backfill 的 UPDATE 用 ""
+SEARCH_VECTORS = {
+    "report": (
+        ("report_title", "report_summary"),
+        f"setweight(to_tsvector('{TS_CONFIG}', coalesce({{row}}report_title, '')), 'A') || "
+        f"setweight(to_tsvector('{TS_CONFIG}', coalesce({{row}}report_summary, '')), 'B')",
+    ),
+    "paper": (
+        ("paper_title", "journal_or_conference"),
+        f"setweight(to_tsvector('{TS_CONFIG}', coalesce({{row}}paper_title, '')), 'A') || "
+        f"setweight(to_tsvector('{TS_CONFIG}', coalesce({{row}}journal_or_conference, '')), 'C')",
+    ),
+}
+
+BACKFILL_BATCH_SIZE = 5000
+
+# (index name, table, columns)：由 migration 的 upgrade_concurrent 以 CREATE INDEX CONCURRENTLY 建立
+SEARCH_INDEXES = [
+    ("ix_report_search_vector", "report", ["search_vector"]),
+    ("ix_paper_search_vector", "paper", ["search_vector"]),
+    # trigram：fuzzy 名稱比對，也讓 /query 的 contains (ILIKE '%x%') 可以走 index
+    ("ix_author_name_trgm", "author", ["name gin_trgm_ops"]),
+    ("ix_affiliation_name_trgm", "affiliation", ["name gin_trgm_ops"]),
+    ("ix_tag_name_trgm", "tag", ["name gin_trgm_ops"]),
+    ("ix_report_title_trgm", "report", ["report_title gin_trgm_ops"]),
+    ("ix_paper_title_trgm", "paper", ["paper_title gin_trgm_ops"]),
+]
+
+
+def install_search_columns(conn):
+    """search_vector 欄位與維護它的 trigger（idempotent，由 migration 0002 在 transaction 內呼叫）；非 Postgres 不做事"""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for table, (columns, expr) in SEARCH_VECTORS.items():
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {expr.format(row="NEW.")};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()"
+        ))
+
+
+def backfill_search_vectors(conn, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """既有的 row 分批補上 search_vector；在 autocommit connection 上每批各自 commit，一次只鎖住 batch_size 列"""
+    if conn.dialect.name != "postgresql":
+        return 0
+    total = 0
+    for table, (_, expr) in SEARCH_VECTORS.items():
+        while True:
+            n = conn.execute(text(f"""
+                UPDATE {table} SET search_vector = {expr.format(row="")}
+                 WHERE id IN (SELECT id FROM {table} WHERE search_vector IS NULL ORDER BY id LIMIT :n)
+            """), {"n": batch_size}).rowcount
+            total += n
+            if n < batch_size:
+                break
+    return total
+
+
+def highlight(marked: str) -> str:
+    marked = marked.replace(_STOP + _START, "")
+    return html.escape(marked).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+# ---------------- Postgres ----------------
+PG_RANK_SQL = text(f"""
+WITH q AS (SELECT websearch_to_tsquery('{TS_CONFIG}', :q) AS query),
+hits AS (
+    SELECT r.id AS report_id, ts_rank(r.search_vector, q.query) AS score
+      FROM report r, q
+     WHERE r.search_vector @@ q.query
+    UNION ALL
+    SELECT r.id, {PAPER_WEIGHT} * ts_rank(p.search_vector, q.query)
+      FROM q, paper p
+      JOIN report r ON r.paper_id = p.id
+     WHERE p.search_vector @@ q.query
+    UNION ALL
+    SELECT r.id, {ENTITY_WEIGHT} * word_similarity(:q, t.name)
+      FROM tag t
+      JOIN papertag pt ON pt.tag_id = t.id
+      JOIN report r ON r.paper_id = pt.paper_id
+     WHERE :q <% t.name
+    UNION ALL
+    SELECT r.id, {ENTITY_WEIGHT} * word_similarity(:q, a.name)
+      FROM author a
+      JOIN paperauthorlink pa ON pa.author_id = a.id
+      JOIN report r ON r.paper_id = pa.paper_id
+     WHERE :q <% a.name
+    UNION ALL
+    SELECT r.id, {ENTITY_WEIGHT} * word_similarity(:q, af.name)
+      FROM affiliation af
+      JOIN authoraffiliationlink aa ON aa.affiliation_id = af.id
+      JOIN paperauthorlink pa ON pa.author_id = aa.author_id
+      JOIN report r ON r.paper_id = pa.paper_id
+     WHERE :q <% af.name
+)
+SELECT report_id, sum(score) AS rank
+  FROM hits
+ GROUP BY report_id
+ ORDER BY rank DESC, report_id DESC
+ LIMIT :limit OFFSET :offset
+""")
+
+PG_SNIPPET_SQL = text(f"""
+WITH q AS (SELECT websearch_to_tsquery('{TS_CONFIG}', :q) AS query)
+SELECT r.id,
+       ts_headline('{TS_CONFIG}',
+                   r.report_title || ' ' || r.report_summary || ' ' || coalesce(p.paper_title, ''),
+                   q.query,
+                   'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxFragments=2, MaxWords=30, MinWords=10')
+  FROM report r
+  LEFT JOIN paper p ON p.id = r.paper_id, q
+ WHERE r.id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+PG_ENTITY_SQL = text("""
+SELECT kind, id, name, sim FROM (
+    SELECT 'author' AS kind, id, name, word_similarity(:q, name) AS sim FROM author WHERE :q <% name
+    UNION ALL
+    SELECT 'affiliation', id, name, word_similarity(:q, name) FROM affiliation WHERE :q <% name
+    UNION ALL
+    SELECT 'tag', id, name, word_similarity(:q, name) FROM tag WHERE :q <% name
+) m
+ORDER BY sim DESC
+LIMIT :limit
+""")
+
+
+def _search_postgres(session: Session, q: str, limit: int, offset: int):
+    ranked = session.execute(PG_RANK_SQL, {"q": q, "limit": limit, "offset": offset}).all()
+    ids = [row.report_id for row in ranked]
+    snippets = {}
+    if ids:
+        snippets = dict(session.execute(PG_SNIPPET_SQL, {"q": q, "ids": ids}).all())
+    entities = [
+        {"kind": row.kind, "id": row.id, "name": row.name, "score": float(row.sim)}
+        for row in session.execute(PG_ENTITY_SQL, {"q": q, "limit": 10}).all()
+    ]
+    hits = [(row.report_id, float(row.rank), highlight(snippets.get(row.report_id) or "")) for row in ranked]
+    return hits, entities
+
+
+# ---------------- pure-Python fallback ----------------
+_TOKEN_RE = re.compile("[a-z0-9]+|[\u3400-\u9fff]")
+
+
+def tokenize(s: str) -> List[str]:
+    """英數字以單字切，中日文以單字元切"""
+    return _TOKEN_RE.findall((s or "").lower())
+
+
+def trigrams(s: str) -> Set[str]:
+    # 與 pg_trgm 相同：每個字前補兩個空白、後補一個空白
+    grams = set()
+    for word in re.findall(r"\w+", (s or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(q_grams: Set[str], name: str) -> float:
+    """近似 pg_trgm 的 word_similarity：q 的 trigram 在 name 中最相近的一個字裡佔多少"""
+    if not q_grams:
+        return 0.0
+    best = 0.0
+    for word in re.findall(r"\w+", (name or "").lower()) + [name or ""]:
+        best = max(best, len(q_grams & trigrams(word)) / len(q_grams))
+    return best
+
+
+class InvertedIndex:
+    """
+    非 Postgres（SQLite 測試、本機開發）時代替 tsvector / pg_trgm index 的記憶體 index。
+    第一次 search 時從 DB 整批建立，之後每次 upload 逐筆加入。
+    """
+
+    # 與 Postgres setweight 的 A/B/C 權重一致
+    FIELD_WEIGHTS = {"report_title": 1.0, "report_summary": 0.4, "paper_title": 1.0, "venue": 0.2}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = False
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.doc_len: Dict[int, float] = {}
+        self.doc_text: Dict[int, str] = {}
+        # (kind, id) -> (name, report ids)
+        self.entities: Dict[Tuple[str, int], Tuple[str, Set[int]]] = {}
+
+    def clear(self):
+        with self.lock:
+            self.built = False
+            self.postings.clear()
+            self.doc_len.clear()
+            self.doc_text.clear()
+            self.entities.clear()
+
+    # -------- build --------
+    # DB 讀取不放在 lock 裡：DB_ASYNC 時 run_sync 跑在 event loop thread 上，等 lock 會卡住整個 loop。
+    # lock 只包住記憶體內的更新（中間沒有 I/O）
+    def build(self, session: Session):
+        if self.built:
+            return
+        loaded = self._load(session, session.exec(select(Report)).all())
+        with self.lock:
+            if self.built:
+                return
+            self._apply(loaded)
+            self.built = True
+
+    def add_report(self, session: Session, report_id: int):
+        """upload 後呼叫；index 尚未建立時不做事（第一次 search 會整批建立）"""
+        if not self.built:
+            return
+        report = session.get(Report, report_id)
+        if not report:
+            return
+        loaded = self._load(session, [report])
+        with self.lock:
+            # 讀取期間被 clear() 的話交給下次 build
+            if self.built:
+                self._apply(loaded)
+
+    def _load(self, session: Session, reports: List[Report]) -> dict:
+        papers = load_by_id(session, Paper, (r.paper_id for r in reports))
+        reports_by_paper: Dict[int, Set[int]] = defaultdict(set)
+        for r in reports:
+            if r.paper_id in papers:
+                reports_by_paper[r.paper_id].add(r.id)
+        loaded = {"reports": reports, "papers": papers, "reports_by_paper": reports_by_paper,
+                  "tag_rows": [], "author_rows": [], "author_papers": defaultdict(set), "aff_rows": []}
+        if not reports_by_paper:
+            return loaded
+
+        paper_ids = list(reports_by_paper)
+        loaded["tag_rows"] = session.exec(
+            select(PaperTag.paper_id, Tag).join(Tag, Tag.id == PaperTag.tag_id).where(PaperTag.paper_id.in_(paper_ids))
+        ).all()
+        loaded["author_rows"] = session.exec(
+            select(PaperAuthorLink.paper_id, Author).join(Author, Author.id == PaperAuthorLink.author_id).where(PaperAuthorLink.paper_id.in_(paper_ids))
+        ).all()
+        author_papers = loaded["author_papers"]
+        for paper_id, author in loaded["author_rows"]:
+            author_papers[author.id].add(paper_id)
+        if author_papers:
+            loaded["aff_rows"] = session.exec(
+                select(AuthorAffiliationLink.author_id, Affiliation)
+                .join(Affiliation, Affiliation.id == AuthorAffiliationLink.affiliation_id)
+                .where(AuthorAffiliationLink.author_id.in_(list(author_papers)))
+            ).all()
+        return loaded
+
+    def _apply(self, loaded: dict):
+        papers, reports_by_paper = loaded["papers"], loaded["reports_by_paper"]
+        for r in loaded["reports"]:
+            self._index_doc(r, papers.get(r.paper_id))
+        for paper_id, tag in loaded["tag_rows"]:
+            self._add_entity("tag", tag.id, tag.name, reports_by_paper[paper_id])
+        for paper_id, author in loaded["author_rows"]:
+            self._add_entity("author", author.id, author.name, reports_by_paper[paper_id])
+        for author_id, aff in loaded["aff_rows"]:
+            for paper_id in loaded["author_papers"][author_id]:
+                self._add_entity("affiliation", aff.id, aff.name, reports_by_paper[paper_id])
+
+    def _index_doc(self, r: Report, paper: Optional[Paper]):
+        fields = {"report_title": r.report_title, "report_summary": r.report_summary}
+        if paper:
+            fields["paper_title"] = paper.paper_title
+            fields["venue"] = paper.journal_or_conference
+        length = 0
+        for field, value in fields.items():
+            tokens = tokenize(value)
+            length += len(tokens)
+            for tok in tokens:
+                posting = self.postings[tok]
+                posting[r.id] = posting.get(r.id, 0.0) + self.FIELD_WEIGHTS[field]
+        self.doc_len[r.id] = float(length or 1)
+        self.doc_text[r.id] = " ".join(v for v in (r.report_title, r.report_summary, paper.paper_title if paper else "") if v)
+
+    def _add_entity(self, kind: str, entity_id: int, name: str, report_ids: Set[int]):
+        key = (kind, entity_id)
+        if key not in self.entities:
+            self.entities[key] = (name, set())
+        self.entities[key][1].update(report_ids)
+
+    # -------- query --------
+    def search(self, q: str, limit: int, offset: int):
+        terms = tokenize(q)
+        n_docs = len(self.doc_len) or 1
+        scores: Dict[int, float] = defaultdict(float)
+
+        with self.lock:
+            # 與 websearch_to_tsquery 相同：所有詞都要出現 (AND)
+            if terms:
+                postings = [self.postings.get(t, {}) for t in terms]
+                matched = set(postings[0]).intersection(*postings[1:])
+                for doc_id in matched:
+                    for t, posting in zip(terms, postings):
+                        idf = math.log(1 + n_docs / len(posting))
+                        scores[doc_id] += posting[doc_id] * idf / math.log(2 + self.doc_len[doc_id])
+
+            q_grams = trigrams(q)
+            entities = []
+            for (kind, entity_id), (name, report_ids) in self.entities.items():
+                sim = word_similarity(q_grams, name)
+                if sim < TRGM_THRESHOLD:
+                    continue
+                entities.append({"kind": kind, "id": entity_id, "name": name, "score": sim})
+                for report_id in report_ids:
+                    scores[report_id] += ENTITY_WEIGHT * sim
+
+            ranked = sorted(scores.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)[offset:offset + limit]
+            hits = [(doc_id, score, highlight(self._snippet(doc_id, terms))) for doc_id, score in ranked]
+
+        entities.sort(key=lambda e: e["score"], reverse=True)
+        return hits, entities[:10]
+
+    def _snippet(self, doc_id: int, terms: List[str], width: int = 80) -> str:
+        body = self.doc_text.get(doc_id, "")
+        lowered = body.lower()
+        positions = [lowered.find(t) for t in terms if t in lowered]
+        start = max(min(positions) - width // 2, 0) if positions else 0
+        window = body[start:start + width]
+        for t in sorted(set(terms), key=len, reverse=True):
+            window = re.sub(
+                rf"(?<![a-z0-9])({re.escape(t)})" if t.isascii() else f"({re.escape(t)})",
+                rf"{_START}\1{_STOP}",
+                window,
+                flags=re.IGNORECASE,
+            )
+        return ("…" if start else "") + window + ("…" if start + width < len(body) else "")
+
+
+fallback_index = InvertedIndex()
+
+
+# ---------------- public API ----------------
+def _is_postgres(session: Session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def search_reports(session: Session, q: str, limit: Optional[int] = None, offset: int = 0):
+    """
+    回傳 {"query", "results": [enriched report + rank + snippet], "entities": [fuzzy name hits]}
+    snippet 已 HTML escape，只有 <mark> 是標籤。
+    """
+    limit = clamp_limit(limit)
+    offset = max(offset, 0)
+    if _is_postgres(session):
+        hits, entities = _search_postgres(session, q, limit, offset)
+    else:
+        fallback_index.build(session)
+        hits, entities = fallback_index.search(q, limit, offset)
+
+    reports = load_by_id(session, Report, (doc_id for doc_id, _, _ in hits))
+    ordered = [reports[doc_id] for doc_id, _, _ in hits if doc_id in reports]
+    enriched = enrich_reports(session, ordered)
+    meta = {doc_id: (rank, snippet) for doc_id, rank, snippet in hits}
+    for item in enriched:
+        item["rank"], item["snippet"] = meta[item["r"].id]
+    return {"query": q, "results": enriched, "entities": entities}
+
+
+def invalidate_index():
+    """bulk import 之後呼叫：fallback index 下次 search 時整批重建"""
+    fallback_index.clear()
+
+
+def index_report(session: Session, report_id: int):
+    """新 report 寫入後呼叫；Postgres 的 search_vector 由 trigger 更新"""
+    if not _is_postgres(session):
+        fallback_index.add_report(session, report_id)
@@ -0,0 +1,172 @@
+# startup.py
+# 冷啟動：各階段花了多少時間（/readyz、/metrics、log）、延後到第一次使用才 import 的重量級 module，
+# 以及 FAST_STARTUP 時在 DB 還沒準備好之前擋下 request 的 middleware。
+# 這個 module 只 import 標準函式庫與 jinja2 / starlette，main.py 第一個 import 它，時間從這裡開始算。
+
+import importlib
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from jinja2 import FileSystemBytecodeCache
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# FAST_STARTUP 時 ready 之前仍然可以用的 path（liveness / readiness probe 與 metrics）
+ALWAYS_OPEN_PATHS = ("/healthz", "/readyz", "/metrics")
+
+
+# ---------------- timings ----------------
+class StartupTimer:
+    """
+    mark(phase) 記下上一個 mark 到現在的時間；time.perf_counter() 從 import 這個 module 時開始，
+    Python 本身與 uvicorn 的啟動不含在內。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+        self.deferred: Dict[str, float] = {}  # 第一次使用時才 import 的 module 花的時間
+        self.ready_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.db_attempts = 0
+        self.db_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def mark(self, phase: str) -> float:
+        now = time.perf_counter()
+        elapsed = self.phases[phase] = now - self._last
+        self._last = now
+        return elapsed
+
+    def set_ready(self, budget: Optional[float] = None):
+        self.ready_at = time.perf_counter()
+        total = self.ready_at - self.started
+        breakdown = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in self.phases.items())
+        if budget and total > budget:
+            logger.warning("startup took %.2fs, over the %.2fs budget (%s)", total, budget, breakdown)
+        else:
+            logger.info("ready in %.2fs (%s)", total, breakdown)
+
+    def fail(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+        logger.error("startup failed", exc_info=error)
+
+    def db_retry(self, attempt: int, error: BaseException, delay: float):
+        """wait_for_db 的 on_retry"""
+        self.db_attempts = attempt
+        self.db_error = (str(error).strip().splitlines() or [type(error).__name__])[0]
+        logger.warning("database not ready (attempt %d), retrying in ~%.1fs: %s", attempt, delay, self.db_error)
+
+    def metric_values(self) -> Dict[tuple, float]:
+        values = {(phase,): v for phase, v in self.phases.items()}
+        values.update({(f"import {name}",): v for name, v in self.deferred.items()})
+        if self.ready_at is not None:
+            values[("total",)] = self.ready_at - self.started
+        return values
+
+    def report(self, budget: Optional[float] = None) -> dict:
+        total = (self.ready_at or time.perf_counter()) - self.started
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "seconds": round(total, 4),
+            "budget_seconds": budget,
+            "over_budget": bool(budget and total > budget),
+            "phases": {k: round(v, 4) for k, v in self.phases.items()},
+            "deferred_imports": {k: round(v, 4) for k, v in self.deferred.items()},
+            "db": {"attempts": self.db_attempts, "last_error": self.db_error},
+        }
+
+
+startup = StartupTimer()
+
+
+# ---------------- lazy imports ----------------
+class LazyModule:
+    """
+    np = lazy_module("numpy")：第一次取屬性時才 import，之後屬性直接從 instance dict 拿（不再經過 __getattr__）。
+    import 本身由 Python 的 import lock 保護，多個 thread 同時第一次使用也只會 import 一次。
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+
+    def _load(self):
+        name = self.__dict__["_name"]
+        started = time.perf_counter()
+        fresh = name not in sys.modules
+        module = importlib.import_module(name)
+        if fresh:
+            startup.deferred[name] = time.perf_counter() - started
+        self.__dict__.update(vars(module))
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self.__dict__['_name']!r}>"
+
+
+_lazy_modules: List[LazyModule] = []
+
+
+def lazy_module(name: str) -> LazyModule:
+    m = LazyModule(name)
+    _lazy_modules.append(m)
+    return m
+
+
+def preload_lazy_modules():
+    """ready 之後在背景 thread 裡先 import，第一個用到的 request 就不必等"""
+    for m in _lazy_modules:
+        m._load()
+
+
+# ---------------- templates ----------------
+class BytecodeCache(FileSystemBytecodeCache):
+    """image build 時預先編譯好的 template bytecode；目錄不能寫時只讀不寫，render 不會因為 cache 失敗"""
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
+
+
+def template_bytecode_cache(directory: str) -> BytecodeCache:
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        pass
+    return BytecodeCache(directory)
+
+
+def load_all_templates(env) -> int:
+    """每個 template 都先載入一次（有 bytecode cache 時只是讀檔，沒有時在這裡編譯）"""
+    names = [n for n in env.list_templates() if n.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+# ---------------- middleware ----------------
+class ReadinessMiddleware:
+    """FAST_STARTUP：startup 還沒完成時回 503 + Retry-After，而不是讓 request 卡在還沒建立的 engine 上"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not startup.ready and scope["path"] not in ALWAYS_OPEN_PATHS:
+            response = JSONResponse({"detail": "Starting up"}, status_code=503, headers={"Retry-After": "1"})
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
@@ -0,0 +1,180 @@
+# stats.py
+# /stats dashboard：只讀 activitycounter / tagstats 這兩張 summary table（每個區塊一個 indexed top-N 查詢），
+# 不在 request 時對 report / comment / papertag 做 GROUP BY。
+# 計數由 ingest.py 在每次寫入時累加；rebuild_stats() 從原始資料整批重算，用來修復。
+
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, func, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from .feed import load_by_id
+from .ingest import comment_counters, report_counters
+from .models import ActivityCounter, Comment, Job, LabMeeting, Paper, Report, Tag, TagStats, User
+
+DASHBOARD_TOP_N = 10
+MONTHS_SHOWN = 24
+REBUILD_BATCH_SIZE = 1000
+
+
+# ---------------- read ----------------
+def top_counters(session: Session, dimension: str, metric: str, n: int, by_key: bool = False) -> List[Tuple[str, int]]:
+    """by_key=True 依 key 由大到小（月份、年份），否則依 value"""
+    order = (ActivityCounter.key.desc(),) if by_key else (ActivityCounter.value.desc(), ActivityCounter.key)
+    return session.exec(
+        select(ActivityCounter.key, ActivityCounter.value)
+        .where(ActivityCounter.dimension == dimension, ActivityCounter.metric == metric, ActivityCounter.value > 0)
+        .order_by(*order)
+        .limit(n)
+    ).all()
+
+
+def counter_values(session: Session, dimension: str, metric: str, keys: Iterable[str]) -> Dict[str, int]:
+    keys = list(keys)
+    if not keys:
+        return {}
+    return dict(session.exec(
+        select(ActivityCounter.key, ActivityCounter.value)
+        .where(ActivityCounter.dimension == dimension, ActivityCounter.metric == metric, ActivityCounter.key.in_(keys))
+    ).all())
+
+
+def _series(session: Session, dimension: str, n: int, by_key: bool, primary: str = "reports") -> List[dict]:
+    """[{"key", "reports", "comments"}]；依 primary metric 取 top-N，另一個 metric 一次 IN 補齊"""
+    other = "comments" if primary == "reports" else "reports"
+    rows = top_counters(session, dimension, primary, n, by_key=by_key)
+    others = counter_values(session, dimension, other, (k for k, _ in rows))
+    return [{"key": k, primary: v, other: others.get(k, 0)} for k, v in rows]
+
+
+def load_dashboard(session: Session, n: int = DASHBOARD_TOP_N) -> dict:
+    months = _series(session, "month", MONTHS_SHOWN, by_key=True)
+    months.reverse()  # 舊到新
+    presenters = _series(session, "presenter", n, by_key=False)
+    papers = _series(session, "paper", n, by_key=False, primary="comments")
+    meetings = _series(session, "meeting", n, by_key=False)
+    years = _series(session, "year", n, by_key=True)
+    venues = _series(session, "venue", n, by_key=False)
+
+    users = load_by_id(session, User, (int(x["key"]) for x in presenters))
+    for x in presenters:
+        u = users.get(int(x["key"]))
+        x["name"] = (u.display_name or u.username) if u else x["key"]
+    paper_rows = load_by_id(session, Paper, (int(x["key"]) for x in papers))
+    for x in papers:
+        p = paper_rows.get(int(x["key"]))
+        x["name"] = p.paper_title if p else x["key"]
+    meeting_rows = load_by_id(session, LabMeeting, (int(x["key"]) for x in meetings))
+    for x in meetings:
+        m = meeting_rows.get(int(x["key"]))
+        x["name"] = f"{m.meeting_title} ({m.meeting_date})" if m else x["key"]
+
+    tags = [
+        {"key": name, "name": name, "papers": paper_count, "reports": report_count}
+        for name, paper_count, report_count in session.exec(
+            select(Tag.name, TagStats.paper_count, TagStats.report_count)
+            .join(TagStats, TagStats.tag_id == Tag.id)
+            .order_by(TagStats.report_count.desc(), Tag.name)
+            .limit(n)
+        ).all()
+    ]
+    return {
+        "months": months,
+        "presenters": presenters,
+        "most_discussed_papers": papers,
+        "busiest_meetings": meetings,
+        "years": years,
+        "venues": venues,
+        "tags": tags,
+    }
+
+
+# ---------------- rebuild ----------------
+# conn 可以是 Session 或 Connection（migration 0007 用 Connection 做初次 backfill）
+def rebuild_activity(conn) -> int:
+    """清空 activitycounter 後從 report / comment 串流重算；回傳寫入的列數"""
+    deltas: Counter = Counter()
+    reports = conn.execute(
+        select(Report.user_id, Report.meeting_id, Report.paper_id, Report.created_at,
+               Paper.published_year, Paper.journal_or_conference)
+        .outerjoin(Paper, Paper.id == Report.paper_id),
+        execution_options={"yield_per": REBUILD_BATCH_SIZE},
+    )
+    for row in reports:
+        deltas.update(report_counters(*row))
+    comments = conn.execute(
+        select(Comment.created_at, Report.user_id, Report.meeting_id, Report.paper_id,
+               Paper.published_year, Paper.journal_or_conference)
+        .join(Report, Report.id == Comment.report_id)
+        .outerjoin(Paper, Paper.id == Report.paper_id),
+        execution_options={"yield_per": REBUILD_BATCH_SIZE},
+    )
+    for row in comments:
+        deltas.update(comment_counters(*row))
+
+    conn.execute(delete(ActivityCounter))
+    rows = [{"dimension": d, "key": k, "metric": m, "value": v} for (d, k, m), v in deltas.items()]
+    for i in range(0, len(rows), REBUILD_BATCH_SIZE):
+        conn.execute(insert(ActivityCounter), rows[i:i + REBUILD_BATCH_SIZE])
+    return len(rows)
+
+
+REBUILD_TAG_STATS_SQL = text("""
+    INSERT INTO tagstats (tag_id, paper_count, report_count)
+    SELECT t.id,
+           (SELECT count(*) FROM papertag pt WHERE pt.tag_id = t.id),
+           (SELECT count(*) FROM papertag pt JOIN report r ON r.paper_id = pt.paper_id
+             WHERE pt.tag_id = t.id)
+      FROM tag t
+""")
+
+
+def rebuild_tag_stats(conn) -> int:
+    conn.execute(delete(TagStats))
+    conn.execute(REBUILD_TAG_STATS_SQL)
+    return conn.execute(select(func.count()).select_from(TagStats)).scalar_one()
+
+
+# 與 job runner 同時改到同一個 job row 時 Postgres 回 serialization failure（SQLSTATE 40001），整個重算再試
+REBUILD_RETRIES = 3
+
+
+def _is_serialization_failure(e: OperationalError) -> bool:
+    orig = getattr(e, "orig", None)
+    return (getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)) == "40001"
+
+
+def _rebuild(session: Session, lock: bool) -> dict:
+    try:
+        if lock:
+            session.execute(text("LOCK TABLE activitycounter, tagstats IN EXCLUSIVE MODE"))
+        session.execute(delete(Job).where(Job.kind == "counters", Job.status.in_(("queued", "running"))))
+        result = {"activity_rows": rebuild_activity(session), "tag_rows": rebuild_tag_stats(session)}
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return result
+
+
+def rebuild_stats(session: Session) -> dict:
+    """
+    activitycounter + tagstats 在同一個 transaction 重算，還沒套用的 counters job 一起刪掉（它們的 row 已經算進重算結果）。
+    Postgres：先鎖住兩張表（同時進行的 counters job 會停在累加那一步），再以 REPEATABLE READ 讓刪 job 與重掃
+    report / comment 看到同一個 snapshot。snapshot 之後才 commit 的 upload 不會被掃到，它的 job 也不會被刪，
+    之後照常累加；被刪掉、正在跑的 job commit 時發現 job 不見了會 rollback。兩邊都不會重複算。
+    SQLite 只有一個 writer：DELETE 拿到 write lock 之後，別的寫入要等重算 commit 才能 commit。
+    """
+    bind = session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return _rebuild(session, lock=False)
+    snapshot_engine = bind.execution_options(isolation_level="REPEATABLE READ")
+    for attempt in range(REBUILD_RETRIES):
+        with Session(snapshot_engine) as own:
+            try:
+                return _rebuild(own, lock=True)
+            except OperationalError as e:
+                if attempt + 1 == REBUILD_RETRIES or not _is_serialization_failure(e):
+                    raise
@@ -0,0 +1,55 @@
+# tags.py
+# /tags/{name} 的分頁 report 列表，與 /tags 目錄（讀 TagStats；計數由 ingest.bump_tag_stats 維護）
+
+from typing import List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .cache import name_cache_for
+from .feed import paginate_reports
+from .models import PaperTag, Report, Tag, TagStats
+
+TAG_SORTS = {
+    "reports": (TagStats.report_count.desc(), Tag.name),
+    "papers": (TagStats.paper_count.desc(), Tag.name),
+    "name": (Tag.name,),
+}
+
+
+# ---------------- pages ----------------
+def resolve_tag(session: Session, name: str) -> Optional[int]:
+    cache = name_cache_for(Tag)
+    tag_id = cache.get(name)
+    if tag_id is None:
+        tag_id = session.exec(select(Tag.id).where(Tag.name == name)).first()
+        if tag_id is not None:
+            cache.set(name, tag_id)
+    return tag_id
+
+
+def load_tag_page(session: Session, name: str, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    回傳 (enriched items, next_cursor)；tag 不存在時丟 LookupError。
+    經 papertag（ix_papertag_tag_id）一個 keyset 分頁查詢找出 reports。
+    """
+    tag_id = resolve_tag(session, name)
+    if tag_id is None:
+        raise LookupError(name)
+    stmt = (
+        select(Report)
+        .join(PaperTag, PaperTag.paper_id == Report.paper_id)
+        .where(PaperTag.tag_id == tag_id)
+    )
+    return paginate_reports(session, stmt, cursor, limit, with_authors=True)
+
+
+def load_tag_directory(session: Session, sort: str = "reports") -> List[Tuple[Tag, int, int]]:
+    """[(tag, paper_count, report_count)]；sort 不存在時丟 ValueError"""
+    if sort not in TAG_SORTS:
+        raise ValueError(f"unknown sort: {sort}")
+    return session.exec(
+        select(Tag, TagStats.paper_count, TagStats.report_count)
+        .join(TagStats, TagStats.tag_id == Tag.id)
+        .where(TagStats.paper_count > 0)
+        .order_by(*TAG_SORTS[sort])
+    ).all()
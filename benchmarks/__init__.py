@@ -0,0 +1,3 @@
+# benchmarks
+# seed.py：可重現的 synthetic data（1k / 100k / 1m reports）；load.py：主要 routes 的負載測試與 baseline 比較。
+# run: PYTHONPATH=. python -m benchmarks --help
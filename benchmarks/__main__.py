@@ -0,0 +1,71 @@
+# run: PYTHONPATH=. python -m benchmarks seed --scale 100k
+#      PYTHONPATH=. python -m benchmarks load --duration 30 --concurrency 8 --output result.json --baseline baseline.json
+#      PYTHONPATH=. python -m benchmarks compare result.json baseline.json
+import argparse
+import json
+import sys
+
+from sqlmodel import create_engine
+
+from app.config import settings
+
+from .load import compare, format_table, load_json, run_load
+from .seed import SCALES, seed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Synthetic data seeder and load benchmark.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("seed", help="fill an empty database (DATABASE_URL) with deterministic synthetic data")
+    p.add_argument("--scale", choices=SCALES, default="1k")
+    p.add_argument("--seed", type=int, default=0)
+
+    p = sub.add_parser("load", help="drive the main routes and report latency / throughput / SQL per request")
+    p.add_argument("--url", help="benchmark a running server instead of starting the app in-process")
+    p.add_argument("--duration", type=float, default=30, help="seconds")
+    p.add_argument("--concurrency", type=int, default=8, help="virtual users")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", help="write the result JSON here")
+    p.add_argument("--baseline", help="compare against this result JSON; exit 1 on regression")
+    p.add_argument("--tolerance", type=float, default=0.2)
+
+    p = sub.add_parser("compare", help="compare two result JSON files")
+    p.add_argument("result")
+    p.add_argument("baseline")
+    p.add_argument("--tolerance", type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        engine = create_engine(settings.DATABASE_URL)
+        try:
+            written = seed(engine, args.scale, args.seed)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 2
+        print(json.dumps(written))
+        return 0
+
+    if args.command == "load":
+        result = run_load(args.url, args.duration, args.concurrency, args.seed)
+        print(format_table(result))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+        baseline = load_json(args.baseline) if args.baseline else None
+    else:
+        result, baseline = load_json(args.result), load_json(args.baseline)
+
+    if baseline is None:
+        return 0
+    problems = compare(result, baseline, args.tolerance)
+    for line in problems:
+        print("REGRESSION", line, file=sys.stderr)
+    if not problems:
+        print("no regressions against baseline")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
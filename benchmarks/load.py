@@ -0,0 +1,230 @@
+# load.py
+# 對 /、/reports/{id}、/query、/upload、/comments 發出混合負載，量 throughput、p50/p95/p99 與每個 request 的 SQL 數。
+# 預設在同一個 process 裡用 uvicorn 起 app 並打開 METRICS_DEBUG_HEADER（app/metrics.py 以 engine event 數 SQL）；
+# --url 則打外部 server（server 設了 METRICS_DEBUG_HEADER=true 才有 SQL 數）。
+
+import asyncio
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.metrics import SQL_HEADER
+
+from .seed import TOPIC_WORDS, VENUES, plan_counts, tag_name
+
+# name -> weight；比例大致照實際使用：讀遠多於寫
+SCENARIOS = {
+    "GET /": 35,
+    "GET /reports/{id}": 35,
+    "POST /query": 15,
+    "POST /comments": 10,
+    "POST /upload": 5,
+}
+
+
+# ---------------- in-process target ----------------
+class LocalServer:
+    """在背景 thread 跑 uvicorn（含 startup：init_db / AUTO_MIGRATE），結束時 shutdown"""
+
+    def __init__(self):
+        import uvicorn
+        from app.config import settings
+        from app.main import app
+
+        settings.METRICS_DEBUG_HEADER = True
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 60
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("local server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+# ---------------- workload ----------------
+class Workload:
+    """每個 virtual user 一個；report id 偏向最近的（首頁點進去的多半是新的）"""
+
+    def __init__(self, rng: random.Random, max_report_id: int, n_tags: int):
+        self.rng = rng
+        self.max_report_id = max(1, max_report_id)
+        self.n_tags = max(1, n_tags)
+
+    def report_id(self) -> int:
+        back = int(self.rng.paretovariate(1.2)) - 1
+        return max(1, self.max_report_id - back % self.max_report_id)
+
+    def query_body(self) -> dict:
+        kind = self.rng.random()
+        if kind < 0.4:
+            filters = [{"field": "paper_tag", "op": "=", "value": tag_name(self.rng.randint(1, min(self.n_tags, 40)))}]
+        elif kind < 0.7:
+            filters = [{"field": "paper_year", "op": ">=", "value": self.rng.randint(2015, 2024)},
+                       {"field": "venue", "op": "=", "value": self.rng.choice(VENUES[:6])}]
+        else:
+            filters = {"or": [{"field": "report_title", "op": "contains", "value": self.rng.choice(TOPIC_WORDS)},
+                              {"field": "paper_title", "op": "contains", "value": self.rng.choice(TOPIC_WORDS)}]}
+        return {"filters": filters, "limit": 20}
+
+    def upload_form(self, n: int) -> dict:
+        words = self.rng.sample(TOPIC_WORDS, 5)
+        return {
+            "report_title": f"Bench report {n}: {' '.join(words[:3])}",
+            "report_summary": " ".join(words),
+            "meeting_title": "Bench meeting",
+            "paper_title": f"Bench paper {n} on {' '.join(words[2:])}",
+            "published_year": str(self.rng.randint(2015, 2025)),
+            "journal_or_conference": self.rng.choice(VENUES),
+            "tags": ", ".join(tag_name(self.rng.randint(1, min(self.n_tags, 40))) for _ in range(2)),
+            "author_name_0": f"Bench Author {self.rng.randint(1, 50)}",
+            "author_affiliations_0": "Bench University",
+        }
+
+
+async def _request(client: httpx.AsyncClient, name: str, w: Workload, n: int) -> httpx.Response:
+    if name == "GET /":
+        return await client.get("/")
+    if name == "GET /reports/{id}":
+        return await client.get(f"/reports/{w.report_id()}")
+    if name == "POST /query":
+        return await client.post("/query", json=w.query_body())
+    if name == "POST /comments":
+        return await client.post("/comments", data={"report_id": w.report_id(), "content": f"bench comment {n}"})
+    if name == "POST /upload":
+        return await client.post("/upload", data=w.upload_form(n))
+    raise ValueError(name)
+
+
+async def _virtual_user(i: int, url: str, deadline: float, max_report_id: int, n_tags: int, seed: int,
+                        scenarios: Dict[str, int], samples: Dict[str, list]):
+    rng = random.Random(f"{seed}:{i}")
+    w = Workload(rng, max_report_id, n_tags)
+    names, weights = list(scenarios), list(scenarios.values())
+    async with httpx.AsyncClient(base_url=url, timeout=60, follow_redirects=False) as client:
+        await client.post("/login", data={"username": f"bench{i}"})
+        n = 0
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights=weights)[0]
+            n += 1
+            started = time.perf_counter()
+            try:
+                r = await _request(client, name, w, n)
+                ok = r.status_code < 400
+                sql = r.headers.get(SQL_HEADER)
+            except httpx.HTTPError:
+                ok, sql = False, None
+            samples[name].append(((time.perf_counter() - started) * 1000, ok, int(sql) if sql is not None else None))
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def summarize(samples: Dict[str, list], elapsed: float) -> Dict[str, dict]:
+    routes = {}
+    for name, rows in samples.items():
+        latencies = sorted(ms for ms, _, _ in rows)
+        sql = [s for _, _, s in rows if s is not None]
+        routes[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for _, ok, _ in rows if not ok),
+            "rps": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(_percentile(latencies, 50), 2),
+            "p95_ms": round(_percentile(latencies, 95), 2),
+            "p99_ms": round(_percentile(latencies, 99), 2),
+            "sql_per_request": round(statistics.mean(sql), 2) if sql else None,
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 2) if elapsed else 0.0, "routes": routes}
+
+
+async def _run(url: str, duration: float, concurrency: int, seed: int, scenarios: Dict[str, int]) -> dict:
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        items = (await client.get("/api/reports", params={"limit": 1})).json()["items"]
+    max_report_id = items[0]["r"]["id"] if items else 1
+    # seed.py 的 tag 數由 report 數推導；外部資料庫的 tag 名稱對不上時 /query 只是查不到東西
+    n_tags = plan_counts(max_report_id)["tags"]
+    samples: Dict[str, list] = {name: [] for name in scenarios}
+    started = time.monotonic()
+    await asyncio.gather(*(
+        _virtual_user(i, url, started + duration, max_report_id, n_tags, seed, scenarios, samples)
+        for i in range(concurrency)
+    ))
+    return summarize(samples, time.monotonic() - started)
+
+
+def run_load(url: Optional[str] = None, duration: float = 30, concurrency: int = 8, seed: int = 0,
+             scenarios: Optional[Dict[str, int]] = None) -> dict:
+    """url=None 時在同一個 process 裡起 app（DATABASE_URL 指到的資料庫）"""
+    scenarios = scenarios or SCENARIOS
+    if url:
+        result = asyncio.run(_run(url, duration, concurrency, seed, scenarios))
+    else:
+        with LocalServer() as server:
+            result = asyncio.run(_run(server.url, duration, concurrency, seed, scenarios))
+    result["config"] = {"url": url or "in-process", "duration": duration, "concurrency": concurrency, "seed": seed}
+    return result
+
+
+# ---------------- baseline ----------------
+def compare(result: dict, baseline: dict, tolerance: float = 0.2) -> List[str]:
+    """
+    回傳 regression 描述（空 list 表示通過）：
+    p95 或 p99 比 baseline 慢超過 tolerance、throughput 掉超過 tolerance、SQL 數變多、出現新的錯誤。
+    """
+    problems = []
+    for name, base in baseline.get("routes", {}).items():
+        cur = result.get("routes", {}).get(name)
+        if cur is None or not cur["requests"]:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and cur[key] > base[key] * (1 + tolerance):
+                problems.append(f"{name}: {key} {cur[key]} > baseline {base[key]} (+{tolerance:.0%})")
+        if base["rps"] and cur["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{name}: rps {cur['rps']} < baseline {base['rps']} (-{tolerance:.0%})")
+        if base.get("sql_per_request") is not None and cur.get("sql_per_request") is not None \
+                and cur["sql_per_request"] > base["sql_per_request"] + 0.5:
+            problems.append(f"{name}: sql_per_request {cur['sql_per_request']} > baseline {base['sql_per_request']}")
+        if cur["errors"] and not base["errors"]:
+            problems.append(f"{name}: {cur['errors']} errors (baseline had none)")
+    return problems
+
+
+def format_table(result: dict) -> str:
+    lines = [f"{'route':20} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'sql/req':>8}"]
+    for name, r in result["routes"].items():
+        sql = "-" if r["sql_per_request"] is None else f"{r['sql_per_request']:.1f}"
+        lines.append(f"{name:20} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8.1f} "
+                     f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {sql:>8}")
+    lines.append(f"total {result['requests']} requests in {result['elapsed_s']}s ({result['rps']} req/s)")
+    return "\n".join(lines)
+
+
+def load_json(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,279 @@
+# seed.py
+# 可重現的 synthetic data：同一個 scale + seed 產生的資料完全相同。
+# 分佈刻意偏斜（Zipf）：少數 presenter / author / tag / report 佔大部分的量，接近真實 lab 的資料。
+# 全部用 Core executemany 批次寫入並指定 id，不經過 ORM。
+
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import func, insert, select, text
+from sqlmodel import Session
+
+from app.migrations import upgrade
+from app.models import (
+    Affiliation,
+    Author,
+    AuthorAffiliationLink,
+    Comment,
+    LabMeeting,
+    Paper,
+    PaperAuthorLink,
+    PaperTag,
+    Report,
+    Tag,
+    User,
+)
+from app.stats import rebuild_stats
+
+# scale name -> report 數；其他 entity 的數量由 report 數推導（見 plan_counts）
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+WRITE_BATCH_SIZE = 5_000
+START = datetime(2020, 1, 1)
+
+TOPIC_WORDS = [
+    "graph", "neural", "network", "attention", "transformer", "diffusion", "language", "model", "vision",
+    "reinforcement", "learning", "policy", "gradient", "contrastive", "representation", "self", "supervised",
+    "generative", "adversarial", "bayesian", "inference", "variational", "sparse", "efficient", "scaling",
+    "retrieval", "augmented", "memory", "robust", "optimization", "federated", "privacy", "causal", "kernel",
+    "convolutional", "recurrent", "sequence", "segmentation", "detection", "tracking", "speech", "protein",
+    "molecule", "physics", "simulation", "planning", "reasoning", "benchmark", "dataset", "alignment",
+    "distillation", "quantization", "pruning", "meta", "few", "shot", "zero", "multimodal", "embedding",
+    "clustering", "anomaly", "time", "series", "forecasting", "recommendation", "ranking", "tabular",
+]
+FILLER_WORDS = ["a", "an", "the", "of", "for", "with", "via", "on", "towards", "beyond", "and", "in"]
+VENUES = ["NeurIPS", "ICML", "ICLR", "CVPR", "ACL", "EMNLP", "AAAI", "KDD", "Nature", "Science", "arXiv", ""]
+FIRST_NAMES = ["Alice", "Bob", "Carol", "Dan", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy", "Ken", "Lin",
+               "Mei", "Noor", "Omar", "Pia", "Quinn", "Ravi", "Sara", "Tao", "Uma", "Vik", "Wen", "Yuki", "Zoe"]
+LAST_NAMES = ["Chen", "Wang", "Smith", "Garcia", "Kim", "Nguyen", "Patel", "Müller", "Rossi", "Sato", "Lee",
+              "Lopez", "Cohen", "Ivanova", "Okafor", "Silva", "Haddad", "Novak", "Larsen", "Tanaka"]
+AFF_PREFIXES = ["University of", "Institute for", "Lab of", "Center for", "School of"]
+
+
+# ---------------- deterministic helpers ----------------
+class Zipf:
+    """1..n 依 1/rank^s 抽樣；cum_weights 算一次，每次抽樣 O(log n)"""
+
+    def __init__(self, rng: random.Random, n: int, s: float = 1.1):
+        self.rng = rng
+        self.population = range(1, n + 1)
+        self.cum_weights = list(accumulate(1.0 / (i ** s) for i in self.population))
+
+    def sample(self, k: int = 1) -> List[int]:
+        return self.rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+
+    def one(self) -> int:
+        return self.sample(1)[0]
+
+
+def tag_name(i: int) -> str:
+    """harness 也用這個函式產生 /query 的 tag 條件"""
+    words = TOPIC_WORDS
+    if i <= len(words):
+        return words[i - 1]
+    return f"{words[(i - 1) % len(words)]}-{(i - 1) // len(words)}"
+
+
+def author_name(i: int) -> str:
+    first = FIRST_NAMES[i % len(FIRST_NAMES)]
+    last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    n = i // (len(FIRST_NAMES) * len(LAST_NAMES))
+    return f"{first} {last}" + (f" {n}" if n else "")
+
+
+def affiliation_name(i: int) -> str:
+    return f"{AFF_PREFIXES[i % len(AFF_PREFIXES)]} {TOPIC_WORDS[i % len(TOPIC_WORDS)].title()} {i}"
+
+
+def username(i: int) -> str:
+    return f"user{i}"
+
+
+def title(rng: random.Random, words: Zipf, n: int) -> str:
+    out = []
+    for w in words.sample(n):
+        if out and rng.random() < 0.25:
+            out.append(rng.choice(FILLER_WORDS))
+        out.append(TOPIC_WORDS[(w - 1) % len(TOPIC_WORDS)])
+    return " ".join(out).capitalize()
+
+
+def plan_counts(n_reports: int) -> Dict[str, int]:
+    return {
+        "users": max(10, n_reports // 50),
+        "meetings": max(5, n_reports // 4),
+        "papers": max(10, int(n_reports * 0.8)),
+        "authors": max(20, int(n_reports * 0.5)),
+        "affiliations": max(10, n_reports // 200),
+        "tags": min(2000, max(30, n_reports // 100)),
+        "reports": n_reports,
+        "comments": int(n_reports * 1.5),
+    }
+
+
+# ---------------- row generators ----------------
+def gen_users(rng, c) -> Iterator[dict]:
+    for i in range(1, c["users"] + 1):
+        yield {"id": i, "username": username(i), "display_name": f"User {i}", "created_at": START}
+
+
+def gen_meetings(rng, c) -> Iterator[dict]:
+    # 每週一次左右，日期隨 id 遞增
+    days = max(1, (datetime(2025, 12, 31) - START).days)
+    for i in range(1, c["meetings"] + 1):
+        d = (START + timedelta(days=days * i // c["meetings"])).date()
+        yield {"id": i, "meeting_title": f"Lab meeting #{i}", "meeting_date": d, "meeting_location": rng.choice(["Room 101", "Room 204", "Online"])}
+
+
+def gen_papers(rng, c) -> Iterator[dict]:
+    words = Zipf(rng, len(TOPIC_WORDS), 0.8)
+    for i in range(1, c["papers"] + 1):
+        yield {
+            "id": i,
+            "paper_title": title(rng, words, rng.randint(4, 9)),
+            "published_year": rng.randint(2012, 2025),
+            "published_month": rng.randint(1, 12),
+            "journal_or_conference": VENUES[min(int(rng.expovariate(0.35)), len(VENUES) - 1)],
+        }
+
+
+def gen_named(make: Callable[[int], str], n: int) -> Callable:
+    def gen(rng, c) -> Iterator[dict]:
+        for i in range(1, n(c) + 1):
+            yield {"id": i, "name": make(i)}
+    return gen
+
+
+def gen_paper_authors(rng, c) -> Iterator[dict]:
+    authors = Zipf(rng, c["authors"], 0.9)
+    for paper_id in range(1, c["papers"] + 1):
+        for author_id in set(authors.sample(rng.randint(1, 6))):
+            yield {"paper_id": paper_id, "author_id": author_id}
+
+
+def gen_author_affs(rng, c) -> Iterator[dict]:
+    affs = Zipf(rng, c["affiliations"], 1.0)
+    for author_id in range(1, c["authors"] + 1):
+        for aff_id in set(affs.sample(1 if rng.random() < 0.8 else 2)):
+            yield {"author_id": author_id, "affiliation_id": aff_id}
+
+
+def gen_paper_tags(rng, c) -> Iterator[dict]:
+    tags = Zipf(rng, c["tags"], 1.1)
+    for paper_id in range(1, c["papers"] + 1):
+        for tag_id in set(tags.sample(rng.randint(0, 4))):
+            yield {"paper_id": paper_id, "tag_id": tag_id}
+
+
+def gen_reports(rng, c) -> Iterator[dict]:
+    presenters = Zipf(rng, c["users"], 1.0)
+    # 熱門 paper 會被報告很多次；20% 的 report 是新 paper 以外的重複
+    papers = Zipf(rng, c["papers"], 0.7)
+    words = Zipf(rng, len(TOPIC_WORDS), 0.8)
+    span = (datetime(2025, 12, 31) - START).total_seconds()
+    for i in range(1, c["reports"] + 1):
+        paper_id = i if i <= c["papers"] and rng.random() < 0.8 else papers.one()
+        meeting_id = min(c["meetings"], 1 + (i - 1) * c["meetings"] // c["reports"])
+        yield {
+            "id": i,
+            "report_title": title(rng, words, rng.randint(3, 7)),
+            "report_summary": " ".join(title(rng, words, 8) for _ in range(rng.randint(1, 3))),
+            "slides_link": f"https://example.org/slides/{i}",
+            "user_id": presenters.one(),
+            "meeting_id": meeting_id,
+            "paper_id": min(paper_id, c["papers"]),
+            "created_at": START + timedelta(seconds=span * i / c["reports"]),
+        }
+
+
+def gen_comments(rng, c) -> Iterator[dict]:
+    # 留言集中在少數 report；時間在 report 之後幾天內
+    reports = Zipf(rng, c["reports"], 1.05)
+    commenters = Zipf(rng, c["users"], 0.9)
+    span = (datetime(2025, 12, 31) - START).total_seconds()
+    for i in range(1, c["comments"] + 1):
+        report_id = reports.one()
+        yield {
+            "id": i,
+            "report_id": report_id,
+            "user_id": commenters.one(),
+            "content": f"Comment {i} on report {report_id}",
+            "created_at": START + timedelta(seconds=span * report_id / c["reports"] + rng.randint(60, 7 * 86400)),
+        }
+
+
+# (model, generator)；順序就是 FK 的相依順序
+TABLES = [
+    (User, gen_users),
+    (LabMeeting, gen_meetings),
+    (Paper, gen_papers),
+    (Author, gen_named(author_name, lambda c: c["authors"])),
+    (Affiliation, gen_named(affiliation_name, lambda c: c["affiliations"])),
+    (Tag, gen_named(tag_name, lambda c: c["tags"])),
+    (PaperAuthorLink, gen_paper_authors),
+    (AuthorAffiliationLink, gen_author_affs),
+    (PaperTag, gen_paper_tags),
+    (Report, gen_reports),
+    (Comment, gen_comments),
+]
+
+
+# ---------------- write ----------------
+def _write(session: Session, model, rows: Iterator[dict]) -> int:
+    n = 0
+    batch: List[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= WRITE_BATCH_SIZE:
+            session.execute(insert(model), batch)
+            n += len(batch)
+            batch = []
+    if batch:
+        session.execute(insert(model), batch)
+        n += len(batch)
+    session.commit()
+    return n
+
+
+def _reset_sequences(session: Session):
+    """指定 id 寫入後，Postgres 的 serial sequence 要跟上，否則之後的 INSERT 會撞 PK"""
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for model, _ in TABLES:
+        if "id" not in model.__table__.c:
+            continue
+        table = model.__table__.name
+        session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE((SELECT max(id) FROM \"{table}\"), 1))"
+        ))
+    session.commit()
+
+
+def seed(engine, scale: str = "1k", seed: int = 0, log: Optional[Callable[[str], None]] = print) -> Dict[str, int]:
+    """
+    空資料庫才會寫入（report 已經有資料時丟 RuntimeError）。
+    寫完後重算 tagstats / activitycounter，Postgres 上再 ANALYZE。
+    """
+    if scale not in SCALES:
+        raise ValueError(f"unknown scale: {scale} (expected one of {', '.join(SCALES)})")
+    log = log or (lambda _: None)
+    upgrade(engine, log=log)
+    counts = plan_counts(SCALES[scale])
+    written: Dict[str, int] = {}
+    with Session(engine) as session:
+        if session.execute(select(func.count()).select_from(Report)).scalar_one():
+            raise RuntimeError("database already has reports; seed into an empty database")
+        for model, gen in TABLES:
+            started = time.monotonic()
+            # 每張表各自的 RNG：改一張表的產生方式不會讓其他表的資料跟著變
+            rng = random.Random(f"{seed}:{model.__tablename__}")
+            written[model.__tablename__] = _write(session, model, gen(rng, counts))
+            log(f"{model.__tablename__:24} {written[model.__tablename__]:>10,} rows  {time.monotonic() - started:6.1f}s")
+        _reset_sequences(session)
+        rebuild_stats(session)
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(text("ANALYZE"))
+            session.commit()
+    return written
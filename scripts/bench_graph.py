@@ -0,0 +1,89 @@
+# run: PYTHONPATH=. python scripts/bench_graph.py --edges 1000000
+# app/graph.py 的 benchmark：隨機產生 paper-author / author-affiliation link（不用 DB），
+# 量 CSR build、各種查詢的 p50 / p99、delta buffer 與 compaction。
+import argparse
+import itertools
+import random
+import resource
+import statistics
+import time
+from array import array
+
+from app.graph import CollabGraph
+
+
+def synthetic_links(n_edges: int, authors_per_paper: int, n_authors: int, n_affs: int, seed: int):
+    """作者的出現頻率近似 power law（少數人寫很多篇），每位作者 1~2 個 affiliation"""
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) ** 0.8 for i in range(n_authors)))
+    population = range(1, n_authors + 1)
+    pa_paper, pa_author = array("i"), array("i")
+    paper_id = 0
+    while len(pa_paper) < n_edges:
+        paper_id += 1
+        for author_id in set(rng.choices(population, cum_weights=cum_weights, k=authors_per_paper)):
+            pa_paper.append(paper_id)
+            pa_author.append(author_id)
+    aa_author, aa_aff = array("i"), array("i")
+    for author_id in range(1, n_authors + 1):
+        for aff_id in {rng.randint(1, n_affs) for _ in range(rng.choice((1, 1, 2)))}:
+            aa_author.append(author_id)
+            aa_aff.append(aff_id)
+    return (pa_paper, pa_author), (aa_author, aa_aff), paper_id
+
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        t = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return {
+        "n": len(samples),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory collaboration graph.")
+    parser.add_argument("--edges", type=int, default=1_000_000, help="paper-author links")
+    parser.add_argument("--authors", type=int, default=200_000)
+    parser.add_argument("--affiliations", type=int, default=5_000)
+    parser.add_argument("--authors-per-paper", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    paper_author, author_aff, n_papers = synthetic_links(
+        args.edges, args.authors_per_paper, args.authors, args.affiliations, args.seed)
+    print(f"generated {len(paper_author[0]):,} paper-author + {len(author_aff[0]):,} author-affiliation links "
+          f"in {time.perf_counter() - t:.1f}s")
+
+    t = time.perf_counter()
+    graph = CollabGraph(paper_author, author_aff)
+    print(f"build: {time.perf_counter() - t:.2f}s  {graph.stats()['bytes'] / 1e6:.1f} MB of arrays  "
+          f"maxrss {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    rng = random.Random(args.seed + 1)
+    authors = [(rng.randint(1, args.authors),) for _ in range(args.queries)]
+    pairs = [(rng.randint(1, args.authors), rng.randint(1, args.authors), 6) for _ in range(args.queries // 10)]
+    print("coauthors     ", timed(graph.coauthors, authors))
+    print("shortest_path ", timed(graph.shortest_path, pairs))
+    print("network_papers", timed(lambda a: graph.network_papers([a], 1, (), 20), authors[:args.queries // 10]))
+    print("top_affiliations (cold)", timed(graph.top_affiliations, [(20,)]))
+    print("top_affiliations (warm)", timed(graph.top_affiliations, [(20,)] * 100))
+
+    # 模擬 upload：每次一篇新 paper 4 位作者，進 delta buffer
+    new_links = [[(n_papers + i + 1, rng.randint(1, args.authors)) for _ in range(4)] for i in range(10_000)]
+    print("add_links (delta)", timed(graph.add_links, [(links,) for links in new_links]))
+    print("coauthors with delta", timed(graph.coauthors, authors))
+    t = time.perf_counter()
+    graph._compact()
+    print(f"compact: {time.perf_counter() - t:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
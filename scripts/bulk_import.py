@@ -0,0 +1,43 @@
+# run: PYTHONPATH=. python scripts/bulk_import.py papers.bib --batch-size 2000 --rejects rejects.jsonl
+import argparse
+import json
+import sys
+
+from sqlmodel import create_engine, Session
+
+from app.bulk_import import DEFAULT_BATCH_SIZE, FORMATS, detect_format, import_stream
+from app.config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream papers / reports from BibTeX, CSV or JSONL into the database.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="default: detect from file extension")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--rejects", default="rejects.jsonl", help="bad rows are written here as JSONL")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    engine = create_engine(settings.DATABASE_URL)
+
+    def progress(stats):
+        rate = stats["read"] / stats["elapsed"] if stats["elapsed"] else 0
+        print(f"\rread {stats['read']}  papers {stats['papers']}  reports {stats['reports']}  "
+              f"rejected {stats['rejected']}  ({rate:,.0f} rows/s)", end="", file=sys.stderr)
+
+    with open(args.rejects, "w", encoding="utf-8") as rejects, \
+            open(args.path, "rb") as fp, \
+            Session(engine) as session:
+        def on_reject(ref, error, raw):
+            rejects.write(json.dumps({"ref": ref, "error": error, "record": raw}, ensure_ascii=False, default=str) + "\n")
+
+        stats = import_stream(session, fp, fmt, batch_size=args.batch_size, on_reject=on_reject, progress=progress)
+
+    print(file=sys.stderr)
+    print(json.dumps(stats))
+    if stats["rejected"]:
+        print(f"{stats['rejected']} rejected rows written to {args.rejects}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
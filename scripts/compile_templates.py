@@ -0,0 +1,30 @@
+# run: PYTHONPATH=. python scripts/compile_templates.py [--dir .jinja_cache]
+# image build 時把 templates/*.html 預先編譯進 Jinja bytecode cache，worker 第一次 render 不必再編譯。
+# 不讀 app.config（build 時沒有 DATABASE_URL 等環境變數）；--dir 要跟執行時的 TEMPLATE_BYTECODE_DIR 相同，
+# 也要在同一個工作目錄下執行（cache key 含 template 的路徑）。
+import argparse
+import json
+import os
+import time
+
+from starlette.templating import Jinja2Templates
+
+from app.startup import load_all_templates, template_bytecode_cache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=os.environ.get("TEMPLATE_BYTECODE_DIR") or ".jinja_cache")
+    parser.add_argument("--templates", default="templates")
+    args = parser.parse_args()
+
+    # 跟 app.main 的 TimedTemplates 同樣的 Environment 設定（autoescape 等會影響編譯結果）
+    templates = Jinja2Templates(directory=args.templates)
+    templates.env.bytecode_cache = template_bytecode_cache(args.dir)
+    started = time.perf_counter()
+    n = load_all_templates(templates.env)
+    print(json.dumps({"templates": n, "dir": args.dir, "seconds": round(time.perf_counter() - started, 3)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# run: PYTHONPATH=. python scripts/rebuild_related.py
+# 重新估計 IDF、整批重算 related reports 的 TF-IDF matrix 並存成新的 snapshot；
+# 執行中的 worker 下次 refresh 時會改 mmap 新的 snapshot
+import json
+
+from sqlmodel import create_engine, Session
+
+from app.config import settings
+from app.recommend import rebuild_related
+
+
+def main():
+    engine = create_engine(settings.DATABASE_URL)
+    with Session(engine) as session:
+        print(json.dumps(rebuild_related(session)))
+
+
+if __name__ == "__main__":
+    main()
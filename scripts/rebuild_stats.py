@@ -0,0 +1,18 @@
+# run: PYTHONPATH=. python scripts/rebuild_stats.py
+# activitycounter / tagstats 與原始資料對不起來時（手動改資料、舊版程式寫入）整批重算
+import json
+
+from sqlmodel import create_engine, Session
+
+from app.config import settings
+from app.stats import rebuild_stats
+
+
+def main():
+    engine = create_engine(settings.DATABASE_URL)
+    with Session(engine) as session:
+        print(json.dumps(rebuild_stats(session)))
+
+
+if __name__ == "__main__":
+    main()
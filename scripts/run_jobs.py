@@ -0,0 +1,35 @@
+# run: PYTHONPATH=. python scripts/run_jobs.py [--once]
+# web process 設 JOB_RUNNER=false 時，background job 由這個 process 處理（可以開好幾個，SKIP LOCKED 不會重複領取）
+import argparse
+import json
+import signal
+import threading
+
+from sqlmodel import create_engine
+
+from app import db
+from app.config import settings
+from app.jobs import job_runner, run_until_empty
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--once", action="store_true", help="run the jobs that are due now, then exit")
+    args = parser.parse_args()
+
+    db.engine = create_engine(settings.DATABASE_URL, **db.engine_options(settings.DATABASE_URL, "primary"))
+    if args.once:
+        print(json.dumps(run_until_empty()))
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    job_runner.start()
+    print(f"job runner {job_runner.worker_id}: {settings.JOB_WORKERS} {settings.JOB_POOL} workers")
+    stop.wait()
+    job_runner.stop()
+
+
+if __name__ == "__main__":
+    main()
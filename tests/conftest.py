@@ -0,0 +1,123 @@
+# conftest.py
+# 測試共用：暫存目錄裡的 SQLite 資料庫 + attachment / related 目錄。
+# settings 在 import app 時就建立，環境變數必須在任何 `from app ...` 之前設好。
+
+import os
+import tempfile
+import time
+import uuid
+
+_TMP = tempfile.mkdtemp(prefix="labreports-test-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TMP}/lab.db",
+    "AUTO_MIGRATE": "true",
+    "RELATED_DIR": os.path.join(_TMP, "related"),
+    "ATTACHMENT_DIR": os.path.join(_TMP, "attachments"),
+    "TEMPLATE_BYTECODE_DIR": "",
+    "JOB_POLL_SECONDS": "0.1",
+    "FAST_STARTUP": "false",
+    "DB_ASYNC": "false",
+})
+for key in ("READ_DATABASE_URL", "ASYNC_DATABASE_URL", "ASYNC_READ_DATABASE_URL"):
+    os.environ.pop(key, None)
+for key, value in {
+    "SECRET_KEY": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "POSTGRES_PORT": "5432",
+}.items():
+    os.environ.setdefault(key, value)
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import db
+from app.ingest import ingest_report
+from app.main import app
+from app.models import User
+from app.recommend import ensure_related_index
+
+
+def unique(prefix: str) -> str:
+    """整個 test session 共用一個資料庫，名稱加上亂數避免互相影響"""
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture(scope="session")
+def started():
+    """跑一次 startup（migrations、job runner），結束時 shutdown"""
+    with TestClient(app):
+        yield app
+
+
+@pytest.fixture
+def client(started):
+    """每個 test 自己的 cookie（登入狀態、read-after-write 記錄）"""
+    return TestClient(started)
+
+
+@pytest.fixture
+def session(started):
+    with Session(db.engine) as s:
+        yield s
+
+
+@pytest.fixture
+def make_user(session):
+    def make(username=None) -> User:
+        u = User(username=username or unique("user"), display_name="Tester")
+        session.add(u)
+        session.commit()
+        session.refresh(u)
+        return u
+    return make
+
+
+@pytest.fixture
+def make_report(session, make_user):
+    """走 /upload 同一條 ingest 路徑；paper / meeting 預設每次都新建"""
+    def make(user=None, **data):
+        user = user or make_user()
+        data.setdefault("report_title", unique("report"))
+        data.setdefault("meeting", {"meeting_title": unique("meeting")})
+        if not data.get("paper_id"):
+            data.setdefault("paper", {
+                "paper_title": unique("paper"),
+                "published_year": 2024,
+                "published_month": 1,
+                "journal_or_conference": "",
+            })
+        return ingest_report(session, user.id, data)
+    return make
+
+
+@pytest.fixture
+def login(make_user):
+    def do(client, username=None) -> User:
+        u = make_user(username)
+        client.post("/login", data={"username": u.username}, follow_redirects=False)
+        return u
+    return do
+
+
+@pytest.fixture
+def related_index(session):
+    """第一次用到時 related_snapshot job 才會 build snapshot，等它完成"""
+    deadline = time.monotonic() + 30
+    while True:
+        index = ensure_related_index(session)
+        if index.loaded:
+            return index
+        assert time.monotonic() < deadline, "related snapshot was not built"
+        time.sleep(0.1)
+
+
+def eventually(check, timeout: float = 10):
+    """counters / tag stats 由背景 job 套用：重試 check() 直到成立"""
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "condition did not become true in time"
+        time.sleep(0.05)
+    return True
@@ -0,0 +1,70 @@
+import pytest
+from conftest import unique
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import db
+from app.db import async_database_url, run_db
+from app.main import app
+from app.models import Report
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def async_db(started, monkeypatch):
+    """DB_ASYNC=true 的 request path：同一個 SQLite 檔，經 aiosqlite + AsyncSession"""
+    monkeypatch.setattr(db.settings, "ASYNC_DATABASE_URL", None)
+    # TestClient 每個 request 可能在不同的 event loop 上，connection 不留在 pool 裡
+    e = create_async_engine(async_database_url(), poolclass=NullPool)
+    monkeypatch.setattr(db, "async_engine", e)
+    app.dependency_overrides[db.get_sync_session] = db.get_async_session
+    yield e
+    app.dependency_overrides.pop(db.get_sync_session, None)
+
+
+def count_reports(session: Session) -> int:
+    return session.exec(select(func.count()).select_from(Report)).one()
+
+
+@pytest.mark.anyio
+async def test_run_db_runs_the_same_code_on_both_sessions(async_db, make_report):
+    make_report()
+    with Session(db.engine) as s:
+        expected = await run_db(s, count_reports)
+    async with AsyncSession(async_db) as s:
+        assert await run_db(s, count_reports) == expected >= 1
+
+
+def test_pages_render_on_an_async_session(client, async_db, make_report, login):
+    tag = unique("tag")
+    r = make_report(tags=[tag], authors=[{"name": unique("Author"), "affiliations": [unique("Univ")]}])
+    login(client)
+    # template 用到的關聯都是 eager load；lazy load 在 AsyncSession 上會直接失敗
+    page = client.get(f"/reports/{r.id}")
+    assert page.status_code == 200
+    assert r.report_title in page.text and tag in page.text
+    assert client.get("/reports/999999").status_code == 404
+    assert r.id in [item["r"]["id"] for item in client.get("/api/reports").json()["items"]]
+
+
+def test_async_database_url(monkeypatch):
+    monkeypatch.setattr(db.settings, "ASYNC_DATABASE_URL", None)
+    for url, expected in [
+        ("postgresql://u:p@db/lab", "postgresql+asyncpg://u:p@db/lab"),
+        ("postgresql+psycopg2://u:p@db/lab", "postgresql+asyncpg://u:p@db/lab"),
+        ("sqlite:///lab.db", "sqlite+aiosqlite:///lab.db"),
+    ]:
+        monkeypatch.setattr(db.settings, "DATABASE_URL", url)
+        assert async_database_url() == expected
+    monkeypatch.setattr(db.settings, "DATABASE_URL", "mysql://db/lab")
+    with pytest.raises(ValueError):
+        async_database_url()
+    monkeypatch.setattr(db.settings, "ASYNC_DATABASE_URL", "mysql+aiomysql://db/lab")
+    assert async_database_url() == "mysql+aiomysql://db/lab"
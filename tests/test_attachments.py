@@ -0,0 +1,179 @@
+import io
+import zipfile
+
+import pytest
+from conftest import unique
+
+from app import attachments
+from app.attachments import ZeroCopyFileResponse, blob_path, single_range
+
+PDF = b"%PDF-1.4\n" + b"0123456789" * 100
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def pdf_bytes() -> bytes:
+    """每個 test 不同的內容，content store 裡不會撞到別的 test 的檔案"""
+    return PDF + unique("x").encode()
+
+
+def upload(client, report_id, body, filename="slides.pdf"):
+    return client.post(f"/api/reports/{report_id}/attachments", params={"filename": filename}, content=body)
+
+
+def test_upload_and_range_download(client, make_report, login):
+    r = make_report()
+    login(client)
+    body = pdf_bytes()
+    response = upload(client, r.id, body)
+    assert response.status_code == 201
+    item = response.json()
+    assert (item["size"], item["content_type"], item["filename"]) == (len(body), "application/pdf", "slides.pdf")
+
+    full = client.get(item["url"])
+    assert full.status_code == 200
+    assert full.content == body
+    assert full.headers["etag"] == f'"{item["sha256"]}"'
+    assert full.headers["content-disposition"].startswith("inline")
+    assert client.get(item["url"], params={"download": 1}).headers["content-disposition"].startswith("attachment")
+
+    part = client.get(item["url"], headers={"Range": "bytes=2-5"})
+    assert part.status_code == 206
+    assert part.content == body[2:6]
+    assert part.headers["content-range"] == f"bytes 2-5/{len(body)}"
+
+    etag = full.headers["etag"]
+    assert client.get(item["url"], headers={"Range": "bytes=0-3", "If-Range": etag}).status_code == 206
+    stale = client.get(item["url"], headers={"Range": "bytes=0-3", "If-Range": '"old"'})
+    assert (stale.status_code, stale.content) == (200, body)
+    assert client.get(item["url"], headers={"Range": f"bytes={len(body) + 10}-"}).status_code == 416
+    assert client.get("/attachments/999999").status_code == 404
+
+
+def test_same_content_is_stored_once(client, make_report, login):
+    r = make_report()
+    login(client)
+    body = pdf_bytes()
+    first = upload(client, r.id, body, "a.pdf").json()
+    again = upload(client, r.id, body, "a.pdf").json()
+    renamed = upload(client, r.id, body, "b.pdf").json()
+
+    assert again["id"] == first["id"]
+    assert renamed["id"] != first["id"]
+    assert renamed["sha256"] == first["sha256"]
+    listed = client.get(f"/api/reports/{r.id}/attachments").json()["items"]
+    assert [a["filename"] for a in listed] == ["a.pdf", "b.pdf"]
+    assert client.get(renamed["url"]).content == body
+
+    blob = blob_path(first["sha256"])
+    assert blob.read_bytes() == body
+    assert list(attachments.storage_root().rglob(first["sha256"])) == [blob]
+    assert not any((attachments.storage_root() / "tmp").iterdir())
+
+
+def test_rejected_uploads(client, make_report, login, monkeypatch):
+    r = make_report()
+    assert upload(client, r.id, pdf_bytes()).status_code == 401
+    login(client)
+    assert upload(client, 999999, pdf_bytes()).status_code == 404
+    assert upload(client, r.id, pdf_bytes(), "notes.txt").status_code == 400
+    assert upload(client, r.id, b"<html>not a pdf</html>").status_code == 400
+    assert upload(client, r.id, pdf_bytes(), "").status_code == 400
+
+    monkeypatch.setattr(attachments.settings, "ATTACHMENT_MAX_BYTES", 100)
+    assert upload(client, r.id, pdf_bytes()).status_code == 413
+    # 失敗的上傳不留下暫存檔
+    assert not any((attachments.storage_root() / "tmp").iterdir())
+
+
+def test_multipart_upload_redirects(client, make_report, login):
+    r = make_report()
+    login(client)
+    response = client.post(
+        f"/api/reports/{r.id}/attachments",
+        files={"file": ("../../etc/deck.pdf", pdf_bytes(), "application/pdf")},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    items = client.get(f"/api/reports/{r.id}/attachments").json()["items"]
+    assert [a["filename"] for a in items] == ["deck.pdf"]
+
+
+def test_embedded_pptx_thumbnail(client, make_report, login):
+    r = make_report()
+    login(client)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("docProps/thumbnail.jpeg", b"\xff\xd8jpeg-preview")
+        z.writestr("ppt/presentation.xml", unique("deck"))
+    pptx = upload(client, r.id, buf.getvalue(), "deck.pptx").json()
+    thumb = client.get(pptx["thumbnail_url"])
+    assert (thumb.status_code, thumb.headers["content-type"], thumb.content) == (200, "image/jpeg", b"\xff\xd8jpeg-preview")
+
+    odp = io.BytesIO()
+    with zipfile.ZipFile(odp, "w") as z:
+        z.writestr("content.xml", unique("deck"))
+    no_preview = upload(client, r.id, odp.getvalue(), "deck.odp").json()
+    assert client.get(no_preview["thumbnail_url"]).status_code == 404
+
+
+async def zerocopy_get(path, headers=()):
+    """假的 ASGI server：支援 zerocopysend，收到的 file 直接讀出來當 body"""
+    sent = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            f = message["file"]
+            f.seek(message["offset"])
+            message = {**message, "body": f.read(message.get("count", -1))}
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http", "method": "GET", "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    await ZeroCopyFileResponse(str(path), media_type="application/pdf")(scope, receive, send)
+    start, *body = sent
+    return start["status"], dict(start["headers"]), body
+
+
+@pytest.mark.anyio
+async def test_zerocopysend(tmp_path):
+    path = tmp_path / "blob"
+    path.write_bytes(PDF)
+
+    status, headers, [body] = await zerocopy_get(path)
+    assert (status, body["type"], body["body"]) == (200, "http.response.zerocopysend", PDF)
+    assert headers[b"content-length"] == str(len(PDF)).encode()
+
+    status, headers, [body] = await zerocopy_get(path, [("range", "bytes=3-9")])
+    assert status == 206
+    assert headers[b"content-range"] == f"bytes 3-9/{len(PDF)}".encode()
+    assert (body["type"], body["body"]) == ("http.response.zerocopysend", PDF[3:10])
+
+    status, headers, [body] = await zerocopy_get(path, [("range", "bytes=-4")])
+    assert (status, body["body"]) == (206, PDF[-4:])
+    status, _, [body] = await zerocopy_get(path, [("range", "bytes=0-3"), ("if-range", '"old"')])
+    assert (status, body["body"]) == (200, PDF)
+
+    # 多段與超出範圍的 Range 交回 FileResponse：一般的 http.response.body
+    status, _, body = await zerocopy_get(path, [("range", "bytes=0-1, 5-6")])
+    assert status == 206 and {m["type"] for m in body} == {"http.response.body"}
+    status, _, _ = await zerocopy_get(path, [("range", f"bytes={len(PDF)}-")])
+    assert status == 416
+
+
+def test_single_range():
+    assert single_range("bytes=2-5", 10) == (2, 6)
+    assert single_range("bytes=2-", 10) == (2, 10)
+    assert single_range("bytes=3-100", 10) == (3, 10)
+    assert single_range("bytes=-3", 10) == (7, 10)
+    assert single_range("bytes=-30", 10) == (0, 10)
+    for bad in ("bytes=0-1,3-4", "bytes=-", "bytes=5-2", "bytes=10-", "items=0-1", "bytes=x-1"):
+        assert single_range(bad, 10) is None, bad
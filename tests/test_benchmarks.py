@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from app.models import Comment, Report, TagStats
+from benchmarks.load import compare, summarize
+from benchmarks.seed import plan_counts, seed
+
+
+def seeded(tmp_path, name: str, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path}/{name}.db")
+    return engine, seed(engine, "1k", log=None, **kwargs)
+
+
+def rows(engine, model, *columns) -> list:
+    with Session(engine) as s:
+        return s.exec(select(*columns).order_by(model.id)).all()
+
+
+def test_seed_is_reproducible(tmp_path):
+    a, written = seeded(tmp_path, "a")
+    b, _ = seeded(tmp_path, "b")
+    c, _ = seeded(tmp_path, "c", seed=1)
+    counts = plan_counts(1_000)
+    assert (written["report"], written["comment"]) == (counts["reports"], counts["comments"])
+
+    reports = rows(a, Report, Report.report_title, Report.user_id, Report.paper_id, Report.created_at)
+    assert reports == rows(b, Report, Report.report_title, Report.user_id, Report.paper_id, Report.created_at)
+    assert reports != rows(c, Report, Report.report_title, Report.user_id, Report.paper_id, Report.created_at)
+    assert rows(a, Comment, Comment.report_id, Comment.content) == rows(b, Comment, Comment.report_id, Comment.content)
+    # 寫完之後 summary table 已經重算
+    with Session(a) as s:
+        assert s.exec(select(TagStats)).first() is not None
+
+    with pytest.raises(RuntimeError):
+        seed(a, "1k", log=None)
+    with pytest.raises(ValueError):
+        seed(a, "10", log=None)
+    for e in (a, b, c):
+        e.dispose()
+
+
+def test_compare_flags_regressions():
+    baseline = summarize({"GET /": [(10.0, True, 3)] * 100}, elapsed=1.0)
+    assert compare(baseline, baseline) == []
+
+    slower = summarize({"GET /": [(20.0, True, 5)] * 50 + [(20.0, False, 5)]}, elapsed=1.0)
+    problems = compare(slower, baseline)
+    assert [p.split()[2] for p in problems[:4]] == ["p95_ms", "p99_ms", "rps", "sql_per_request"]
+    assert problems[4] == "GET /: 1 errors (baseline had none)"
@@ -0,0 +1,128 @@
+import io
+import json
+
+from conftest import unique
+from sqlmodel import select
+
+from app.bulk_import import detect_format, import_stream, parse_authors
+from app.models import Affiliation, Author, LabMeeting, Paper, Report, Tag, User
+
+
+def run_import(session, data: bytes, fmt: str, **kwargs):
+    rejects = []
+    stats = import_stream(
+        session, io.BytesIO(data), fmt, on_reject=lambda ref, error, raw: rejects.append((ref, error)), **kwargs
+    )
+    return stats, rejects
+
+
+def jsonl(*rows) -> bytes:
+    return b"".join((r if isinstance(r, bytes) else json.dumps(r).encode()) + b"\n" for r in rows)
+
+
+def paper(session, title) -> Paper:
+    return session.exec(select(Paper).where(Paper.paper_title == title)).one()
+
+
+def test_jsonl_papers_and_reports(session):
+    title, presenter, meeting = unique("paper"), unique("presenter"), unique("meeting")
+    stats, rejects = run_import(session, jsonl({
+        "title": title, "year": 2023, "month": "mar", "venue": "NeurIPS",
+        "authors": ["Ada", {"name": "Bob", "affiliations": ["MIT"]}], "tags": ["gnn"],
+        "report_title": "Reading group", "presenter": presenter, "meeting_title": meeting,
+        "created_at": "2024-01-02T10:00:00",
+    }), "jsonl")
+    assert rejects == []
+    assert (stats["read"], stats["papers"], stats["reports"]) == (1, 1, 1)
+
+    p = paper(session, title)
+    assert (p.published_year, p.published_month, p.journal_or_conference) == (2023, 3, "NeurIPS")
+    assert sorted(a.name for a in p.authors) == ["Ada", "Bob"]
+    r = session.exec(select(Report).where(Report.paper_id == p.id)).one()
+    assert session.get(User, r.user_id).username == presenter
+    assert session.get(LabMeeting, r.meeting_id).meeting_title == meeting
+
+
+def test_bad_rows_are_rejected_and_the_rest_imported(session):
+    good_a, good_b = unique("paper"), unique("paper")
+    stats, rejects = run_import(session, jsonl(
+        {"title": good_a},
+        {"year": 2020},                                     # no title
+        b"{not json",
+        {"title": unique("paper"), "year": "soon"},
+        {"title": unique("paper"), "authors": 5},
+        {"title": unique("paper"), "authors": [{"name": "x", "affiliations": 3}]},
+        {"title": unique("paper"), "tags": {"a": 1}},
+        {"title": unique("paper"), "report_title": "r"},    # report without presenter / meeting
+        "é".encode("latin-1") + b'{"title": "broken"}',  # 不是 UTF-8 的一列
+        {"title": good_b},
+    ), "jsonl", batch_size=3)
+    assert stats["papers"] == 2
+    assert stats["rejected"] == 8
+    assert sorted(ref for ref, _ in rejects) == sorted(f"line {n}" for n in range(2, 10))
+    assert any("UTF-8" in error for _, error in rejects)
+    assert paper(session, good_a).id and paper(session, good_b).id
+
+
+def test_blank_names_are_dropped(session):
+    title = unique("paper")
+    stats, rejects = run_import(session, jsonl({
+        "title": title,
+        "authors": ["  ", {"name": " ", "affiliations": ["X"]}, {"name": " Cy ", "affiliations": ["", " MIT "]}],
+        "tags": ["", "  ", " nlp "],
+    }), "jsonl")
+    assert rejects == []
+    p = paper(session, title)
+    assert [a.name for a in p.authors] == ["Cy"]
+    assert [x.name for x in p.authors[0].affiliations] == ["MIT"]
+    assert [t.name for t in p.tags] == ["nlp"]
+    for model in (Author, Affiliation, Tag):
+        assert session.exec(select(model).where(model.name.in_(["", " "]))).first() is None
+
+
+def test_csv_and_bibtex(session):
+    csv_title, bib_title = unique("paper"), unique("paper")
+    csv_data = (
+        "paper_title,year,authors,tags\n"
+        f'{csv_title},2021,"Ada [MIT, ]; ; Bob","a, , b"\n'
+        ",2021,,\n"
+    ).encode()
+    stats, rejects = run_import(session, csv_data, "csv")
+    assert (stats["papers"], stats["rejected"]) == (1, 1)
+    p = paper(session, csv_title)
+    assert sorted(a.name for a in p.authors) == ["Ada", "Bob"]
+    assert sorted(t.name for t in p.tags) == ["a", "b"]
+
+    bib = (
+        "@article{k1,\n"
+        f"  title = {{{bib_title}}},\n"
+        "  author = {Lovelace, Ada and Babbage, Charles},\n"
+        "  year = 1843, journal = {Notes}, keywords = {engines, math}\n"
+        "}\n"
+        "@article{k2, year = 1900}\n"
+    ).encode()
+    stats, rejects = run_import(session, bib, "bibtex")
+    assert (stats["papers"], stats["rejected"]) == (1, 1)
+    p = paper(session, bib_title)
+    assert (p.published_year, p.journal_or_conference) == (1843, "Notes")
+    assert len(p.authors) == 2
+
+
+def test_parse_authors_and_detect_format():
+    assert parse_authors("Ada [MIT, Stanford]; Bob") == [
+        {"name": "Ada", "affiliations": ["MIT", "Stanford"]},
+        {"name": "Bob", "affiliations": []},
+    ]
+    assert detect_format("refs.BIB") == "bibtex"
+    assert detect_format("rows.jsonl") == "jsonl"
+
+
+def test_import_route_reports_rejects(client, login):
+    assert client.post("/import", files={"file": ("x.jsonl", b"{}\n")}).status_code == 401
+    login(client)
+    response = client.post("/import", files={"file": ("x.jsonl", jsonl({"title": unique("paper")}, {"year": 1}))})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["papers"], body["rejected"]) == (1, 1)
+    assert body["rejects"][0]["ref"] == "line 2"
+    assert client.post("/import", files={"file": ("x.txt", b"")}).status_code == 400
@@ -0,0 +1,58 @@
+from conftest import unique
+
+from app import cache
+from app.cache import LRUCache, get_cached_user, name_cache_for, user_cache
+from app.ingest import resolve_names
+from app.models import Tag
+
+
+def test_lru_evicts_the_least_recently_used():
+    c = LRUCache("t", maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+    stats = c.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 3, 1)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    c = LRUCache("t", maxsize=10, ttl=5)
+    c.set("a", 1)
+    now[0] += 4
+    assert c.get("a") == 1
+    now[0] += 2
+    assert c.get("a") is None
+    assert c.stats()["size"] == 0
+
+
+def test_user_cache(session, make_user):
+    username = unique("user")
+    assert get_cached_user(session, username) is None
+    assert user_cache.get(username) is None  # 不存在的 username 不 cache
+    u = make_user(username)
+    assert get_cached_user(session, username) == {"id": u.id, "username": username, "display_name": "Tester"}
+    assert user_cache.get(username)["id"] == u.id
+
+
+def test_names_are_cached_only_after_commit(session):
+    tags = name_cache_for(Tag)
+    name = unique("tag")
+    resolve_names(session, Tag, [name])
+    assert tags.get(name) is None
+    session.rollback()
+    assert tags.get(name) is None
+
+    ids = resolve_names(session, Tag, [name])
+    session.commit()
+    assert tags.get(name) == ids[name]
+    assert resolve_names(session, Tag, [name]) == ids
+
+
+def test_cache_stats_api(client):
+    stats = client.get("/api/cache/stats").json()
+    assert {"user", "tag", "author", "affiliation"} <= set(stats)
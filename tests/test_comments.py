@@ -0,0 +1,175 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import unique
+
+from app import comments
+from app.comments import Broadcaster, comment_item, comment_stream, publish_comment, start_cursor
+from app.models import Comment
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def post_comment(client, report_id, content):
+    return client.post(
+        "/comments", data={"report_id": report_id, "content": content}, headers={"Accept": "application/json"}
+    )
+
+
+# ---------------- JSON API ----------------
+def test_comment_pages_oldest_first(client, make_report, login):
+    r = make_report()
+    login(client)
+    posted = [post_comment(client, r.id, f"c{i}").json()["id"] for i in range(5)]
+
+    seen, cursor = [], None
+    while True:
+        page = client.get(f"/api/reports/{r.id}/comments", params={"limit": 2, "cursor": cursor}).json()
+        assert len(page["items"]) <= 2
+        seen += [c["id"] for c in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == posted
+
+
+def test_comment_errors(client, make_report):
+    r = make_report()
+    assert post_comment(client, r.id, "hi").status_code == 401
+    assert client.get("/api/reports/999999/comments").status_code == 404
+    assert client.get(f"/api/reports/{r.id}/comments", params={"cursor": "bogus"}).status_code == 400
+    assert client.get("/api/reports/999999/comments/stream").status_code == 404
+    assert client.get(f"/api/reports/{r.id}/comments/stream", headers={"Last-Event-ID": "bogus"}).status_code == 400
+
+
+def test_post_comment_returns_the_item(client, make_report, login):
+    r = make_report()
+    user = login(client)
+    response = post_comment(client, r.id, "hello")
+    assert response.status_code == 201
+    item = response.json()
+    assert (item["report_id"], item["content"], item["user"]["id"]) == (r.id, "hello", user.id)
+    assert post_comment(client, 999999, "x").status_code == 404
+
+
+# ---------------- SSE stream ----------------
+class StreamReader:
+    """comment_stream 的 body 在背景 task 裡讀，收到的 comment 依序放進 events"""
+
+    def __init__(self, report_id: int, cursor: str, broadcaster: Broadcaster):
+        self.sub = broadcaster.subscribe(report_id)
+        self.events = []
+        self.ended = False
+        self.task = asyncio.create_task(self._read(comment_stream(self.sub, cursor)))
+
+    async def _read(self, body):
+        async for chunk in body:
+            if chunk.startswith(b"id:"):
+                data = chunk.decode().split("data: ", 1)[1]
+                self.events.append(json.loads(data))
+        self.ended = True
+
+    @property
+    def ids(self):
+        return [e["id"] for e in self.events]
+
+    async def wait(self, n: int, timeout: float = 5):
+        async def until():
+            while len(self.events) < n:
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(until(), timeout)
+
+    async def close(self):
+        self.task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await self.task
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    b = Broadcaster(queue_size=10, max_subscribers=10)
+    monkeypatch.setattr(comments, "comment_broadcaster", b)
+    monkeypatch.setattr(comments.settings, "COMMENT_STREAM_KEEPALIVE_SECONDS", 0.05)
+    return b
+
+
+@pytest.fixture
+def write_comment(session, make_user):
+    """其他 worker 寫入的 comment：直接進 DB，不經過這個 process 的 broadcaster"""
+    user = make_user()
+
+    def write(report_id, created_at=None) -> dict:
+        c = Comment(report_id=report_id, user_id=user.id, content=unique("c"), created_at=created_at or datetime.utcnow())
+        session.add(c)
+        session.commit()
+        session.refresh(c)
+        return comment_item(c, {"id": user.id, "display_name": user.display_name})
+    return write
+
+
+@pytest.mark.anyio
+async def test_stream_replays_then_pushes_live(broadcaster, make_report, write_comment):
+    r = make_report()
+    old = [write_comment(r.id), write_comment(r.id)]
+    reader = StreamReader(r.id, start_cursor(r), broadcaster)
+    await reader.wait(2)
+
+    live = write_comment(r.id)
+    assert publish_comment(live) == 1
+    await reader.wait(3)
+    assert reader.ids == [c["id"] for c in old] + [live["id"]]
+    await reader.close()
+    assert broadcaster.stats()["subscribers"] == 0
+
+
+@pytest.mark.anyio
+async def test_stream_resumes_after_cursor(broadcaster, make_report, write_comment, monkeypatch):
+    monkeypatch.setattr(comments.settings, "COMMENT_STREAM_LOOKBACK_SECONDS", 0)
+    r = make_report()
+    now = datetime.utcnow()
+    first = write_comment(r.id, now - timedelta(seconds=2))
+    second = write_comment(r.id, now - timedelta(seconds=1))
+    reader = StreamReader(r.id, first["cursor"], broadcaster)
+    await reader.wait(1)
+    assert reader.ids == [second["id"]]
+    await reader.close()
+
+
+@pytest.mark.anyio
+async def test_late_commit_with_earlier_timestamp_is_not_skipped(broadcaster, make_report, write_comment):
+    r = make_report()
+    now = datetime.utcnow()
+    reader = StreamReader(r.id, start_cursor(r), broadcaster)
+    newer = write_comment(r.id, now)
+    publish_comment(newer)
+    await reader.wait(1)
+
+    # 另一個 worker 的 comment：created_at 比已送出的早，但比較晚 commit，只會在閒置 replay 時被查到
+    late = write_comment(r.id, now - timedelta(seconds=1))
+    await reader.wait(2)
+    # 重複 publish 同一則不會再送一次
+    publish_comment(newer)
+    publish_comment(late)
+    await asyncio.sleep(0.2)
+    assert reader.ids == [newer["id"], late["id"]]
+    await reader.close()
+
+
+@pytest.mark.anyio
+async def test_slow_client_is_disconnected(monkeypatch, make_report, write_comment):
+    b = Broadcaster(queue_size=1, max_subscribers=1)
+    monkeypatch.setattr(comments, "comment_broadcaster", b)
+    r = make_report()
+    sub = b.subscribe(r.id)
+    assert b.subscribe(r.id) is None  # max_subscribers
+
+    item = write_comment(r.id)
+    assert publish_comment(item) == 1
+    assert publish_comment(item) == 0  # queue 滿了：斷線，讓 client 重連再補
+    assert b.stats()["dropped"] == 1
+    assert sub.queue.get_nowait() is None
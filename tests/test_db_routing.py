@@ -0,0 +1,107 @@
+import shutil
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session
+
+from app import db
+from app.db import engine_options, primary_bind, replica_router
+
+
+def measure_lag():
+    """背景 thread 量一次 replica lag，等它結束"""
+    replica_router.checked_at = None
+    replica_router.refresh()
+    deadline = time.monotonic() + 10
+    while replica_router.checked_at is None:
+        assert time.monotonic() < deadline, "replica lag check did not finish"
+        time.sleep(0.01)
+
+
+def use_replica(monkeypatch, url):
+    e = create_engine(url, **engine_options(url, "replica"))
+    monkeypatch.setattr(db, "read_engine", e)
+    for attr in ("lag", "error", "checked_at"):
+        monkeypatch.setattr(replica_router, attr, None)
+    measure_lag()
+    return e
+
+
+@pytest.fixture
+def replica(started, tmp_path, monkeypatch):
+    """replica = 現在的 primary 複製一份；之後寫進 primary 的東西 replica 上看不到"""
+    path = tmp_path / "replica.db"
+    shutil.copy(db.engine.url.database, path)
+    e = use_replica(monkeypatch, f"sqlite:///{path}")
+    yield e
+    e.dispose()
+
+
+def comments_status(client, report_id):
+    return client.get(f"/api/reports/{report_id}/comments").status_code
+
+
+def test_reads_go_to_the_replica(client, replica, make_report):
+    r = make_report()  # 只在 primary
+    assert replica_router.healthy
+    assert comments_status(client, r.id) == 404
+    body = {"filters": [{"field": "report_title", "op": "=", "value": r.report_title}]}
+    assert client.post("/query", json=body).json()["results"] == []
+
+
+def test_reads_after_a_write_go_to_the_primary(client, replica, make_report, login, monkeypatch):
+    r = make_report()
+    login(client)  # POST：這個 client 剛寫過
+    assert comments_status(client, r.id) == 200
+
+    monkeypatch.setattr(db.settings, "READ_AFTER_WRITE_SECONDS", 0)
+    assert comments_status(client, r.id) == 404
+
+
+def test_lagging_replica_falls_back_to_the_primary(client, replica, make_report, monkeypatch):
+    r = make_report()
+    monkeypatch.setattr(replica_router, "lag", db.settings.READ_MAX_LAG_SECONDS + 1)
+    assert comments_status(client, r.id) == 200
+    assert replica_router.stats()["healthy"] is False
+
+
+def test_unreachable_replica_falls_back_to_the_primary(client, started, make_report, tmp_path, monkeypatch):
+    use_replica(monkeypatch, f"sqlite:///{tmp_path}/missing/replica.db")
+    r = make_report()
+    assert comments_status(client, r.id) == 200
+    stats = client.get("/api/db/stats").json()
+    assert stats["replica"]["configured"] is True
+    assert stats["replica"]["healthy"] is False
+    assert stats["replica"]["error"]
+    assert stats["replica"]["routes"]["primary:unavailable"] >= 1
+
+
+def test_pool_stats_and_primary_bind(client, replica):
+    client.get("/api/reports")
+    stats = client.get("/api/db/stats").json()
+    assert set(stats["pools"]) == {"primary", "replica"}
+    assert stats["pools"]["replica"]["checkouts"] >= 1
+    assert stats["replica"]["routes"]["replica:read"] >= 1
+    with Session(replica) as s:
+        assert primary_bind(s) is db.engine
+    with Session(db.engine) as s:
+        assert primary_bind(s) is db.engine
+
+
+def test_without_a_replica_everything_uses_the_primary(client, started, make_report):
+    assert db.read_engine is None
+    assert replica_router.read_engine() is db.engine
+    assert comments_status(client, make_report().id) == 200
+
+
+def test_engine_options(monkeypatch):
+    monkeypatch.setattr(db.settings, "DB_POOL_SIZE", 7)
+    monkeypatch.setattr(db.settings, "DB_STATEMENT_TIMEOUT_MS", 1500)
+    options = engine_options("postgresql://u:p@localhost/lab", "primary")
+    assert options["pool_size"] == 7
+    assert options["connect_args"] == {"options": "-c statement_timeout=1500"}
+    options = engine_options("postgresql+asyncpg://u:p@localhost/lab", "primary-async", is_async=True)
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "1500"}}
+    assert "connect_args" not in engine_options("sqlite:///x.db", "primary")
+    assert "pool_size" not in engine_options("sqlite://", "primary")
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+
+from conftest import unique
+
+
+def make_pair(make_report):
+    prefix = unique("export")
+    tag = unique("tag")
+    author = {"name": unique("Author"), "affiliations": [unique("Univ")]}
+    made = [make_report(report_title=f"{prefix} {i}", tags=[tag], authors=[author]) for i in range(2)]
+    return prefix, tag, author, made
+
+
+def export(client, prefix, fmt, **kwargs):
+    body = {"filters": [{"field": "report_title", "op": "contains", "value": prefix}], **kwargs}
+    response = client.post("/export", params={"format": fmt}, json=body)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_csv(client, make_report):
+    prefix, tag, author, made = make_pair(make_report)
+    response = export(client, prefix, "csv")
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"].endswith('.csv"')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(r["report_id"]) for r in rows] == [r.id for r in reversed(made)]
+    assert rows[0]["tags"] == tag
+    assert rows[0]["authors"] == f"{author['name']} [{author['affiliations'][0]}]"
+    assert rows[0]["comment_count"] == "0"
+
+
+def test_ndjson(client, make_report):
+    prefix, tag, author, made = make_pair(make_report)
+    lines = export(client, prefix, "ndjson", format="ndjson").text.splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert sorted(r["report_id"] for r in rows) == sorted(r.id for r in made)
+    assert rows[0]["authors"] == [author]
+    assert rows[0]["tags"] == [tag]
+
+
+def test_bibtex(client, make_report):
+    prefix, tag, author, made = make_pair(make_report)
+    text = export(client, prefix, "bibtex").text
+    assert text.count("@article{") == 2
+    assert f"@article{{report{made[0].id}," in text
+    assert f"author = {{{author['name']}}}" in text
+    assert f"keywords = {{{tag}}}" in text
+
+
+def test_get_export_and_bad_requests(client, make_report):
+    prefix, _, _, made = make_pair(make_report)
+    filters = json.dumps([{"field": "report_title", "op": "contains", "value": prefix}])
+    response = client.get("/export", params={"format": "ndjson", "filters": filters})
+    assert len(response.text.splitlines()) == len(made)
+
+    assert client.get("/export", params={"format": "xml"}).status_code == 400
+    assert client.get("/export", params={"filters": "{not json"}).status_code == 400
+    assert client.post("/export", json={"format": ["csv"]}).status_code == 400
+    assert client.post("/export", json={"format": {"x": 1}}).status_code == 400
+    assert client.post("/export", json={"filters": [{"field": "nope", "op": "=", "value": 1}]}).status_code == 400
@@ -0,0 +1,23 @@
+from app.feed import decode_cursor, encode_cursor
+
+
+def test_api_reports_pages_newest_first(client, make_report):
+    made = [make_report().id for _ in range(3)]
+
+    first = client.get("/api/reports", params={"limit": 2}).json()
+    assert [item["r"]["id"] for item in first["items"]] == made[::-1][:2]
+    assert first["next_cursor"]
+    second = client.get("/api/reports", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert second["items"][0]["r"]["id"] == made[0]
+    assert {"user", "meeting", "paper", "tags"} <= set(second["items"][0])
+
+
+def test_cursor_round_trip(make_report):
+    r = make_report()
+    assert decode_cursor(encode_cursor(r)) == (r.created_at, r.id)
+
+
+def test_bad_cursor_is_400(client):
+    for cursor in ("bogus", "bm90IGEgY3Vyc29y", "MjAyNC0wMS0wMXx4"):
+        assert client.get("/api/reports", params={"cursor": cursor}).status_code == 400, cursor
+        assert client.get("/", params={"cursor": cursor}).status_code == 400, cursor
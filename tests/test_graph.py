@@ -0,0 +1,60 @@
+from conftest import unique
+from sqlmodel import select
+
+from app.graph import clamp_graph_limit
+from app.models import Author
+
+
+def author_ids(session, *names) -> list:
+    ids = dict(session.exec(select(Author.name, Author.id).where(Author.name.in_(names))).all())
+    return [ids[n] for n in names]
+
+
+def test_coauthors_and_path(client, session, make_report):
+    a, b, c, d = (unique("Author") for _ in range(4))
+    aff = unique("Univ")
+    first = make_report(authors=[{"name": a, "affiliations": [aff]}, {"name": b, "affiliations": [aff]}])
+    second = make_report(authors=[{"name": b, "affiliations": []}, {"name": c, "affiliations": []}])
+    make_report(authors=[{"name": d, "affiliations": []}])
+    ia, ib, ic, id_ = author_ids(session, a, b, c, d)
+
+    body = client.get(f"/api/graph/authors/{ib}/coauthors").json()
+    assert body["author"] == {"id": ib, "name": b}
+    assert body["total"] == 2
+    assert {(x["name"], x["shared_papers"]) for x in body["coauthors"]} == {(a, 1), (c, 1)}
+
+    path = client.get("/api/graph/path", params={"source": ia, "target": ic}).json()
+    assert (path["found"], path["length"]) == (True, 2)
+    assert [x["id"] for x in path["path"]] == [ia, ib, ic]
+    assert [x["via_paper"]["id"] for x in path["path"][1:]] == [first.paper_id, second.paper_id]
+    assert client.get("/api/graph/path", params={"source": ia, "target": id_}).json()["found"] is False
+
+    assert client.get("/api/graph/authors/999999/coauthors").status_code == 404
+    assert client.get("/api/graph/path", params={"source": ia, "target": 999999}).status_code == 404
+    top = client.get("/api/graph/affiliations", params={"limit": 3}).json()
+    assert len(top) <= 3 and all("affiliation_id" in x and "name" in x for x in top)
+
+
+def test_network_papers(client, make_report, login):
+    a, b, c = (unique("Author") for _ in range(3))
+    user = login(client)
+    make_report(user=user, authors=[{"name": a, "affiliations": []}, {"name": b, "affiliations": []}])
+    near = make_report(authors=[{"name": b, "affiliations": []}, {"name": c, "affiliations": []}])
+    far = make_report(authors=[{"name": c, "affiliations": []}])
+
+    body = client.get("/api/graph/network", params={"depth": 0}).json()
+    assert body["seed_authors"] == 2
+    assert [p["id"] for p in body["papers"]] == [near.paper_id]
+    deeper = client.get("/api/graph/network", params={"depth": 1}).json()
+    assert {p["id"] for p in deeper["papers"]} == {near.paper_id, far.paper_id}
+
+    assert client.get("/api/graph/stats").json()["paper_author_edges"] > 0
+    client.get("/logout")
+    assert client.get("/api/graph/network").status_code == 401
+
+
+def test_clamp_graph_limit():
+    assert clamp_graph_limit(None) == 20
+    assert clamp_graph_limit(0) == 20
+    assert clamp_graph_limit(5) == 5
+    assert clamp_graph_limit(10_000) == 200
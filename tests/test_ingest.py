@@ -0,0 +1,87 @@
+from conftest import unique
+from sqlmodel import select
+
+from app.ingest import clean_names, resolve_names
+from app.models import Author, LabMeeting, Paper, Report, Tag
+
+
+def upload(client, **fields):
+    data = {
+        "report_title": unique("report"),
+        "meeting_title": unique("meeting"),
+        "meeting_date": "2024-05-01",
+        "meeting_location": "Room 1",
+        "paper_title": unique("paper"),
+        "published_year": "2024",
+        **fields,
+    }
+    return client.post("/upload", data=data, follow_redirects=False)
+
+
+def uploaded_report(session, response) -> Report:
+    assert response.status_code == 303, response.text
+    report_id = int(response.headers["location"].rsplit("/", 1)[1])
+    return session.get(Report, report_id)
+
+
+def test_upload_writes_paper_authors_and_tags(client, session, login):
+    login(client)
+    name, aff, tag = unique("Author"), unique("Univ"), unique("tag")
+    r = uploaded_report(session, upload(
+        client, author_name_0=name, author_affiliations_0=f"{aff}, ", tags=f"{tag}, ,  ",
+    ))
+    paper = session.get(Paper, r.paper_id)
+    assert [a.name for a in paper.authors] == [name]
+    assert [x.name for x in paper.authors[0].affiliations] == [aff]
+    assert [t.name for t in paper.tags] == [tag]
+
+
+def test_blank_author_names_are_skipped(client, session, login):
+    login(client)
+    name = unique("Author")
+    r = uploaded_report(session, upload(client, author_name_0="   ", author_name_1=name))
+    assert [a.name for a in session.get(Paper, r.paper_id).authors] == [name]
+    assert session.exec(select(Author).where(Author.name == "")).first() is None
+
+
+def test_names_are_shared_between_uploads(client, session, login):
+    login(client)
+    name, tag = unique("Author"), unique("tag")
+    first = uploaded_report(session, upload(client, author_name_0=name, tags=tag))
+    second = uploaded_report(session, upload(client, author_name_0=name, tags=tag))
+    assert first.paper_id != second.paper_id
+    assert len(session.exec(select(Author).where(Author.name == name)).all()) == 1
+    assert len(session.exec(select(Tag).where(Tag.name == tag)).all()) == 1
+
+
+def test_unknown_meeting_or_paper_is_400(client, session, login):
+    login(client)
+    assert upload(client, existing_meeting_id="999999").status_code == 400
+
+    meeting_title = unique("meeting")
+    response = upload(client, meeting_title=meeting_title, existing_paper_id="999999")
+    assert response.status_code == 400
+    assert "999999" in response.json()["detail"]
+    # 整個 upload rollback：新 meeting 也不會留下
+    assert session.exec(select(LabMeeting).where(LabMeeting.meeting_title == meeting_title)).first() is None
+
+
+def test_missing_title_or_meeting_is_400(client, login):
+    login(client)
+    assert upload(client, report_title="").status_code == 400
+    assert upload(client, meeting_title="").status_code == 400
+
+
+def test_anonymous_upload_is_401(client, session):
+    meeting_title = unique("meeting")
+    assert upload(client, meeting_title=meeting_title).status_code == 401
+    assert session.exec(select(LabMeeting).where(LabMeeting.meeting_title == meeting_title)).first() is None
+
+
+def test_clean_names_and_resolve_names(session):
+    assert clean_names([" a ", "", "  ", None, "b"]) == ["a", "b"]
+    names = [unique("Author"), unique("Author")]
+    ids = resolve_names(session, Author, names + names[:1])
+    session.commit()
+    assert set(ids) == set(names)
+    assert resolve_names(session, Author, names) == ids
@@ -0,0 +1,105 @@
+import pytest
+from conftest import unique
+from sqlmodel import select
+
+from app import jobs
+from app.jobs import HANDLERS, claim_jobs, enqueue, job_runner, run_job, run_until_empty
+from app.models import Job
+
+
+@pytest.fixture
+def paused_runner(started):
+    """停掉背景 runner、先把已到期的 job 跑完，test 自己領取 / 執行"""
+    job_runner.stop()
+    run_until_empty()
+    yield
+    job_runner.start()
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    """註冊一個測試用的 job kind；fail 次數用完之前每次都丟例外"""
+    calls = []
+
+    def register(fail: int = 0) -> str:
+        kind = unique("test")
+
+        def fn(session, payload):
+            calls.append(payload)
+            if len(calls) <= fail:
+                raise RuntimeError(f"boom {len(calls)}")
+        monkeypatch.setitem(HANDLERS, kind, fn)
+        return kind
+    register.calls = calls
+    return register
+
+
+def add_job(session, kind: str, **kwargs) -> Job:
+    key = unique("job")
+    enqueue(session, kind, {"key": key}, dedup_key=key, **kwargs)
+    session.commit()
+    return job_row(session, key)
+
+
+def job_row(session, key: str) -> Job:
+    session.expire_all()
+    return session.exec(select(Job).where(Job.dedup_key == key)).one()
+
+
+def test_job_is_claimed_once(paused_runner, session, handler):
+    job = add_job(session, handler())
+    claimed = claim_jobs(session, "worker-a", 10)
+    assert [j["id"] for j in claimed] == [job.id]
+    assert claim_jobs(session, "worker-b", 10) == []
+
+    assert run_job(claimed[0])[0] == "done"
+    row = job_row(session, job.dedup_key)
+    assert (row.status, row.attempts, row.locked_by) == ("done", 1, None)
+    assert handler.calls == [{"key": job.dedup_key}]
+
+
+def test_queued_job_is_deduplicated(paused_runner, session, handler):
+    job = add_job(session, handler())
+    enqueue(session, job.kind, {}, dedup_key=job.dedup_key)
+    session.commit()
+    assert len(session.exec(select(Job).where(Job.dedup_key == job.dedup_key)).all()) == 1
+
+
+def test_failed_job_is_retried(paused_runner, session, handler, monkeypatch):
+    monkeypatch.setattr(jobs.settings, "JOB_RETRY_SECONDS", 0)
+    job = add_job(session, handler(fail=1), max_attempts=3)
+    [claimed] = claim_jobs(session, "worker-a", 10)
+    assert run_job(claimed)[0] == "retry"
+    row = job_row(session, job.dedup_key)
+    assert (row.status, row.attempts, row.last_error) == ("queued", 1, "RuntimeError: boom 1")
+
+    assert run_until_empty() == {"done": 1}
+    row = job_row(session, job.dedup_key)
+    assert (row.status, row.attempts, row.last_error) == ("done", 2, None)
+
+
+def test_job_fails_after_max_attempts(paused_runner, session, handler, monkeypatch):
+    monkeypatch.setattr(jobs.settings, "JOB_RETRY_SECONDS", 0)
+    job = add_job(session, handler(fail=5), max_attempts=2)
+    assert run_until_empty() == {"retry": 1, "failed": 1}
+    row = job_row(session, job.dedup_key)
+    assert (row.status, row.attempts, row.last_error) == ("failed", 2, "RuntimeError: boom 2")
+
+
+def test_stale_job_is_reclaimed_and_the_old_worker_cancelled(paused_runner, session, handler, monkeypatch):
+    job = add_job(session, handler())
+    [stale] = claim_jobs(session, "worker-a", 10)
+    monkeypatch.setattr(jobs.settings, "JOB_TIMEOUT_SECONDS", -1)
+    [again] = claim_jobs(session, "worker-b", 10)
+    assert (again["id"], again["attempts"]) == (job.id, 2)
+
+    # worker-a 不再持有這個 job：它跑完也不能把狀態寫回去
+    assert run_job(stale)[0] == "cancelled"
+    assert run_job(again)[0] == "done"
+    assert job_row(session, job.dedup_key).locked_by is None
+
+
+def test_job_stats(client, paused_runner):
+    stats = client.get("/api/jobs/stats").json()
+    assert set(stats) == {"depth", "runner"}
+    assert stats["runner"]["running"] is False
@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+
+from app import lookup
+from app.lookup import MAX_LOOKUP_LIMIT, LookupIndex, PrefixTrie, clamp_lookup_limit
+
+
+def topic() -> str:
+    return "zq" + uuid.uuid4().hex[:10]
+
+
+def labels(client, kind, q, **params):
+    response = client.get(f"/api/lookup/{kind}", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [x["label"] for x in response.json()["results"]]
+
+
+@pytest.fixture
+def trie(monkeypatch):
+    monkeypatch.setattr(lookup.settings, "LOOKUP_TRIE", True)
+    monkeypatch.setattr(lookup, "lookup_index", LookupIndex())
+
+
+def test_prefix_and_word_prefix_match(client, make_report):
+    w = topic()
+    name = f"{w.title()} Message Passing"
+    make_report(authors=[{"name": name, "affiliations": []}])
+    assert labels(client, "author", w) == [name]
+    assert labels(client, "author", f"mess {w[:-2]}") == [name]
+    assert labels(client, "author", f"{w} graph") == []
+
+
+def test_trie_lookup_and_fuzzy_fallback(client, make_report, trie):
+    w = topic()
+    tag = f"{w} transformers"
+    make_report(tags=[tag])
+    assert labels(client, "tag", f"{w[:8]} trans") == [tag]
+    assert labels(client, "tag", w[:-1] + "x") == [tag]  # 打錯一個字：trigram fuzzy
+    assert labels(client, "tag", "") == []
+
+
+def test_unknown_kind_is_404(client):
+    assert client.get("/api/lookup/planet", params={"q": "x"}).status_code == 404
+
+
+def test_trie_nodes_keep_the_shortest_names(monkeypatch):
+    monkeypatch.setattr(lookup, "TRIE_NODE_CAP", 2)
+    t = PrefixTrie()
+    for row_id, label in enumerate(["graph neural networks", "graph", "graphs", "graph nets"], 1):
+        t._insert(row_id, label, None)
+    assert sorted(t._candidates("gra")) == [2, 3]
+    assert [x["label"] for x in t.search("neu gra", 10)] == ["graph neural networks"]
+    assert clamp_lookup_limit(10 ** 6) == MAX_LOOKUP_LIMIT
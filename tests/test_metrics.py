@@ -0,0 +1,54 @@
+import logging
+
+from app import metrics
+from app.metrics import param_shape, sql_shape
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Prometheus text 裡某個 series 的值；沒有時回傳 0"""
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(f"{name}{{{want}}} ") or (not want and line.startswith(f"{name} ")):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_requests_are_counted_by_route(client, make_report):
+    r = make_report()
+    route = {"method": "GET", "route": "/reports/{report_id}"}
+    before = sample(client.get("/metrics").text, "http_requests_total", **route, status="200")
+    assert client.get(f"/reports/{r.id}").status_code == 200
+    assert client.get(f"/reports/{r.id}").status_code == 200
+
+    body = client.get("/metrics")
+    assert body.headers["content-type"].startswith("text/plain")
+    assert sample(body.text, "http_requests_total", **route, status="200") == before + 2
+    assert sample(body.text, "db_queries_per_request_count", **route) >= 2
+    assert "# TYPE http_request_duration_seconds histogram" in body.text
+
+
+def test_debug_header_counts_statements(client, monkeypatch):
+    monkeypatch.setattr(metrics.settings, "METRICS_DEBUG_HEADER", True)
+    response = client.get("/api/reports")
+    assert int(response.headers["x-sql-statements"]) >= 1
+    assert "db;dur=" in response.headers["server-timing"]
+
+
+def test_slow_queries_are_logged_without_values(client, monkeypatch, caplog):
+    monkeypatch.setattr(metrics.settings, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger=metrics.logger.name):
+        client.get("/api/reports", params={"limit": 1})
+    assert any("slow query" in m and "[/api/reports]" in m for m in caplog.messages)
+    assert sample(client.get("/metrics").text, "db_slow_queries_total", route="/api/reports") >= 1
+
+
+def test_metrics_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(metrics.settings, "METRICS_ENABLED", False)
+    assert client.get("/metrics").status_code == 404
+
+
+def test_sql_and_param_shapes():
+    assert sql_shape("SELECT *\n  FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (?, ...×3)"
+    assert sql_shape("x" * 600).endswith("…")
+    assert param_shape({"name": "secret", "ids": [1, 2]}) == "{name: str(6), ids: list[2]}"
+    assert param_shape([(1, "a"), (2, "b")], executemany=True) == "2 × (int, str(1))"
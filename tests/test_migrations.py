@@ -0,0 +1,38 @@
+import importlib
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import discover, status, upgrade
+
+indexes = importlib.import_module("app.migrations.0003_indexes")
+
+
+def test_upgrade_applies_each_migration_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/fresh.db")
+    versions = [m.VERSION for m in discover()]
+    assert versions == list(range(1, len(versions) + 1))
+
+    logged = []
+    assert upgrade(engine, log=logged.append) == len(versions)
+    assert len(logged) == len(versions)
+    assert upgrade(engine, log=logged.append) == 0
+    assert all(m["applied"] for m in status(engine))
+
+    tag_indexes = {ix["name"]: ix for ix in inspect(engine).get_indexes("tag")}
+    assert tag_indexes["ix_tag_name"]["unique"]
+    assert "ix_report_created_at_id" in {ix["name"] for ix in inspect(engine).get_indexes("report")}
+
+
+def test_duplicate_names_are_merged(tmp_path):
+    """create_all 時代的資料庫可能有重複名稱：合併到最小的 id，link 一起搬過去"""
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tag (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL)"))
+        conn.execute(text("CREATE TABLE papertag (paper_id INTEGER, tag_id INTEGER, PRIMARY KEY (paper_id, tag_id))"))
+        conn.execute(text("INSERT INTO tag VALUES (1, 'gnn'), (2, 'gnn'), (3, 'nlp')"))
+        conn.execute(text("INSERT INTO papertag VALUES (10, 1), (10, 2), (11, 2), (12, 3)"))
+        indexes.merge_duplicates(conn, *indexes.DEDUPE[0])
+        tags = conn.execute(text("SELECT id, name FROM tag ORDER BY id")).all()
+        links = conn.execute(text("SELECT paper_id, tag_id FROM papertag ORDER BY paper_id")).all()
+    assert tags == [(1, "gnn"), (3, "nlp")]
+    assert links == [(10, 1), (11, 1), (12, 3)]
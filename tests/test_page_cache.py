@@ -0,0 +1,77 @@
+from conftest import unique
+
+from app.cache import LRUCache
+from app.page_cache import bump_generation, report_version
+from app.recommend import refresh_related
+
+
+def test_report_page_conditional_get(client, session, make_report, related_index):
+    r = make_report()
+    refresh_related(session)  # report 進了 related index，頁面才有確定的 Last-Modified
+
+    first = client.get(f"/reports/{r.id}")
+    assert first.status_code == 200
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+    assert client.get(f"/reports/{r.id}").text == first.text
+
+    assert client.get(f"/reports/{r.id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/reports/{r.id}", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+    assert client.get(f"/reports/{r.id}", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/reports/{r.id}", headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get(f"/reports/{r.id}", headers={"If-Modified-Since": "not a date"}).status_code == 200
+
+
+def test_new_comment_changes_the_report_etag(client, make_report, login):
+    r = make_report()
+    etag = client.get(f"/reports/{r.id}").headers["etag"]
+    login(client)
+    content = unique("comment")
+    client.post("/comments", data={"report_id": r.id, "content": content}, follow_redirects=False)
+
+    after = client.get(f"/reports/{r.id}", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+    assert content in after.text
+
+
+def test_import_bumps_the_shared_generation(client, session, make_report, login):
+    r = make_report()
+    before = client.get(f"/reports/{r.id}").headers["etag"]
+    version, _ = report_version(session, r.id)
+    bump_generation(session)
+    session.commit()
+    new_version, last_modified = report_version(session, r.id)
+    assert new_version != version
+    assert last_modified >= r.created_at
+
+    login(client)
+    client.post("/import", files={"file": ("x.jsonl", b'{"title": "%s"}\n' % unique("paper").encode())})
+    assert client.get(f"/reports/{r.id}", headers={"If-None-Match": before}).status_code == 200
+
+
+def test_feed_conditional_get(client, make_report):
+    first = client.get("/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert "last-modified" in first.headers
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+    make_report()
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_missing_report_is_404(client):
+    assert client.get("/reports/999999").status_code == 404
+
+
+def test_page_cache_is_bounded_by_bytes():
+    c = LRUCache("pages", maxsize=10, ttl=60, weigher=len, maxweight=10)
+    c.set("a", "xxxx")
+    c.set("b", "yyyy")
+    c.set("c", "zzzz")
+    assert c.get("a") is None
+    assert c.weight == 8
+    c.set("huge", "x" * 11)  # 單筆超過上限不 cache
+    assert c.get("huge") is None
+    c.invalidate_where(lambda k: k in ("b", "c"))
+    assert (c.weight, c.stats()["size"]) == (0, 0)
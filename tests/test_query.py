@@ -0,0 +1,83 @@
+from conftest import unique
+
+from app.query import MAX_FILTER_DEPTH, MAX_FILTER_NODES
+
+
+def report_ids(response):
+    assert response.status_code == 200, response.text
+    return [item["r"]["id"] for item in response.json()["results"]]
+
+
+def test_many_to_many_match_returns_each_report_once(client, make_report):
+    name = unique("Ada")
+    r = make_report(
+        authors=[{"name": f"{name} One", "affiliations": []}, {"name": f"{name} Two", "affiliations": []}],
+        tags=[unique("tag"), unique("tag")],
+    )
+    got = report_ids(client.post("/query", json={"filters": [{"field": "author_name", "op": "contains", "value": name}]}))
+    assert got == [r.id]
+
+
+def test_or_group_and_tag_filter(client, make_report):
+    tag_a, tag_b = unique("tag"), unique("tag")
+    a = make_report(tags=[tag_a])
+    b = make_report(tags=[tag_b])
+    make_report(tags=[unique("tag")])
+    body = {"filters": {"or": [
+        {"field": "paper_tag", "op": "=", "value": tag_a},
+        {"field": "paper_tag", "op": "=", "value": tag_b},
+    ]}}
+    assert sorted(report_ids(client.post("/query", json=body))) == sorted([a.id, b.id])
+
+
+def test_contains_escapes_like_wildcards(client, make_report):
+    prefix = unique("pct")
+    hit = make_report(report_title=f"{prefix} 100% done")
+    make_report(report_title=f"{prefix} 100 done")
+    body = {"filters": [{"field": "report_title", "op": "contains", "value": f"{prefix} 100%"}]}
+    assert report_ids(client.post("/query", json=body)) == [hit.id]
+
+
+def test_cursor_pagination_walks_every_match_once(client, make_report):
+    prefix = unique("page")
+    made = [make_report(report_title=f"{prefix} {i}").id for i in range(5)]
+    filters = [{"field": "report_title", "op": "contains", "value": prefix}]
+
+    seen, cursor = [], None
+    while True:
+        page = client.post("/query", json={"filters": filters, "limit": 2, "cursor": cursor}).json()
+        seen += [item["r"]["id"] for item in page["results"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == sorted(made, reverse=True)
+
+
+def test_invalid_filters_are_400(client):
+    bad = [
+        {"filters": [{"field": "nope", "op": "=", "value": "x"}]},
+        {"filters": [{"field": "report_title", "op": "like", "value": "x"}]},
+        {"filters": [{"field": ["x"], "op": "=", "value": "x"}]},
+        {"filters": [{"field": "report_title", "op": {"eq": 1}, "value": "x"}]},
+        {"filters": [{"field": "paper_year", "op": "contains", "value": "2020"}]},
+        {"filters": [{"field": "paper_year", "op": "=", "value": "soon"}]},
+        {"filters": [{"field": "report_title", "op": "contains", "value": None}]},
+        {"filters": [{"field": "report_title", "op": "=", "value": {"a": 1}}]},
+        {"filters": {"or": "x"}},
+        {"sort": "random"},
+        {"sort": "report_title", "cursor": "abc"},
+        {"cursor": 5},
+        {"cursor": ["abc"]},
+    ]
+    for body in bad:
+        assert client.post("/query", json=body).status_code == 400, body
+
+
+def test_filter_depth_and_size_are_bounded(client):
+    leaf = {"field": "report_title", "op": "contains", "value": "x"}
+    nested = leaf
+    for _ in range(MAX_FILTER_DEPTH + 1):
+        nested = {"and": [nested]}
+    assert client.post("/query", json={"filters": nested}).status_code == 400
+    assert client.post("/query", json={"filters": [leaf] * (MAX_FILTER_NODES + 1)}).status_code == 400
+    assert client.post("/query", json={"filters": [leaf] * 10}).status_code == 200
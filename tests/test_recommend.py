@@ -0,0 +1,76 @@
+import time
+import uuid
+
+from sqlmodel import select
+
+from app import recommend
+from app.models import Job
+from app.recommend import RelatedIndex, current_snapshot, refresh_related, snapshot_time
+
+
+def topic() -> str:
+    """只出現在這個 test 的字，其他 test 的 report 不會被算成相似"""
+    return "zq" + uuid.uuid4().hex[:10]
+
+
+def paper(title: str) -> dict:
+    return {"paper_title": title, "published_year": 2024, "published_month": 1, "journal_or_conference": ""}
+
+
+def related_ids(client, report_id, **params):
+    response = client.get(f"/api/reports/{report_id}/related", params=params)
+    assert response.status_code == 200
+    return [item["r"]["id"] for item in response.json()["results"]]
+
+
+def test_related_api_ranks_similar_reports(client, session, make_report, related_index):
+    word, tag = topic(), topic()
+    a = make_report(report_title=f"{word} sparse attention", paper=paper(topic()), tags=[tag])
+    other = make_report(report_title=f"{topic()} protein folding", paper=paper(topic()))
+    b = make_report(report_title=f"{word} attention heads", paper=paper(topic()), tags=[tag])
+    refresh_related(session)
+
+    assert related_ids(client, b.id)[0] == a.id
+    assert other.id not in related_ids(client, b.id)
+    assert related_ids(client, b.id, earlier="true")[0] == a.id
+    assert b.id in related_ids(client, a.id)
+    assert b.id not in related_ids(client, a.id, earlier="true")
+    assert client.get("/api/reports/999999/related").status_code == 404
+
+
+def test_snapshot_round_trip_and_tail(tmp_path, session, make_report):
+    word = topic()
+    a = make_report(report_title=f"{word} graph networks")
+    index = RelatedIndex()
+    index.build(session)
+    index.save(str(tmp_path))
+
+    name = current_snapshot(str(tmp_path))
+    assert name and snapshot_time(name) is not None
+    loaded = RelatedIndex()
+    assert loaded.load(str(tmp_path))
+    assert loaded.snapshot == name and loaded.max_report_id == index.max_report_id
+
+    # 新的 report 接到 tail，不用重算整個 matrix
+    b = make_report(report_title=f"{word} graph transformers")
+    assert loaded.catch_up(session) >= 1
+    assert b.id in loaded.tail_ids
+    assert [rid for rid, _ in loaded.related([b.id], 3)[b.id]][0] == a.id
+    assert loaded.related([10 ** 9], 3) == {10 ** 9: []}
+
+
+def test_missing_snapshot_is_built_by_a_job(monkeypatch, tmp_path, session):
+    monkeypatch.setattr(recommend.settings, "RELATED_DIR", str(tmp_path))
+    monkeypatch.setattr(recommend, "_related_index", None)
+    monkeypatch.setattr(recommend, "_build_requested_at", None)
+
+    # request 裡不 build：index 先是空的，build 排進 job queue
+    index = recommend.ensure_related_index(session)
+    assert not index.loaded
+    assert session.exec(select(Job).where(Job.kind == "related_snapshot")).first() is not None
+
+    deadline = time.monotonic() + 30
+    while not index.loaded:
+        assert time.monotonic() < deadline, "related_snapshot job did not run"
+        time.sleep(0.1)
+    assert current_snapshot(str(tmp_path)) == index.snapshot
@@ -0,0 +1,57 @@
+import uuid
+
+from app.search import highlight, tokenize
+
+
+def topic() -> str:
+    """只出現在這個 test 的字"""
+    return "zq" + uuid.uuid4().hex[:10]
+
+
+def upload(client, **fields):
+    data = {
+        "report_title": "report",
+        "meeting_title": "meeting",
+        "meeting_date": "2024-05-01",
+        "meeting_location": "Room 1",
+        "paper_title": "paper",
+        "published_year": "2024",
+        **fields,
+    }
+    response = client.post("/upload", data=data, follow_redirects=False)
+    assert response.status_code == 303, response.text
+    return int(response.headers["location"].rsplit("/", 1)[1])
+
+
+def search(client, q):
+    response = client.get("/search", params={"q": q})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_fallback_search_finds_an_uploaded_report(client, login):
+    login(client)
+    search(client, "warm up")  # index 先建好，之後的 upload 走增量更新
+    word = topic()
+    report_id = upload(client, report_title=f"{word} <b>attention</b>", paper_title=f"{topic()} heads")
+
+    data = search(client, word)
+    assert [x["r"]["id"] for x in data["results"]] == [report_id]
+    snippet = data["results"][0]["snippet"]
+    assert f"<mark>{word}</mark>" in snippet
+    assert "&lt;b&gt;attention&lt;/b&gt;" in snippet
+    assert search(client, f"{word} missing")["results"] == []
+
+
+def test_fuzzy_author_match(client, login):
+    login(client)
+    name = topic()
+    report_id = upload(client, author_name_0=f"Grace {name}")
+    data = search(client, name[:-1])
+    assert report_id in [x["r"]["id"] for x in data["results"]]
+    assert any(e["kind"] == "author" and e["name"] == f"Grace {name}" for e in data["entities"])
+
+
+def test_tokenize_and_highlight():
+    assert tokenize("Graph-Nets 與 圖") == ["graph", "nets", "與", "圖"]
+    assert highlight("a \x02<b>\x03 c") == "a <mark>&lt;b&gt;</mark> c"
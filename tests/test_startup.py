@@ -0,0 +1,53 @@
+import sys
+
+from fastapi.testclient import TestClient
+from jinja2 import Environment, FileSystemLoader
+
+from app.startup import LazyModule, ReadinessMiddleware, load_all_templates, startup, template_bytecode_cache
+
+
+def test_probes_when_ready(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    ready = client.get("/readyz")
+    assert ready.status_code == 200
+    body = ready.json()
+    assert (body["ready"], body["error"]) == (True, None)
+    assert body["phases"]
+
+
+def test_requests_wait_for_readiness(started, monkeypatch):
+    # FAST_STARTUP=true 時 main.py 才加上這個 middleware
+    client = TestClient(ReadinessMiddleware(started))
+    monkeypatch.setattr(startup, "ready_at", None)
+    blocked = client.get("/api/reports")
+    assert (blocked.status_code, blocked.headers["retry-after"]) == (503, "1")
+    assert client.get("/readyz").status_code == 503
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/metrics").status_code == 200
+
+    monkeypatch.setattr(startup, "error", "OperationalError: bad password")
+    assert client.get("/healthz").status_code == 503
+
+
+def test_lazy_module_imports_on_first_use(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    monkeypatch.setattr(startup, "deferred", {})
+    m = LazyModule("colorsys")
+    assert "colorsys" not in sys.modules
+    assert m.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1)
+    assert "colorsys" in startup.deferred
+    assert "rgb_to_hsv" in vars(m)  # 之後直接從 instance dict 拿
+
+
+def test_template_bytecode_cache(tmp_path):
+    cache_dir = tmp_path / "bytecode"
+    env = Environment(loader=FileSystemLoader("templates"), bytecode_cache=template_bytecode_cache(str(cache_dir)))
+    n = load_all_templates(env)
+    assert n > 0
+    assert len(list(cache_dir.iterdir())) == n
+
+    # 第二個 process：從 cache 讀，不再寫
+    before = {f.name: f.stat().st_mtime_ns for f in cache_dir.iterdir()}
+    again = Environment(loader=FileSystemLoader("templates"), bytecode_cache=template_bytecode_cache(str(cache_dir)))
+    assert load_all_templates(again) == n
+    assert {f.name: f.stat().st_mtime_ns for f in cache_dir.iterdir()} == before
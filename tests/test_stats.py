@@ -0,0 +1,43 @@
+from conftest import eventually
+from sqlmodel import Session, select
+
+from app import db
+from app.models import ActivityCounter
+from app.stats import rebuild_stats
+
+
+def counters(keys) -> dict:
+    """{(dimension, key, metric): value}，只看這個 test 自己的 presenter / meeting / paper"""
+    with Session(db.engine) as s:
+        rows = s.exec(select(ActivityCounter).where(ActivityCounter.value != 0)).all()
+    return {(c.dimension, c.key, c.metric): c.value for c in rows if (c.dimension, c.key) in keys}
+
+
+def test_counters_follow_uploads_and_match_a_rebuild(client, session, make_report, login):
+    user = login(client)
+    first = make_report(user=user)
+    second = make_report(user=user, meeting_id=first.meeting_id)
+    response = client.post("/comments", data={"report_id": first.id, "content": "nice"}, headers={"Accept": "application/json"})
+    assert response.status_code == 201
+
+    uid, mid = str(user.id), str(first.meeting_id)
+    pa, pb = str(first.paper_id), str(second.paper_id)
+    keys = {("presenter", uid), ("meeting", mid), ("paper", pa), ("paper", pb)}
+    expected = {
+        ("presenter", uid, "reports"): 2,
+        ("presenter", uid, "comments"): 1,
+        ("meeting", mid, "reports"): 2,
+        ("meeting", mid, "comments"): 1,
+        ("paper", pa, "reports"): 1,
+        ("paper", pa, "comments"): 1,
+        ("paper", pb, "reports"): 1,
+    }
+    assert eventually(lambda: counters(keys) == expected)
+
+    rebuilt = rebuild_stats(session)
+    assert rebuilt["activity_rows"] > 0
+    assert counters(keys) == expected
+
+    stats = client.get("/api/stats").json()
+    assert set(stats) >= {"months", "presenters", "most_discussed_papers", "busiest_meetings", "tags"}
+    assert client.get("/stats").status_code == 200
@@ -0,0 +1,56 @@
+import io
+import json
+
+from conftest import eventually, unique
+from sqlmodel import Session, select
+
+from app import db
+from app.bulk_import import import_stream
+from app.models import Tag, TagStats
+
+
+def tag_counts(name: str):
+    """(paper_count, report_count)；另開 session，每次都讀到最新的值"""
+    with Session(db.engine) as s:
+        return s.exec(
+            select(TagStats.paper_count, TagStats.report_count)
+            .join(Tag, Tag.id == TagStats.tag_id)
+            .where(Tag.name == name)
+        ).first()
+
+
+def test_tag_page_pages_by_cursor(client, make_report):
+    tag = unique("tag")
+    titles = [make_report(tags=[tag]).report_title for _ in range(3)]
+    make_report(tags=[unique("other")])
+
+    first = client.get(f"/tags/{tag}", params={"limit": 2})
+    assert first.status_code == 200
+    assert [t in first.text for t in titles] == [False, True, True]
+    assert "Older reports" in first.text
+    cursor = first.text.split("?cursor=", 1)[1].split('"', 1)[0]
+    second = client.get(f"/tags/{tag}", params={"limit": 2, "cursor": cursor})
+    assert titles[0] in second.text
+    assert "Older reports" not in second.text
+
+    assert client.get(f"/tags/{unique('missing')}").status_code == 404
+    assert client.get(f"/tags/{tag}", params={"cursor": "bogus"}).status_code == 400
+
+
+def test_tag_stats_follow_uploads_and_imports(client, session, make_report):
+    tag = unique("tag")
+    r = make_report(tags=[tag])
+    assert eventually(lambda: tag_counts(tag) == (1, 1))
+    make_report(paper_id=r.paper_id)
+    assert eventually(lambda: tag_counts(tag) == (1, 2))
+
+    row = {"title": unique("paper"), "year": 2024, "tags": [tag], "report_title": unique("report"),
+           "presenter": unique("presenter"), "meeting_title": unique("meeting"), "meeting_date": "2024-05-01"}
+    stats = import_stream(session, io.BytesIO(json.dumps(row).encode() + b"\n"), "jsonl")
+    assert (stats["papers"], stats["reports"]) == (1, 1)
+    assert eventually(lambda: tag_counts(tag) == (2, 3))
+
+    page = client.get("/tags", params={"sort": "name"})
+    assert page.status_code == 200
+    assert f"/tags/{tag}" in page.text
+    assert client.get("/tags", params={"sort": "bogus"}).status_code == 400